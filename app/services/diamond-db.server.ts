@@ -7,6 +7,15 @@ import {
   ImportStatus
 } from '@prisma/client';
 import type { Diamond } from '../models/diamond.server';
+import {
+  CLARITY_LABELS,
+  COLOUR_LABELS,
+  FLUORESCENCE_LABELS,
+  GRADE_LABELS,
+  INTENSITY_LABELS,
+  deriveDiamondAttributes,
+  shapeCode,
+} from './diamond-derived.server';
 
 const prisma = new PrismaClient();
 
@@ -45,6 +54,38 @@ interface DiamondFilters {
 
 const BATCH_SIZE = 800; // Optimized for 1GB App / 2GB PostgreSQL instance
 
+/**
+ * Ordinal range for a min/max label filter ('VS2', 'D_MAX', ...), matched case-insensitively
+ * @param labels The label order the ordinal column was derived with
+ * @param min The lowest label to include, if any
+ * @param max The highest label to include, if any
+ * @returns The range on the ordinal column, or null without a filter or when a given label isn't on the scale
+ */
+function ordinalRange(
+  labels: string[],
+  min?: string,
+  max?: string
+): Prisma.IntNullableFilter | null {
+  const indexOf = (value: string) => {
+    const clean = value.replace(/_MAX$/i, '').toLowerCase();
+    return labels.findIndex((label) => label.toLowerCase() === clean);
+  };
+  if (!min && !max) {
+    return null;
+  }
+  const range: Prisma.IntNullableFilter = {};
+  if (min) {
+    range.gte = indexOf(min);
+  }
+  if (max) {
+    range.lte = indexOf(max);
+  }
+  if (range.gte === -1 || range.lte === -1) {
+    return null;
+  }
+  return range;
+}
+
 export async function getDiamondsByType(
   type: DiamondType,
   offset = 0,
@@ -73,9 +114,15 @@ export async function getFilteredDiamonds(
     where.type = filters.type as DiamondType;
   }
 
-  // Shape filter (using 'cut' field)
+  // Shape filter: normalised shape code ('Round', 'ROUND', 'Round Brilliant' are one shape)
   if (filters.shape) {
-    where.cut = { equals: filters.shape, mode: 'insensitive' };
+    const code = shapeCode(filters.shape);
+    if (code > 0) {
+      where.shapeCode = code;
+    } else {
+      // Shapes without a code of their own all share 0, so match those by name
+      where.cut = { equals: filters.shape, mode: 'insensitive' };
+    }
   }
 
   // Price filters (prioritize SEK over USD) - always exclude diamonds with null prices
@@ -124,103 +171,10 @@ export async function getFilteredDiamonds(
     }
   }
 
-  // Colour filters
-  if (filters.minColour || filters.maxColour) {
-    // These are the actual colour values that exist in the database
-    const actualColourLabels = ['K', 'J', 'I', 'H', 'G', 'F', 'E', 'D'];
-
-    // Map filter values to actual database values
-    const getActualColour = (value: string) => {
-      const cleanValue = value.toUpperCase().replace(/_MAX$/i, '');
-      // Handle D_MAX as D
-      return cleanValue === 'D_MAX' ? 'D' : cleanValue;
-    };
-
-    if (filters.minColour && filters.maxColour) {
-      const minColour = getActualColour(filters.minColour);
-      const maxColour = getActualColour(filters.maxColour);
-
-      const minIdx = actualColourLabels.indexOf(minColour);
-      const maxIdx = actualColourLabels.indexOf(maxColour);
-
-      if (minIdx !== -1 && maxIdx !== -1) {
-        // Get the range of colour values to include
-        const colourValuesToInclude = actualColourLabels.slice(
-          minIdx,
-          maxIdx + 1
-        );
-
-        if (!where.AND) {
-          where.AND = [];
-        } else if (!Array.isArray(where.AND)) {
-          where.AND = [where.AND];
-        }
-
-        // Apply white color filters AND exclude fancy colored diamonds
-        (where.AND as Prisma.DiamondWhereInput[]).push({
-          AND: [
-            { color: { in: colourValuesToInclude } },
-            {
-              OR: [
-                { naturalFancyColor: null },
-                { naturalFancyColor: '' },
-                { naturalFancyColor: { in: ['', ' ', '  '] } },
-              ],
-            },
-          ],
-        });
-      }
-    } else if (filters.minColour) {
-      const minColour = getActualColour(filters.minColour);
-      const minIdx = actualColourLabels.indexOf(minColour);
-      if (minIdx !== -1) {
-        const colourValuesToInclude = actualColourLabels.slice(minIdx);
-
-        if (!where.AND) {
-          where.AND = [];
-        } else if (!Array.isArray(where.AND)) {
-          where.AND = [where.AND];
-        }
-
-        (where.AND as Prisma.DiamondWhereInput[]).push({
-          AND: [
-            { color: { in: colourValuesToInclude } },
-            {
-              OR: [
-                { naturalFancyColor: null },
-                { naturalFancyColor: '' },
-                { naturalFancyColor: { in: ['', ' ', '  '] } },
-              ],
-            },
-          ],
-        });
-      }
-    } else if (filters.maxColour) {
-      const maxColour = getActualColour(filters.maxColour);
-      const maxIdx = actualColourLabels.indexOf(maxColour);
-      if (maxIdx !== -1) {
-        const colourValuesToInclude = actualColourLabels.slice(0, maxIdx + 1);
-
-        if (!where.AND) {
-          where.AND = [];
-        } else if (!Array.isArray(where.AND)) {
-          where.AND = [where.AND];
-        }
-
-        (where.AND as Prisma.DiamondWhereInput[]).push({
-          AND: [
-            { color: { in: colourValuesToInclude } },
-            {
-              OR: [
-                { naturalFancyColor: null },
-                { naturalFancyColor: '' },
-                { naturalFancyColor: { in: ['', ' ', '  '] } },
-              ],
-            },
-          ],
-        });
-      }
-    }
+  // Colour filters: colourOrdinal is null for fancy coloured stones, so they are excluded
+  const colour = ordinalRange(COLOUR_LABELS, filters.minColour, filters.maxColour);
+  if (colour) {
+    where.colourOrdinal = colour;
   }
 
   // Fancy colour filters
@@ -234,18 +188,7 @@ export async function getFilteredDiamonds(
     if (filters.fancyColours) {
       // Special case: if fancyColours is "ALL_FANCY", show all fancy colored diamonds
       if (filters.fancyColours === 'ALL_FANCY') {
-        if (!where.AND) {
-          where.AND = [];
-        } else if (!Array.isArray(where.AND)) {
-          where.AND = [where.AND];
-        }
-        (where.AND as Prisma.DiamondWhereInput[]).push({
-          AND: [
-            { naturalFancyColor: { not: null } },
-            { naturalFancyColor: { not: '' } },
-            { naturalFancyColor: { not: { in: ['', ' ', '  '] } } },
-          ],
-        });
+        where.isFancy = true;
       } else {
         // Handle specific fancy colors
         const fancyColourList = filters.fancyColours
@@ -396,330 +339,39 @@ export async function getFilteredDiamonds(
       });
     }
 
-    // Intensity filters with updated logic
-    if (filters.minFancyIntensity || filters.maxFancyIntensity) {
-      // Map filter values to actual database values
-      const getActualIntensity = (value: string) => {
-        const cleanValue = value.replace(/_MAX$/i, '');
-        // Handle Dark_MAX as Dark
-        if (cleanValue === 'Dark_MAX') return 'Dark';
-
-        // Map our simplified labels to actual database values
-        switch (cleanValue) {
-          case 'Light':
-            return ['Light', 'Very Light', 'Faint', 'Fancy Light'];
-          case 'Fancy':
-            return ['Fancy'];
-          case 'Intense':
-            return ['Intense'];
-          case 'Vivid':
-            return ['Vivid'];
-          case 'Deep':
-            return ['Fancy Deep'];
-          case 'Dark':
-            return ['Fancy Dark'];
-          default:
-            return cleanValue;
-        }
-      };
-
-      // Get the full range of intensities based on min and max
-      const simplifiedLabels = [
-        'Light',
-        'Fancy',
-        'Intense',
-        'Vivid',
-        'Deep',
-        'Dark',
-      ];
-
-      if (filters.minFancyIntensity && filters.maxFancyIntensity) {
-        const minIntensity = filters.minFancyIntensity.replace(/_MAX$/i, '');
-        const maxIntensity = filters.maxFancyIntensity.replace(/_MAX$/i, '');
-
-        const minIdx = simplifiedLabels.findIndex(
-          (intensity) => intensity.toLowerCase() === minIntensity.toLowerCase()
-        );
-        const maxIdx = simplifiedLabels.findIndex(
-          (intensity) => intensity.toLowerCase() === maxIntensity.toLowerCase()
-        );
-
-        if (minIdx !== -1 && maxIdx !== -1) {
-          // Get all intensities in the range
-          let validIntensities: string[] = [];
-          for (let i = minIdx; i <= maxIdx; i++) {
-            const mapped = getActualIntensity(simplifiedLabels[i]);
-            if (Array.isArray(mapped)) {
-              validIntensities = validIntensities.concat(mapped);
-            } else {
-              validIntensities.push(mapped);
-            }
-          }
-
-          if (!where.AND) {
-            where.AND = [];
-          } else if (!Array.isArray(where.AND)) {
-            where.AND = [where.AND];
-          }
-          (where.AND as Prisma.DiamondWhereInput[]).push({
-            naturalFancyColorIntensity: { in: validIntensities },
-          });
-        }
-      } else if (filters.minFancyIntensity) {
-        const minIntensity = filters.minFancyIntensity.replace(/_MAX$/i, '');
-        const minIdx = simplifiedLabels.findIndex(
-          (intensity) => intensity.toLowerCase() === minIntensity.toLowerCase()
-        );
-
-        if (minIdx !== -1) {
-          let validIntensities: string[] = [];
-          for (let i = minIdx; i < simplifiedLabels.length; i++) {
-            const mapped = getActualIntensity(simplifiedLabels[i]);
-            if (Array.isArray(mapped)) {
-              validIntensities = validIntensities.concat(mapped);
-            } else {
-              validIntensities.push(mapped);
-            }
-          }
-
-          if (!where.AND) {
-            where.AND = [];
-          } else if (!Array.isArray(where.AND)) {
-            where.AND = [where.AND];
-          }
-          (where.AND as Prisma.DiamondWhereInput[]).push({
-            naturalFancyColorIntensity: { in: validIntensities },
-          });
-        }
-      } else if (filters.maxFancyIntensity) {
-        const maxIntensity = filters.maxFancyIntensity.replace(/_MAX$/i, '');
-        const maxIdx = simplifiedLabels.findIndex(
-          (intensity) => intensity.toLowerCase() === maxIntensity.toLowerCase()
-        );
-
-        if (maxIdx !== -1) {
-          let validIntensities: string[] = [];
-          for (let i = 0; i <= maxIdx; i++) {
-            const mapped = getActualIntensity(simplifiedLabels[i]);
-            if (Array.isArray(mapped)) {
-              validIntensities = validIntensities.concat(mapped);
-            } else {
-              validIntensities.push(mapped);
-            }
-          }
-
-          if (!where.AND) {
-            where.AND = [];
-          } else if (!Array.isArray(where.AND)) {
-            where.AND = [where.AND];
-          }
-          (where.AND as Prisma.DiamondWhereInput[]).push({
-            naturalFancyColorIntensity: { in: validIntensities },
-          });
-        }
-      }
+    // Intensity filters
+    const intensity = ordinalRange(
+      INTENSITY_LABELS,
+      filters.minFancyIntensity,
+      filters.maxFancyIntensity
+    );
+    if (intensity) {
+      where.fancyIntensityOrdinal = intensity;
     }
   }
 
   // Clarity filters
-  if (filters.minClarity || filters.maxClarity) {
-    // These are the actual clarity values that exist in the database
-    const actualClarityLabels = [
-      'SI2',
-      'SI1',
-      'VS2',
-      'VS1',
-      'VVS2',
-      'VVS1',
-      'IF',
-      'FL',
-    ];
-
-    // Map filter values to actual database values
-    const getActualClarity = (value: string) => {
-      const cleanValue = value.toUpperCase().replace(/_MAX$/i, '');
-      // Handle FL_MAX as FL
-      return cleanValue === 'FL_MAX' ? 'FL' : cleanValue;
-    };
-
-    if (filters.minClarity && filters.maxClarity) {
-      const minClarity = getActualClarity(filters.minClarity);
-      const maxClarity = getActualClarity(filters.maxClarity);
-
-      const minIdx = actualClarityLabels.indexOf(minClarity);
-      const maxIdx = actualClarityLabels.indexOf(maxClarity);
-
-      if (minIdx !== -1 && maxIdx !== -1) {
-        // Get the range of clarity values to include
-        const clarityValuesToInclude = actualClarityLabels.slice(
-          minIdx,
-          maxIdx + 1
-        );
-        where.clarity = { in: clarityValuesToInclude };
-      }
-    } else if (filters.minClarity) {
-      const minClarity = getActualClarity(filters.minClarity);
-      const minIdx = actualClarityLabels.indexOf(minClarity);
-      if (minIdx !== -1) {
-        where.clarity = { in: actualClarityLabels.slice(minIdx) };
-      }
-    } else if (filters.maxClarity) {
-      const maxClarity = getActualClarity(filters.maxClarity);
-      const maxIdx = actualClarityLabels.indexOf(maxClarity);
-      if (maxIdx !== -1) {
-        where.clarity = { in: actualClarityLabels.slice(0, maxIdx + 1) };
-      }
-    }
+  const clarity = ordinalRange(CLARITY_LABELS, filters.minClarity, filters.maxClarity);
+  if (clarity) {
+    where.clarityOrdinal = clarity;
   }
 
   // Cut Grade filters
-  if (filters.minCutGrade || filters.maxCutGrade) {
-    // These are the actual cut grade values that exist in the database
-    const actualCutGradeLabels = ['Good', 'Very Good', 'Excellent'];
-
-    // Map filter values to actual database values
-    const getActualCutGrade = (value: string) => {
-      const cleanValue = value.replace(/_MAX$/i, '');
-      // Handle Excellent_MAX as Excellent
-      return cleanValue === 'Excellent_MAX' ? 'Excellent' : cleanValue;
-    };
-
-    if (filters.minCutGrade && filters.maxCutGrade) {
-      const minCutGrade = getActualCutGrade(filters.minCutGrade);
-      const maxCutGrade = getActualCutGrade(filters.maxCutGrade);
-
-      const minIdx = actualCutGradeLabels.findIndex(
-        (g) => g.toLowerCase() === minCutGrade.toLowerCase()
-      );
-      const maxIdx = actualCutGradeLabels.findIndex(
-        (g) => g.toLowerCase() === maxCutGrade.toLowerCase()
-      );
-
-      if (minIdx !== -1 && maxIdx !== -1) {
-        // Get the range of cut grades to include
-        const cutGradesToInclude = actualCutGradeLabels.slice(
-          minIdx,
-          maxIdx + 1
-        );
-        where.cutGrade = { in: cutGradesToInclude };
-      }
-    } else if (filters.minCutGrade) {
-      const minCutGrade = getActualCutGrade(filters.minCutGrade);
-      const minIdx = actualCutGradeLabels.findIndex(
-        (g) => g.toLowerCase() === minCutGrade.toLowerCase()
-      );
-      if (minIdx !== -1) {
-        where.cutGrade = { in: actualCutGradeLabels.slice(minIdx) };
-      }
-    } else if (filters.maxCutGrade) {
-      const maxCutGrade = getActualCutGrade(filters.maxCutGrade);
-      const maxIdx = actualCutGradeLabels.findIndex(
-        (g) => g.toLowerCase() === maxCutGrade.toLowerCase()
-      );
-      if (maxIdx !== -1) {
-        where.cutGrade = { in: actualCutGradeLabels.slice(0, maxIdx + 1) };
-      }
-    }
+  const cutGrade = ordinalRange(GRADE_LABELS, filters.minCutGrade, filters.maxCutGrade);
+  if (cutGrade) {
+    where.cutGradeOrdinal = cutGrade;
   }
 
   // Polish filters
-  if (filters.minPolish || filters.maxPolish) {
-    // These are the actual polish values that exist in the database
-    const actualPolishLabels = ['Good', 'Very Good', 'Excellent'];
-
-    // Map filter values to actual database values
-    const getActualPolish = (value: string) => {
-      const cleanValue = value.replace(/_MAX$/i, '');
-      // Handle Excellent_MAX as Excellent
-      return cleanValue === 'Excellent_MAX' ? 'Excellent' : cleanValue;
-    };
-
-    if (filters.minPolish && filters.maxPolish) {
-      const minPolish = getActualPolish(filters.minPolish);
-      const maxPolish = getActualPolish(filters.maxPolish);
-
-      const minIdx = actualPolishLabels.findIndex(
-        (g) => g.toLowerCase() === minPolish.toLowerCase()
-      );
-      const maxIdx = actualPolishLabels.findIndex(
-        (g) => g.toLowerCase() === maxPolish.toLowerCase()
-      );
-
-      if (minIdx !== -1 && maxIdx !== -1) {
-        // Get the range of polish values to include
-        const polishValuesToInclude = actualPolishLabels.slice(
-          minIdx,
-          maxIdx + 1
-        );
-        where.polish = { in: polishValuesToInclude };
-      }
-    } else if (filters.minPolish) {
-      const minPolish = getActualPolish(filters.minPolish);
-      const minIdx = actualPolishLabels.findIndex(
-        (g) => g.toLowerCase() === minPolish.toLowerCase()
-      );
-      if (minIdx !== -1) {
-        where.polish = { in: actualPolishLabels.slice(minIdx) };
-      }
-    } else if (filters.maxPolish) {
-      const maxPolish = getActualPolish(filters.maxPolish);
-      const maxIdx = actualPolishLabels.findIndex(
-        (g) => g.toLowerCase() === maxPolish.toLowerCase()
-      );
-      if (maxIdx !== -1) {
-        where.polish = { in: actualPolishLabels.slice(0, maxIdx + 1) };
-      }
-    }
+  const polish = ordinalRange(GRADE_LABELS, filters.minPolish, filters.maxPolish);
+  if (polish) {
+    where.polishOrdinal = polish;
   }
 
   // Symmetry filters
-  if (filters.minSymmetry || filters.maxSymmetry) {
-    // These are the actual symmetry values that exist in the database
-    const actualSymmetryLabels = ['Good', 'Very Good', 'Excellent'];
-
-    // Map filter values to actual database values
-    const getActualSymmetry = (value: string) => {
-      const cleanValue = value.replace(/_MAX$/i, '');
-      // Handle Excellent_MAX as Excellent
-      return cleanValue === 'Excellent_MAX' ? 'Excellent' : cleanValue;
-    };
-
-    if (filters.minSymmetry && filters.maxSymmetry) {
-      const minSymmetry = getActualSymmetry(filters.minSymmetry);
-      const maxSymmetry = getActualSymmetry(filters.maxSymmetry);
-
-      const minIdx = actualSymmetryLabels.findIndex(
-        (g) => g.toLowerCase() === minSymmetry.toLowerCase()
-      );
-      const maxIdx = actualSymmetryLabels.findIndex(
-        (g) => g.toLowerCase() === maxSymmetry.toLowerCase()
-      );
-
-      if (minIdx !== -1 && maxIdx !== -1) {
-        // Get the range of symmetry values to include
-        const symmetryValuesToInclude = actualSymmetryLabels.slice(
-          minIdx,
-          maxIdx + 1
-        );
-        where.symmetry = { in: symmetryValuesToInclude };
-      }
-    } else if (filters.minSymmetry) {
-      const minSymmetry = getActualSymmetry(filters.minSymmetry);
-      const minIdx = actualSymmetryLabels.findIndex(
-        (g) => g.toLowerCase() === minSymmetry.toLowerCase()
-      );
-      if (minIdx !== -1) {
-        where.symmetry = { in: actualSymmetryLabels.slice(minIdx) };
-      }
-    } else if (filters.maxSymmetry) {
-      const maxSymmetry = getActualSymmetry(filters.maxSymmetry);
-      const maxIdx = actualSymmetryLabels.findIndex(
-        (g) => g.toLowerCase() === maxSymmetry.toLowerCase()
-      );
-      if (maxIdx !== -1) {
-        where.symmetry = { in: actualSymmetryLabels.slice(0, maxIdx + 1) };
-      }
-    }
+  const symmetry = ordinalRange(GRADE_LABELS, filters.minSymmetry, filters.maxSymmetry);
+  if (symmetry) {
+    where.symmetryOrdinal = symmetry;
   }
 
   // Table percentage filters
@@ -733,72 +385,27 @@ export async function getFilteredDiamonds(
     }
   }
 
-  // Ratio filters (length/width)
-  // This requires a calculated field or raw query
-  // For now, we'll skip this complex filter
-
-  // Fluorescence filters (ordered from best to worst for UI display)
-  if (filters.minFluorescence || filters.maxFluorescence) {
-    // These are the actual fluorescence values that exist in the database
-    // Note: UI displays from None (best) to Very Strong (worst)
-    // But in the database, we need to handle the actual values
-    const actualFluorescenceLabels = [
-      'None',
-      'Faint',
-      'Medium',
-      'Strong',
-      'Very Strong',
-    ];
-
-    // Map filter values to actual database values
-    const getActualFluorescence = (value: string) => {
-      const cleanValue = value.replace(/_MAX$/i, '');
-      // Handle Very Strong_MAX as Very Strong
-      return cleanValue;
-    };
-
-    if (filters.minFluorescence && filters.maxFluorescence) {
-      const minFluorescence = getActualFluorescence(filters.minFluorescence);
-      const maxFluorescence = getActualFluorescence(filters.maxFluorescence);
-
-      const minIdx = actualFluorescenceLabels.findIndex(
-        (g) => g.toLowerCase() === minFluorescence.toLowerCase()
-      );
-      const maxIdx = actualFluorescenceLabels.findIndex(
-        (g) => g.toLowerCase() === maxFluorescence.toLowerCase()
-      );
-
-      if (minIdx !== -1 && maxIdx !== -1) {
-        // Get the range of fluorescence values to include
-        const fluorescenceValuesToInclude = actualFluorescenceLabels.slice(
-          minIdx,
-          maxIdx + 1
-        );
-        where.fluorescenceIntensity = { in: fluorescenceValuesToInclude };
-      }
-    } else if (filters.minFluorescence) {
-      const minFluorescence = getActualFluorescence(filters.minFluorescence);
-      const minIdx = actualFluorescenceLabels.findIndex(
-        (g) => g.toLowerCase() === minFluorescence.toLowerCase()
-      );
-      if (minIdx !== -1) {
-        where.fluorescenceIntensity = {
-          in: actualFluorescenceLabels.slice(minIdx),
-        };
-      }
-    } else if (filters.maxFluorescence) {
-      const maxFluorescence = getActualFluorescence(filters.maxFluorescence);
-      const maxIdx = actualFluorescenceLabels.findIndex(
-        (g) => g.toLowerCase() === maxFluorescence.toLowerCase()
-      );
-      if (maxIdx !== -1) {
-        where.fluorescenceIntensity = {
-          in: actualFluorescenceLabels.slice(0, maxIdx + 1),
-        };
-      }
+  // Ratio filters (length/width, stored as ratio)
+  if (filters.minRatio !== undefined || filters.maxRatio !== undefined) {
+    where.ratio = {};
+    if (filters.minRatio !== undefined) {
+      where.ratio.gte = filters.minRatio;
+    }
+    if (filters.maxRatio !== undefined) {
+      where.ratio.lte = filters.maxRatio;
     }
   }
 
+  // Fluorescence filters (None is best, Very Strong worst)
+  const fluorescence = ordinalRange(
+    FLUORESCENCE_LABELS,
+    filters.minFluorescence,
+    filters.maxFluorescence
+  );
+  if (fluorescence) {
+    where.fluorescenceOrdinal = fluorescence;
+  }
+
   // Grading lab filter
   if (filters.gradingLab) {
     const labs = filters.gradingLab.split(',');
@@ -941,6 +548,7 @@ export async function importDiamondsBatch(
       brand: diamond.brand || null,
       guaranteedAvailability: diamond.guaranteedAvailability || null,
       availability: diamond.availability || null,
+      ...deriveDiamondAttributes(diamond),
     }));
 
     // Use createMany with skipDuplicates to handle potential duplicates
@@ -0,0 +1,126 @@
+import type { Diamond } from '../models/diamond.server';
+
+// Derived attribute columns of "Diamond", computed the same way as
+// scripts/idex_feed/derived.py so every importer fills them identically.
+// Keep the label orders and aliases in sync with that module.
+
+// Label orders of the storefront's range filters; an ordinal is the position in its list
+export const COLOUR_LABELS = ['K', 'J', 'I', 'H', 'G', 'F', 'E', 'D'];
+export const CLARITY_LABELS = ['SI2', 'SI1', 'VS2', 'VS1', 'VVS2', 'VVS1', 'IF', 'FL'];
+export const GRADE_LABELS = ['Good', 'Very Good', 'Excellent'];
+export const FLUORESCENCE_LABELS = ['None', 'Faint', 'Medium', 'Strong', 'Very Strong'];
+export const INTENSITY_LABELS = ['Light', 'Fancy', 'Intense', 'Vivid', 'Deep', 'Dark'];
+// The feed values each INTENSITY_LABELS step stands for
+const INTENSITY_VALUES: string[][] = [
+  ['Light', 'Very Light', 'Faint', 'Fancy Light'],
+  ['Fancy'],
+  ['Intense'],
+  ['Vivid'],
+  ['Fancy Deep'],
+  ['Fancy Dark'],
+];
+
+// shapeCode values; index 0 collects everything else
+const SHAPES = [
+  'other', 'round', 'oval', 'princess', 'cushion', 'emerald', 'pear', 'radiant',
+  'marquise', 'heart', 'asscher', 'baguette', 'trillion',
+];
+const SHAPE_ALIASES: Record<string, string> = {
+  br: 'round', rb: 'round', rd: 'round', rbc: 'round',
+  ov: 'oval', pr: 'princess', cu: 'cushion', cb: 'cushion', cmb: 'cushion',
+  em: 'emerald', ps: 'pear', pe: 'pear', ra: 'radiant', mq: 'marquise',
+  ma: 'marquise', hs: 'heart', ht: 'heart', as: 'asscher', ba: 'baguette',
+  trilliant: 'trillion', triangle: 'trillion',
+};
+const FLUORESCENCE_ALIASES: Record<string, string> = {
+  none: 'None', non: 'None', nil: 'None', n: 'None', negligible: 'None',
+  faint: 'Faint', fnt: 'Faint', f: 'Faint', slight: 'Faint', sl: 'Faint',
+  'very slight': 'Faint', vsl: 'Faint',
+  medium: 'Medium', med: 'Medium', m: 'Medium', moderate: 'Medium',
+  strong: 'Strong', stg: 'Strong', strg: 'Strong', s: 'Strong',
+  'very strong': 'Very Strong', vst: 'Very Strong', vstg: 'Very Strong', vs: 'Very Strong',
+};
+
+export interface DerivedAttributes {
+  colourOrdinal: number | null;
+  clarityOrdinal: number | null;
+  cutGradeOrdinal: number | null;
+  polishOrdinal: number | null;
+  symmetryOrdinal: number | null;
+  fluorescenceOrdinal: number | null;
+  fancyIntensityOrdinal: number | null;
+  isFancy: boolean;
+  ratio: number | null;
+  shapeCode: number;
+  fluorescenceBucket: number | null;
+}
+
+// Python's ' '.join(value.split()): trim and collapse whitespace runs
+const collapse = (value: string) => value.trim().split(/\s+/).filter(Boolean).join(' ');
+
+const position = (labels: string[], value?: string) => {
+  const index = labels.indexOf((value ?? '').trim());
+  return index === -1 ? null : index;
+};
+
+/**
+ * Canonical shape name for a Cut value, 'other' when unrecognised
+ * ('ROUND', 'Round Brilliant' and 'RB' are all round)
+ */
+export function normaliseShape(cut?: string): string {
+  const value = collapse((cut ?? '').toLowerCase().replace(/[-.]/g, ' '));
+  if (value in SHAPE_ALIASES) {
+    return SHAPE_ALIASES[value];
+  }
+  const words = value.split(' ');
+  return SHAPES.slice(1).find((shape) => words.includes(shape)) ?? 'other';
+}
+
+/**
+ * shapeCode for a Cut value or shape filter, 0 for shapes outside SHAPES
+ */
+export function shapeCode(cut?: string): number {
+  return SHAPES.indexOf(normaliseShape(cut));
+}
+
+function fluorescenceBucket(value?: string): number | null {
+  const bucket = FLUORESCENCE_ALIASES[collapse((value ?? '').toLowerCase().replace(/-/g, ' '))];
+  return bucket ? FLUORESCENCE_LABELS.indexOf(bucket) : null;
+}
+
+function intensityOrdinal(value?: string): number | null {
+  const label = (value ?? '').trim();
+  const index = INTENSITY_VALUES.findIndex((values) => values.includes(label));
+  return index === -1 ? null : index;
+}
+
+function lengthWidthRatio(length?: number, width?: number): number | null {
+  if (length == null || width == null) {
+    return null;
+  }
+  const ratio = length / width;
+  return Number.isFinite(ratio) && ratio > 0 ? ratio : null;
+}
+
+/**
+ * Derived attribute columns for one diamond; null where derived.py stores NULL
+ * @param diamond A diamond as parsed from the IDEX feed
+ * @returns The values for the derived "Diamond" columns
+ */
+export function deriveDiamondAttributes(diamond: Diamond): DerivedAttributes {
+  // The colour filter only ever matches stones without a fancy colour
+  const isFancy = (diamond.naturalFancyColor ?? '').trim() !== '';
+  return {
+    colourOrdinal: isFancy ? null : position(COLOUR_LABELS, diamond.color),
+    clarityOrdinal: position(CLARITY_LABELS, diamond.clarity),
+    cutGradeOrdinal: position(GRADE_LABELS, diamond.cutGrade),
+    polishOrdinal: position(GRADE_LABELS, diamond.polish),
+    symmetryOrdinal: position(GRADE_LABELS, diamond.symmetry),
+    fluorescenceOrdinal: position(FLUORESCENCE_LABELS, diamond.fluorescenceIntensity),
+    fancyIntensityOrdinal: intensityOrdinal(diamond.naturalFancyColorIntensity),
+    isFancy,
+    ratio: lengthWidthRatio(diamond.measurementsLength, diamond.measurementsWidth),
+    shapeCode: shapeCode(diamond.cut),
+    fluorescenceBucket: fluorescenceBucket(diamond.fluorescenceIntensity),
+  };
+}
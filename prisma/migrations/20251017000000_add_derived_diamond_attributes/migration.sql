@@ -0,0 +1,24 @@
+-- AlterTable
+ALTER TABLE "Diamond" ADD COLUMN     "colourOrdinal" INTEGER,
+ADD COLUMN     "clarityOrdinal" INTEGER,
+ADD COLUMN     "cutGradeOrdinal" INTEGER,
+ADD COLUMN     "polishOrdinal" INTEGER,
+ADD COLUMN     "symmetryOrdinal" INTEGER,
+ADD COLUMN     "fluorescenceOrdinal" INTEGER,
+ADD COLUMN     "fancyIntensityOrdinal" INTEGER,
+ADD COLUMN     "isFancy" BOOLEAN,
+ADD COLUMN     "ratio" DOUBLE PRECISION,
+ADD COLUMN     "shapeCode" INTEGER,
+ADD COLUMN     "fluorescenceBucket" INTEGER;
+
+-- CreateIndex
+CREATE INDEX "Diamond_type_shapeCode_carat_idx" ON "Diamond"("type", "shapeCode", "carat");
+
+-- CreateIndex
+CREATE INDEX "Diamond_colourOrdinal_idx" ON "Diamond"("colourOrdinal");
+
+-- CreateIndex
+CREATE INDEX "Diamond_clarityOrdinal_idx" ON "Diamond"("clarityOrdinal");
+
+-- CreateIndex
+CREATE INDEX "Diamond_ratio_idx" ON "Diamond"("ratio");
@@ -1,94 +1,44 @@
 #!/usr/bin/env python3
-import csv
 import json
-from collections import Counter
-from urllib.parse import urlparse
 import os
 
+from idex_feed import FeedScanner, url_report_analyzers
+
 def analyze_csv(file_path, diamond_type, sample_size=500):
     """Analyze a diamond CSV file for URL patterns"""
     print(f"\n=== Analyzing {diamond_type} diamonds ===")
     print(f"File: {file_path}")
     
-    results = {
+    scanner = FeedScanner(diamond_type, max_rows=sample_size)
+    for analyzer in url_report_analyzers():
+        scanner.register(analyzer)
+    report = scanner.scan(file_path)
+    
+    coverage = report['coverage']
+    samples = report['samples']
+    
+    def as_sample(sample):
+        return {
+            'diamond_id': sample['id'],
+            'url': sample['url'],
+            'carat': sample['carat'],
+            'color': sample['color'],
+            'clarity': sample['clarity']
+        }
+    
+    return {
         'type': diamond_type,
-        'total_rows': 0,
-        'rows_with_video': 0,
-        'rows_with_3d': 0,
-        'rows_with_both': 0,
-        'video_domains': Counter(),
-        '3d_domains': Counter(),
+        'total_rows': coverage['total'],
+        'rows_with_video': coverage['with_video'],
+        'rows_with_3d': coverage['with_3d'],
+        'rows_with_both': coverage['with_both'],
+        'video_domains': report['domains']['video_domains'],
+        '3d_domains': report['domains']['3d_domains'],
         'sample_urls': {
-            'video': [],
-            '3d': []
+            'video': [as_sample(s) for s in samples['video']],
+            '3d': [as_sample(s) for s in samples['3d']]
         }
     }
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        
-        # For natural diamonds, Video URL is at index 35, 3D at 36
-        # For lab diamonds, Video URL is at index 100, 3D at 101
-        video_idx = 35 if diamond_type == 'natural' else 100
-        viewer_3d_idx = 36 if diamond_type == 'natural' else 101
-        
-        for i, row in enumerate(reader):
-            if i >= sample_size:
-                break
-                
-            results['total_rows'] += 1
-            
-            # Get URLs
-            video_url = row[video_idx].strip() if len(row) > video_idx else ''
-            viewer_3d_url = row[viewer_3d_idx].strip() if len(row) > viewer_3d_idx else ''
-            
-            has_video = bool(video_url)
-            has_3d = bool(viewer_3d_url)
-            
-            if has_video:
-                results['rows_with_video'] += 1
-                # Extract domain
-                try:
-                    domain = urlparse(video_url).netloc
-                    results['video_domains'][domain] += 1
-                    # Add to samples
-                    if len(results['sample_urls']['video']) < 10:
-                        results['sample_urls']['video'].append({
-                            'diamond_id': row[0],
-                            'url': video_url,
-                            'carat': row[2] if diamond_type == 'natural' else row[3],
-                            'color': row[3] if diamond_type == 'natural' else row[4],
-                            'clarity': row[8] if diamond_type == 'natural' else row[9]
-                        })
-                except:
-                    pass
-                    
-            if has_3d:
-                results['rows_with_3d'] += 1
-                # Extract domain
-                try:
-                    domain = urlparse(viewer_3d_url).netloc
-                    results['3d_domains'][domain] += 1
-                    # Add to samples
-                    if len(results['sample_urls']['3d']) < 10:
-                        results['sample_urls']['3d'].append({
-                            'diamond_id': row[0],
-                            'url': viewer_3d_url,
-                            'carat': row[2] if diamond_type == 'natural' else row[3],
-                            'color': row[3] if diamond_type == 'natural' else row[4],
-                            'clarity': row[8] if diamond_type == 'natural' else row[9]
-                        })
-                except:
-                    pass
-                    
-            if has_video and has_3d:
-                results['rows_with_both'] += 1
-    
-    # Convert Counter to dict for JSON serialization
-    results['video_domains'] = dict(results['video_domains'])
-    results['3d_domains'] = dict(results['3d_domains'])
-    
-    return results
 
 def main():
     # Change to the directory containing the CSV files
@@ -2,87 +2,82 @@
 import csv
 import os
 
+from idex_feed import Analyzer, FeedScanner, FeedSchema
+from idex_feed.metrics import RunMetrics, print_summary
+from idex_feed.sources import open_feed
+
 def peek_at_csv(file_path, diamond_type):
     """Look at first few rows to understand structure"""
     print(f"\n=== {diamond_type} Diamond CSV Structure ===")
     print(f"File: {file_path}")
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        
-        # Read first 5 rows
+
+    with open_feed(file_path) as lines:
+        reader = csv.reader(lines)
+        schema = FeedSchema(next(reader), diamond_type)
+        print(f"Header has {schema.width} columns")
+
+        video_col = schema.column('videoUrl')
+        viewer_3d_col = schema.column('threeDViewerUrl')
+        get_info = schema.extractor(('itemId', 'cut', 'carat', 'videoUrl', 'threeDViewerUrl'))
+
+        # Read first 5 data rows
         for i, row in enumerate(reader):
             if i >= 5:
                 break
-            
+
             print(f"\nRow {i+1} has {len(row)} columns")
-            
-            # For natural diamonds, check columns 35-36
-            if diamond_type == 'natural' and len(row) > 36:
-                print(f"  Column 35 (Video URL): '{row[35]}'")
-                print(f"  Column 36 (3D Viewer URL): '{row[36]}'")
-                
-            # For lab diamonds, check columns 100-101
-            if diamond_type == 'lab' and len(row) > 101:
-                print(f"  Column 100 (Video URL): '{row[100]}'")
-                print(f"  Column 101 (3D Viewer URL): '{row[101]}'")
-            elif diamond_type == 'lab':
-                print(f"  Only {len(row)} columns - expected at least 102")
-                
-            # Show some basic diamond info
-            if len(row) > 10:
-                print(f"  Diamond ID: {row[0]}")
-                print(f"  Cut: {row[1] if diamond_type == 'natural' else row[2]}")
-                print(f"  Carat: {row[2] if diamond_type == 'natural' else row[3]}")
-
-def find_non_empty_urls(file_path, diamond_type, max_rows=10000):
+            item_id, cut, carat, video_url, viewer_3d_url = get_info(schema.pad(row))
+            print(f"  Column {video_col} (Video URL): '{video_url}'")
+            print(f"  Column {viewer_3d_col} (3D Viewer URL): '{viewer_3d_url}'")
+            print(f"  Diamond ID: {item_id}")
+            print(f"  Cut: {cut}")
+            print(f"  Carat: {carat}")
+
+class UrlFinder(Analyzer):
+    """Records every row that carries a video or 3D URL"""
+
+    name = 'found'
+    fields = ('itemId', 'videoUrl', 'threeDViewerUrl')
+
+    def __init__(self):
+        self.row = 0
+        self.video = []
+        self.viewer_3d = []
+
+    def process(self, row):
+        item_id, video_url, viewer_3d_url = self.get(row)
+        video_url = video_url.strip()
+        viewer_3d_url = viewer_3d_url.strip()
+
+        if video_url.startswith('http'):
+            self.video.append({'row': self.row, 'id': item_id, 'url': video_url})
+        if viewer_3d_url.startswith('http'):
+            self.viewer_3d.append({'row': self.row, 'id': item_id, 'url': viewer_3d_url})
+        self.row += 1
+
+    def result(self):
+        return {'video': self.video, '3d': self.viewer_3d}
+
+def find_non_empty_urls(file_path, diamond_type, max_rows=10000, metrics=None):
     """Find rows with actual URL content"""
     print(f"\n=== Searching for non-empty URLs in {diamond_type} diamonds ===")
-    
-    video_col = 35 if diamond_type == 'natural' else 100
-    viewer_3d_col = 36 if diamond_type == 'natural' else 101
-    
-    found_video = []
-    found_3d = []
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        
-        for i, row in enumerate(reader):
-            if i >= max_rows:
-                break
-                
-            if len(row) > max(video_col, viewer_3d_col):
-                video_url = row[video_col].strip()
-                viewer_3d_url = row[viewer_3d_col].strip()
-                
-                if video_url and video_url.startswith('http'):
-                    found_video.append({
-                        'row': i,
-                        'id': row[0],
-                        'url': video_url
-                    })
-                    
-                if viewer_3d_url and viewer_3d_url.startswith('http'):
-                    found_3d.append({
-                        'row': i,
-                        'id': row[0],
-                        'url': viewer_3d_url
-                    })
-                    
-            if i % 1000 == 0:
-                print(f"  Processed {i} rows... Found {len(found_video)} video URLs, {len(found_3d)} 3D URLs")
-    
+
+    scanner = FeedScanner(diamond_type, max_rows=max_rows, progress_every=1000, metrics=metrics)
+    finder = scanner.register(UrlFinder())
+    scanner.scan(file_path)
+    found_video = finder.video
+    found_3d = finder.viewer_3d
+
     print(f"\nResults for {diamond_type}:")
-    print(f"  Total rows checked: {i}")
+    print(f"  Total rows checked: {scanner.rows}")
     print(f"  Found video URLs: {len(found_video)}")
     print(f"  Found 3D URLs: {len(found_3d)}")
-    
+
     if found_video:
         print(f"\nFirst 5 Video URLs:")
         for item in found_video[:5]:
             print(f"  Row {item['row']}, ID {item['id']}: {item['url']}")
-            
+
     if found_3d:
         print(f"\nFirst 5 3D URLs:")
         for item in found_3d[:5]:
@@ -91,14 +86,17 @@ def find_non_empty_urls(file_path, diamond_type, max_rows=10000):
 def main():
     # Change to CSV directory
     os.chdir('scripts/diamond-url-samples')
-    
+
     # First peek at the structure
     peek_at_csv('Idex_Feed_2025_08_01_17_48_11.csv', 'natural')
     peek_at_csv('Idex_Complete_LgSingles_2025_08_01_17_27_36.csv', 'lab')
-    
-    # Then search for actual URLs
-    find_non_empty_urls('Idex_Feed_2025_08_01_17_48_11.csv', 'natural')
-    find_non_empty_urls('Idex_Complete_LgSingles_2025_08_01_17_27_36.csv', 'lab')
+
+    # Then search for actual URLs, timing each scan into feed-metrics.jsonl
+    metrics = RunMetrics('feed-metrics.jsonl', run='analyze-urls-simple')
+    find_non_empty_urls('Idex_Feed_2025_08_01_17_48_11.csv', 'natural', metrics=metrics)
+    find_non_empty_urls('Idex_Complete_LgSingles_2025_08_01_17_27_36.csv', 'lab', metrics=metrics)
+    print_summary(metrics.summary())
+    metrics.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,52 +1,34 @@
 #!/usr/bin/env python3
-import csv
 import json
 import os
 
-def extract_3d_urls(file_path, diamond_type, viewer_3d_col, limit=100, skip=0):
-    """Extract unique 3D viewer URLs with skip option"""
-    urls = []
-    seen = set()
-    skipped = 0
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        next(reader)  # Skip header
-        
-        for i, row in enumerate(reader):
-            if len(urls) >= limit:
-                break
-                
-            if len(row) > viewer_3d_col:
-                url = row[viewer_3d_col].strip()
-                
-                if url and url.startswith('http') and url not in seen:
-                    if skipped < skip:
-                        skipped += 1
-                        seen.add(url)
-                        continue
-                        
-                    seen.add(url)
-                    urls.append({
-                        'url': url,
-                        'id': row[0],
-                        'type': diamond_type,
-                        'cut': row[2] if diamond_type == 'natural' else row[2],
-                        'carat': row[3] if diamond_type == 'natural' else row[3],
-                        'color': row[4] if diamond_type == 'natural' else row[4],
-                        'clarity': row[9] if diamond_type == 'natural' else row[9],
-                        'price': row[19] if diamond_type == 'natural' else row[19]
-                    })
-    
-    return urls
+from idex_feed import FeedScanner, ThreeDExtractor
+from idex_feed.cursor import extract_next
+
+def extract_3d_urls(file_path, diamond_type, limit=100, skip=0, cursor_path=None):
+    """Extract unique 3D viewer URLs with skip option
+
+    With a saved cursor the batch continues where the last one stopped
+    instead of re-scanning and skipping.
+    """
+    if cursor_path and os.path.exists(cursor_path):
+        urls, _ = extract_next(file_path, cursor_path, limit, diamond_type)
+        return urls
+    scanner = FeedScanner(diamond_type)
+    extractor = scanner.register(ThreeDExtractor(limit, skip))
+    scanner.scan(file_path)
+    return extractor.urls
 
 def main():
     os.chdir('scripts/diamond-url-samples')
     
     # Extract 40 natural and 40 lab diamonds (80 total)
-    # Skip the first 25 of each that we already used
-    natural_urls = extract_3d_urls('Idex_Feed_2025_08_01_17_48_11.csv', 'natural', 17, 40, skip=25)
-    lab_urls = extract_3d_urls('Idex_Complete_LgSingles_2025_08_01_17_27_36.csv', 'lab', 53, 40, skip=25)
+    # Continue after the first 25 of each that we already used
+    # (from the cursors extract-more-3d-urls.py saved, else by skipping)
+    natural_urls = extract_3d_urls('Idex_Feed_2025_08_01_17_48_11.csv', 'natural', 40, skip=25,
+                                   cursor_path='natural-3d.cursor.json')
+    lab_urls = extract_3d_urls('Idex_Complete_LgSingles_2025_08_01_17_27_36.csv', 'lab', 40, skip=25,
+                               cursor_path='lab-3d.cursor.json')
     
     # Also load the original 30 we already have
     with open('extracted_3d_urls.json', 'r') as f:
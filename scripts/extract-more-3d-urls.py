@@ -1,46 +1,34 @@
 #!/usr/bin/env python3
-import csv
 import json
 import os
 
-def extract_3d_urls(file_path, diamond_type, viewer_3d_col, limit=50):
-    """Extract unique 3D viewer URLs"""
-    urls = []
-    seen = set()
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        next(reader)  # Skip header
-        
-        for i, row in enumerate(reader):
-            if len(urls) >= limit:
-                break
-                
-            if len(row) > viewer_3d_col:
-                url = row[viewer_3d_col].strip()
-                
-                if url and url.startswith('http') and url not in seen:
-                    seen.add(url)
-                    urls.append({
-                        'url': url,
-                        'id': row[0],
-                        'type': diamond_type,
-                        'cut': row[2] if diamond_type == 'natural' else row[2],
-                        'carat': row[3] if diamond_type == 'natural' else row[3],
-                        'color': row[4] if diamond_type == 'natural' else row[4],
-                        'clarity': row[9] if diamond_type == 'natural' else row[9]
-                    })
-    
-    return urls
+from idex_feed import FeedScanner, ThreeDExtractor
+from idex_feed.cursor import extract_next, reset_cursor
+
+def extract_3d_urls(file_path, diamond_type, limit=50, cursor_path=None):
+    """Extract unique 3D viewer URLs, saving a cursor to continue from when given"""
+    if cursor_path:
+        urls, _ = extract_next(file_path, cursor_path, limit, diamond_type)
+        return urls
+    scanner = FeedScanner(diamond_type)
+    extractor = scanner.register(ThreeDExtractor(limit))
+    scanner.scan(file_path)
+    return extractor.urls
 
 def main():
     os.chdir('scripts/diamond-url-samples')
     
-    # Extract from natural diamonds (3D at column 17)
-    natural_urls = extract_3d_urls('Idex_Feed_2025_08_01_17_48_11.csv', 'natural', 17, 25)
+    # First batch: start new cursors that extract-80-3d-urls.py continues from
+    reset_cursor('natural-3d.cursor.json')
+    reset_cursor('lab-3d.cursor.json')
+    
+    # Extract from natural diamonds
+    natural_urls = extract_3d_urls('Idex_Feed_2025_08_01_17_48_11.csv', 'natural', 25,
+                                   'natural-3d.cursor.json')
     
-    # Extract from lab diamonds (3D at column 53)
-    lab_urls = extract_3d_urls('Idex_Complete_LgSingles_2025_08_01_17_27_36.csv', 'lab', 53, 25)
+    # Extract from lab diamonds
+    lab_urls = extract_3d_urls('Idex_Complete_LgSingles_2025_08_01_17_27_36.csv', 'lab', 25,
+                               'lab-3d.cursor.json')
     
     all_urls = natural_urls + lab_urls
     
@@ -0,0 +1,11 @@
+"""Shared tooling for analysing IDEX feed snapshots"""
+from .analyzers import (
+    DomainCounts,
+    MediaSamples,
+    PriceQuantiles,
+    ThreeDExtractor,
+    UrlCoverage,
+    url_report_analyzers,
+)
+from .headers import LAB_GROWN_DIAMOND_HEADERS, NATURAL_DIAMOND_HEADERS
+from .scan import Analyzer, FeedScanner, FeedSchema
@@ -0,0 +1,242 @@
+"""Analyzers for FeedScanner: URL coverage, media domains, samples, prices and 3D extraction"""
+from array import array
+from collections import Counter
+
+from .scan import Analyzer
+
+
+def media_url(value):
+    """Return the stripped URL when the cell holds one, else ''"""
+    value = value.strip()
+    return value if value.startswith('http') else ''
+
+
+def url_domain(url):
+    """Network location of an http(s) URL, same as urlparse(url).netloc"""
+    parts = url.split('/', 3)
+    return parts[2] if len(parts) > 2 else ''
+
+
+class UrlCoverage(Analyzer):
+    """Counts rows carrying a video URL, a 3D viewer URL, or both"""
+
+    name = 'coverage'
+    fields = ('videoUrl', 'threeDViewerUrl')
+
+    def __init__(self):
+        self.total = 0
+        self.with_video = 0
+        self.with_3d = 0
+        self.with_both = 0
+
+    def process(self, row):
+        video, viewer = self.get(row)
+        has_video = video.lstrip().startswith('http')
+        has_3d = viewer.lstrip().startswith('http')
+        self.total += 1
+        if has_video:
+            self.with_video += 1
+        if has_3d:
+            self.with_3d += 1
+            if has_video:
+                self.with_both += 1
+
+    def merge(self, other):
+        self.total += other.total
+        self.with_video += other.with_video
+        self.with_3d += other.with_3d
+        self.with_both += other.with_both
+
+    def result(self):
+        return {
+            'total': self.total,
+            'with_video': self.with_video,
+            'with_3d': self.with_3d,
+            'with_both': self.with_both,
+        }
+
+
+class DomainCounts(Analyzer):
+    """Counts the hosts serving video and 3D viewer URLs"""
+
+    name = 'domains'
+    fields = ('videoUrl', 'threeDViewerUrl')
+
+    def __init__(self):
+        self.video_domains = Counter()
+        self.viewer_domains = Counter()
+
+    def process(self, row):
+        video, viewer = self.get(row)
+        video = media_url(video)
+        if video:
+            self.video_domains[url_domain(video)] += 1
+        viewer = media_url(viewer)
+        if viewer:
+            self.viewer_domains[url_domain(viewer)] += 1
+
+    def merge(self, other):
+        self.video_domains.update(other.video_domains)
+        self.viewer_domains.update(other.viewer_domains)
+
+    def result(self):
+        return {
+            'video_domains': dict(self.video_domains),
+            '3d_domains': dict(self.viewer_domains),
+        }
+
+
+class MediaSamples(Analyzer):
+    """Keeps the first `limit` diamonds with a video and with a 3D URL"""
+
+    name = 'samples'
+    fields = ('itemId', 'cut', 'carat', 'color', 'clarity', 'totalPrice',
+              'videoUrl', 'threeDViewerUrl')
+
+    def __init__(self, limit=10):
+        self.limit = limit
+        self.video = []
+        self.viewer = []
+
+    def sample(self, values, url):
+        item_id, cut, carat, color, clarity, price = values[:6]
+        return {
+            'id': item_id,
+            'cut': cut,
+            'carat': carat,
+            'color': color,
+            'clarity': clarity,
+            'price': price,
+            'url': url,
+        }
+
+    def process(self, row):
+        if len(self.video) >= self.limit and len(self.viewer) >= self.limit:
+            return
+        values = self.get(row)
+        if len(self.video) < self.limit:
+            url = media_url(values[6])
+            if url:
+                self.video.append(self.sample(values, url))
+        if len(self.viewer) < self.limit:
+            url = media_url(values[7])
+            if url:
+                self.viewer.append(self.sample(values, url))
+
+    def merge(self, other):
+        self.video = (self.video + other.video)[:self.limit]
+        self.viewer = (self.viewer + other.viewer)[:self.limit]
+
+    def result(self):
+        return {'video': self.video, '3d': self.viewer}
+
+
+def quantile(ordered, q):
+    """Linearly interpolated quantile of a sorted sequence (NumPy's default method)"""
+    position = (len(ordered) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+class PriceQuantiles(Analyzer):
+    """Total Price distribution: count, mean, min, max and quantiles"""
+
+    name = 'prices'
+    fields = ('totalPrice',)
+    quantiles = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+    def __init__(self):
+        # 8 bytes per price keeps a million-row feed at ~8 MB
+        self.prices = array('d')
+
+    def process(self, row):
+        value = self.get(row)[0].strip()
+        if not value:
+            return
+        try:
+            price = float(value)
+        except ValueError:
+            return
+        if price == price:
+            self.prices.append(price)
+
+    def merge(self, other):
+        self.prices.extend(other.prices)
+
+    def result(self):
+        if not self.prices:
+            return {'count': 0}
+        ordered = sorted(self.prices)
+        return {
+            'count': len(ordered),
+            'mean': sum(ordered) / len(ordered),
+            'min': ordered[0],
+            'max': ordered[-1],
+            'quantiles': {str(q): quantile(ordered, q) for q in self.quantiles},
+        }
+
+
+class ThreeDExtractor(Analyzer):
+    """Collects unique 3D viewer URLs with the diamond they belong to
+
+    The first `skip` unique URLs are passed over, which lets a later run
+    continue after the URLs an earlier one already extracted.
+    """
+
+    name = '3d_urls'
+    fields = ('itemId', 'cut', 'carat', 'color', 'clarity', 'totalPrice',
+              'threeDViewerUrl')
+
+    def __init__(self, limit=50, skip=0):
+        self.limit = limit
+        self.skip = skip
+        self.seen = set()
+        self.found = []
+
+    @property
+    def urls(self):
+        return self.found[self.skip:]
+
+    def process(self, row):
+        if self.done:
+            return
+        values = self.get(row)
+        url = media_url(values[6])
+        if not url or url in self.seen:
+            return
+        self.seen.add(url)
+        item_id, cut, carat, color, clarity, price = values[:6]
+        self.found.append({
+            'url': url,
+            'id': item_id,
+            'type': self.diamond_type,
+            'cut': cut,
+            'carat': carat,
+            'color': color,
+            'clarity': clarity,
+            'price': price,
+        })
+        self.done = len(self.found) >= self.skip + self.limit
+
+    def merge(self, other):
+        # Never short: a worker keeps its chunk's first skip + limit unique URLs,
+        # and until this list is full it holds fewer than that, so other.found
+        # always has as many new URLs as are still wanted, in file order; they
+        # are the ones a sequential scan would append next
+        wanted = self.skip + self.limit
+        for item in other.found:
+            if len(self.found) >= wanted:
+                break
+            if item['url'] not in self.seen:
+                self.seen.add(item['url'])
+                self.found.append(item)
+        self.done = len(self.found) >= wanted
+
+    def result(self):
+        return self.urls
+
+
+def url_report_analyzers(sample_limit=10):
+    """The analyzers behind the URL coverage report"""
+    return [UrlCoverage(), DomainCounts(), MediaSamples(sample_limit)]
@@ -0,0 +1,334 @@
+"""Streaming price-per-carat anomaly detection with bounded memory.
+
+Each row is assigned to a cell (type, shape, carat bucket, colour,
+clarity). Its price per carat feeds a log-bucket quantile sketch for the
+cell, plus two coarser parent cells: (type, shape, carat bucket) and
+(type, carat bucket). Each sketch is DDSketch-style:
+
+- a value lands in bucket ceil(log(v) / log(gamma)), so every quantile is
+  within `alpha` relative error
+- a sketch never holds more than `max_buckets` counters; beyond that its
+  lowest buckets are collapsed into one, so memory per cell is fixed
+- sketches merge by adding counters, so parallel scans give the same result
+
+Flagging needs quantiles before the row is seen. A nightly run therefore
+checks rows against a baseline, the sketches saved by the previous run,
+and scans the feed once. A row is flagged when its price per carat falls
+below the baseline's `low` quantile divided by `factor`, or above the
+`high` quantile times `factor`. It is judged by the most specific cell
+holding at least `min_count` baseline prices. Without a baseline the feed
+is scanned twice: once to build the sketches, once to flag.
+
+Type follows the importer: a row is lab-grown when the feed is the lab
+feed or its certificate number contains "LG".
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import time
+
+from .metrics import RunMetrics, print_summary
+from .parallel import run_parallel_scans
+from .sampling import carat_bucket
+from .scan import Analyzer
+
+SKETCH_VERSION = 1
+DEFAULT_ALPHA = 0.02
+DEFAULT_MAX_BUCKETS = 128
+DEFAULT_LOW = 0.01
+DEFAULT_HIGH = 0.99
+DEFAULT_FACTOR = 2.0
+DEFAULT_MIN_COUNT = 50
+QUARANTINE_FIELDS = ('itemId', 'type', 'cell', 'carat', 'totalPrice', 'pricePerCarat',
+                     'bandLow', 'bandHigh', 'reason')
+
+
+class LogSketch:
+    """Relative-error quantile sketch over positive values with a fixed bucket budget"""
+
+    __slots__ = ('counts', 'count')
+
+    def __init__(self, counts=None, count=0):
+        self.counts = counts if counts is not None else {}
+        self.count = count
+
+    def add(self, index, max_buckets):
+        counts = self.counts
+        counts[index] = counts.get(index, 0) + 1
+        self.count += 1
+        if len(counts) > max_buckets:
+            self.collapse(max_buckets)
+
+    def collapse(self, max_buckets):
+        # Fold the lowest buckets together; the low tail loses resolution first
+        ordered = sorted(self.counts)
+        excess = len(ordered) - max_buckets + 1
+        keep = ordered[excess]
+        folded = sum(self.counts.pop(i) for i in ordered[:excess])
+        self.counts[keep] += folded
+
+    def merge(self, other, max_buckets):
+        for index, n in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + n
+        self.count += other.count
+        if len(self.counts) > max_buckets:
+            self.collapse(max_buckets)
+
+    def quantile_index(self, q):
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen > rank:
+                return index
+        return max(self.counts)
+
+
+class SketchSet:
+    """Sketches for every cell, sharing one bucket mapping"""
+
+    def __init__(self, alpha=DEFAULT_ALPHA, max_buckets=DEFAULT_MAX_BUCKETS, cells=None):
+        self.alpha = alpha
+        self.max_buckets = max_buckets
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.cells = cells if cells is not None else {}
+
+    def index(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def value(self, index):
+        """Representative value of a bucket (within alpha of everything in it)"""
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, keys, value):
+        index = self.index(value)
+        cells = self.cells
+        for key in keys:
+            sketch = cells.get(key)
+            if sketch is None:
+                sketch = cells[key] = LogSketch()
+            sketch.add(index, self.max_buckets)
+
+    def merge(self, other):
+        for key, sketch in other.cells.items():
+            mine = self.cells.get(key)
+            if mine is None:
+                self.cells[key] = LogSketch(dict(sketch.counts), sketch.count)
+            else:
+                mine.merge(sketch, self.max_buckets)
+
+    def quantile(self, key, q):
+        return self.value(self.cells[key].quantile_index(q))
+
+    def bands(self, low, high, factor, min_count):
+        """{cell: (lowest normal, highest normal)} for cells with enough data"""
+        return {
+            key: (self.quantile(key, low) / factor, self.quantile(key, high) * factor)
+            for key, sketch in self.cells.items() if sketch.count >= min_count
+        }
+
+    def save(self, path):
+        data = {
+            'version': SKETCH_VERSION,
+            'alpha': self.alpha,
+            'max_buckets': self.max_buckets,
+            'cells': {'|'.join(key): [sketch.count, sorted(sketch.counts.items())]
+                      for key, sketch in sorted(self.cells.items())},
+        }
+        scratch = path + '.tmp'
+        with open(scratch, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(scratch, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != SKETCH_VERSION:
+            raise ValueError(f'{path}: unsupported sketch version {data.get("version")}')
+        cells = {tuple(key.split('|')): LogSketch({int(i): n for i, n in counts}, count)
+                 for key, (count, counts) in data['cells'].items()}
+        return cls(data['alpha'], data['max_buckets'], cells)
+
+
+def colour_key(color, fancy):
+    """White colour grade, or 'fancy-<last colour word>' (the hue, e.g. 'Pinkish Brown' -> brown) for fancy stones"""
+    fancy = fancy.strip()
+    if fancy:
+        return 'fancy-' + fancy.split()[-1].lower()
+    return color.strip().upper() or 'unknown'
+
+
+class PriceAnomalies(Analyzer):
+    """Sketches price per carat per cell and flags rows outside the baseline bands"""
+
+    name = 'price_anomalies'
+    fields = ('itemId', 'cut', 'carat', 'color', 'naturalFancyColor', 'clarity', 'totalPrice',
+              'certificateNumber')
+
+    def __init__(self, bands=None, alpha=DEFAULT_ALPHA, max_buckets=DEFAULT_MAX_BUCKETS):
+        self.bands = bands or {}
+        self.sketches = SketchSet(alpha, max_buckets)
+        self.flagged = []
+        self.priced = 0
+
+    def process(self, row):
+        item_id, cut, carat, color, fancy, clarity, price, certificate = self.get(row)
+        try:
+            carat_value = float(carat)
+            price_value = float(price)
+        except ValueError:
+            return
+        if not carat_value > 0 or not price_value > 0:
+            return
+        per_carat = price_value / carat_value
+        diamond_type = 'lab' if self.diamond_type == 'lab' or 'LG' in certificate.upper() else 'natural'
+        bucket = carat_bucket(carat_value)
+        shape = cut.strip().lower() or 'unknown'
+        keys = (
+            (diamond_type, shape, bucket, colour_key(color, fancy), clarity.strip().upper() or 'unknown'),
+            (diamond_type, shape, bucket),
+            (diamond_type, bucket),
+        )
+        self.sketches.add(keys, per_carat)
+        self.priced += 1
+
+        bands = self.bands
+        if not bands:
+            return
+        for key in keys:
+            band = bands.get(key)
+            if band is not None:
+                break
+        else:
+            return
+        low, high = band
+        if low <= per_carat <= high:
+            return
+        self.flagged.append({
+            'itemId': item_id.strip(),
+            'type': diamond_type,
+            'cell': '|'.join(key),
+            'carat': carat_value,
+            'totalPrice': price_value,
+            'pricePerCarat': round(per_carat, 2),
+            'bandLow': round(low, 2),
+            'bandHigh': round(high, 2),
+            'reason': 'low' if per_carat < low else 'high',
+        })
+
+    def merge(self, other):
+        self.sketches.merge(other.sketches)
+        self.flagged.extend(other.flagged)
+        self.priced += other.priced
+
+    def result(self):
+        return {'priced': self.priced, 'cells': len(self.sketches.cells), 'flagged': len(self.flagged)}
+
+
+def scan_feeds(feeds, bands=None, alpha=DEFAULT_ALPHA, max_buckets=DEFAULT_MAX_BUCKETS, workers=None,
+               metrics=None):
+    """One parallel pass over all feeds; returns the merged PriceAnomalies"""
+    prototype = PriceAnomalies(bands, alpha, max_buckets)
+    scanners = run_parallel_scans({f'feed{i}': path for i, path in enumerate(feeds)}, [prototype], workers,
+                                  metrics=metrics)
+    merged = None
+    for scanner in scanners.values():
+        detector = scanner.analyzers[0]
+        if merged is None:
+            merged = detector
+        else:
+            merged.merge(detector)
+    return merged
+
+
+def cell_summaries(sketches, flagged, low, high):
+    counts = {}
+    for row in flagged:
+        counts[row['cell']] = counts.get(row['cell'], 0) + 1
+    out = []
+    for key, sketch in sorted(sketches.cells.items()):
+        if len(key) != 5:
+            continue
+        name = '|'.join(key)
+        out.append({
+            'cell': name,
+            'count': sketch.count,
+            'low': round(sketches.quantile(key, low), 2),
+            'median': round(sketches.quantile(key, 0.5), 2),
+            'high': round(sketches.quantile(key, high), 2),
+            'flagged': counts.get(name, 0),
+        })
+    return out
+
+
+def write_quarantine(flagged, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=QUARANTINE_FIELDS)
+        writer.writeheader()
+        writer.writerows(flagged)
+
+
+def read_quarantine(path):
+    """Item IDs listed in a quarantine file"""
+    with open(path, newline='') as f:
+        return {row['itemId'] for row in csv.DictReader(f)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flag implausible price-per-carat rows before import')
+    parser.add_argument('feeds', nargs='+', help='Feed .csv or .zip files')
+    parser.add_argument('--baseline', help='Sketches from an earlier run (default: two passes over these feeds)')
+    parser.add_argument('--save-sketches', default='price-sketches.json',
+                        help='Where this run\'s sketches are saved, the next run\'s baseline')
+    parser.add_argument('--low', type=float, default=DEFAULT_LOW, help='Lower band quantile')
+    parser.add_argument('--high', type=float, default=DEFAULT_HIGH, help='Upper band quantile')
+    parser.add_argument('--factor', type=float, default=DEFAULT_FACTOR,
+                        help='How far outside the band quantiles a price must be to be flagged')
+    parser.add_argument('--min-count', type=int, default=DEFAULT_MIN_COUNT,
+                        help='Prices a cell needs before its own band is trusted')
+    parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA, help='Sketch relative accuracy')
+    parser.add_argument('--max-buckets', type=int, default=DEFAULT_MAX_BUCKETS, help='Sketch size per cell')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--metrics', help='Append scan timings and per-analyzer costs to this JSON-lines file')
+    parser.add_argument('--quarantine', default='price-quarantine.csv')
+    parser.add_argument('--out', default='price-cells.json', help='Per-cell summaries')
+    args = parser.parse_args()
+
+    metrics = RunMetrics(args.metrics, run='anomalies') if args.metrics else None
+    started = time.perf_counter()
+    if args.baseline:
+        baseline = SketchSet.load(args.baseline)
+        passes = 1
+    else:
+        print("No baseline given, building one from these feeds first")
+        baseline = scan_feeds(args.feeds, None, args.alpha, args.max_buckets, args.workers, metrics).sketches
+        passes = 2
+    bands = baseline.bands(args.low, args.high, args.factor, args.min_count)
+    detector = scan_feeds(args.feeds, bands, args.alpha, args.max_buckets, args.workers, metrics)
+    seconds = time.perf_counter() - started
+
+    write_quarantine(detector.flagged, args.quarantine)
+    detector.sketches.save(args.save_sketches)
+    with open(args.out, 'w') as f:
+        json.dump(cell_summaries(detector.sketches, detector.flagged, args.low, args.high), f, indent=2)
+
+    low = sum(1 for row in detector.flagged if row['reason'] == 'low')
+    print(f"{detector.priced:,} priced rows, {len(detector.sketches.cells):,} cells, "
+          f"{len(bands):,} with bands ({passes} pass{'es' if passes > 1 else ''}, {seconds:.1f}s)")
+    print(f"Flagged {len(detector.flagged):,}: {low:,} too cheap, {len(detector.flagged) - low:,} too expensive")
+    for row in sorted(detector.flagged, key=lambda r: r['pricePerCarat'])[:5]:
+        print(f"  {row['itemId']}: {row['carat']}ct ${row['totalPrice']:,} ({row['pricePerCarat']:,}/ct, "
+              f"normal {row['bandLow']:,}-{row['bandHigh']:,}) in {row['cell']}")
+    if metrics is not None:
+        print_summary(metrics.summary())
+        metrics.close()
+    print(f"Saved to: {args.quarantine}")
+    print(f"Saved to: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Offline benchmarks for the feed analysis paths.
+
+Each benchmark runs in a fresh process so its peak RSS is its own, and
+reports wall time, rows/s, MB/s (of the feed file) and peak RSS. Feeds
+can be real snapshots or synthetic ones generated on the fly with
+`--generate ROWS`. Passing a previous report as `--baseline` fails the
+run when any benchmark's rows/s dropped by more than `--tolerance`.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from .analyzers import ThreeDExtractor, url_report_analyzers
+from .gallery import GalleryFeeder, GalleryWriter
+from .parallel import scan_feed_parallel
+from .sampling import StratifiedSample
+from .scan import FeedScanner
+from .sources import resolve_feed
+from .synthetic import default_name, write_feed
+
+
+def bench_url_coverage(file_path, scratch):
+    scanner = FeedScanner()
+    for analyzer in url_report_analyzers():
+        scanner.register(analyzer)
+    scanner.scan(file_path)
+    return scanner.rows
+
+
+def bench_3d_extraction(file_path, scratch):
+    scanner = FeedScanner()
+    scanner.register(ThreeDExtractor(limit=sys.maxsize))
+    scanner.scan(file_path)
+    return scanner.rows
+
+
+def bench_parallel_scan(file_path, scratch):
+    return scan_feed_parallel(file_path, url_report_analyzers())['rows']
+
+
+def bench_stratified_sample(file_path, scratch):
+    scanner = FeedScanner()
+    scanner.register(StratifiedSample())
+    scanner.scan(file_path)
+    return scanner.rows
+
+
+def bench_gallery(file_path, scratch):
+    writer = GalleryWriter(os.path.join(scratch, 'gallery'))
+    scanner = FeedScanner()
+    scanner.register(GalleryFeeder(writer))
+    scanner.scan(file_path)
+    writer.close()
+    return scanner.rows
+
+
+def bench_columnar_build(file_path, scratch):
+    # NumPy paths import lazily so the other benchmarks run without it
+    from .columnar import FeedTable, build_cache
+    path = build_cache(file_path, os.path.join(scratch, 'cache'))
+    return FeedTable.open(path).rows
+
+
+def prepare_repricing(file_path, scratch):
+    from .columnar import load_table
+    load_table(file_path, os.path.join(scratch, 'cache'))
+
+
+def bench_repricing(file_path, scratch):
+    from .columnar import load_table
+    from .repricing import fallback_intervals, reprice
+    table = load_table(file_path, os.path.join(scratch, 'cache'))
+    intervals = {'natural': fallback_intervals(), 'lab': fallback_intervals()}
+    prices = reprice(table, 10.5, intervals)
+    return len(prices['finalPriceSek'])
+
+
+# name -> (run, prepare step excluded from the timing, required module)
+BENCHMARKS = {
+    'url_coverage': (bench_url_coverage, None, None),
+    '3d_extraction': (bench_3d_extraction, None, None),
+    'parallel_scan': (bench_parallel_scan, None, None),
+    'stratified_sample': (bench_stratified_sample, None, None),
+    'gallery': (bench_gallery, None, None),
+    'columnar_build': (bench_columnar_build, None, 'numpy'),
+    'repricing': (bench_repricing, prepare_repricing, 'numpy'),
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(max(own, children) / scale, 1)
+
+
+def run_one(name, file_path, scratch):
+    """Child process entry point: prepare, time one run, measure memory"""
+    run, prepare, _ = BENCHMARKS[name]
+    if prepare:
+        prepare(file_path, scratch)
+    started = time.perf_counter()
+    rows = run(file_path, scratch)
+    seconds = time.perf_counter() - started
+    return {'seconds': seconds, 'rows': rows, 'peak_rss_mb': peak_rss_mb()}
+
+
+def run_benchmark(name, file_path, repeat=1):
+    """Best of `repeat` runs, each in a fresh process and scratch directory"""
+    size_mb = os.path.getsize(file_path) / (1024 * 1024)
+    best = None
+    context = get_context('spawn')
+    for _ in range(repeat):
+        scratch = tempfile.mkdtemp(prefix='idex-bench-')
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_one, name, file_path, scratch).result()
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    seconds = best['seconds']
+    return {
+        'benchmark': name,
+        'feed': os.path.basename(file_path),
+        'rows': best['rows'],
+        'seconds': round(seconds, 3),
+        'rows_per_s': round(best['rows'] / seconds) if seconds else None,
+        'mb_per_s': round(size_mb / seconds, 1) if seconds else None,
+        'peak_rss_mb': best['peak_rss_mb'],
+    }
+
+
+def available(name):
+    required = BENCHMARKS[name][2]
+    return required is None or importlib.util.find_spec(required) is not None
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Benchmarks whose rows/s fell more than `tolerance` below the baseline"""
+    previous = {(r['benchmark'], r['feed']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get((result['benchmark'], result['feed']))
+        if not before or not before.get('rows_per_s') or not result['rows_per_s']:
+            continue
+        change = result['rows_per_s'] / before['rows_per_s'] - 1
+        if change < -tolerance:
+            regressions.append({
+                'benchmark': result['benchmark'],
+                'feed': result['feed'],
+                'baseline_rows_per_s': before['rows_per_s'],
+                'rows_per_s': result['rows_per_s'],
+                'change': round(change, 3),
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the feed analysis tools')
+    parser.add_argument('feeds', nargs='*', help='Feed .csv or .zip files')
+    parser.add_argument('--generate', type=int, metavar='ROWS',
+                        help='Benchmark synthetic natural and lab feeds of this many rows')
+    parser.add_argument('--data-dir', default='synthetic-feeds', help='Where generated feeds are kept')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='Run only these benchmarks')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per benchmark, best one is kept')
+    parser.add_argument('--baseline', help='Previous report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Allowed rows/s drop against the baseline (fraction)')
+    parser.add_argument('--out', default='bench-report.json')
+    args = parser.parse_args()
+
+    feeds = [resolve_feed(f) for f in args.feeds]
+    if args.generate:
+        for diamond_type in ('natural', 'lab'):
+            name = default_name(diamond_type).replace('synthetic', f'synthetic_{args.generate}')
+            path = os.path.join(args.data_dir, name)
+            if not os.path.exists(path):
+                print(f"Generating {args.generate:,} {diamond_type} rows...")
+                write_feed(path, diamond_type, args.generate)
+            feeds.append(path)
+    if not feeds:
+        parser.error('give feed files or --generate ROWS')
+
+    names = [n for n in (args.only or BENCHMARKS) if available(n)]
+    skipped = [n for n in (args.only or BENCHMARKS) if not available(n)]
+    if skipped:
+        print(f"Skipping (missing dependencies): {', '.join(skipped)}")
+
+    results = []
+    print(f"{'benchmark':<20}{'feed':<44}{'rows/s':>12}{'MB/s':>9}{'peak MB':>10}")
+    for file_path in feeds:
+        for name in names:
+            result = run_benchmark(name, file_path, args.repeat)
+            results.append(result)
+            print(f"{name:<20}{result['feed'][:42]:<44}{result['rows_per_s']:>12,}"
+                  f"{result['mb_per_s']:>9}{result['peak_rss_mb']:>10}")
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved to: {args.out}")
+
+    if regressions:
+        print(f"\n{len(regressions)} throughput regression(s):")
+        for r in regressions:
+            print(f"  {r['benchmark']} on {r['feed']}: {r['baseline_rows_per_s']:,} -> "
+                  f"{r['rows_per_s']:,} rows/s ({r['change']:+.0%})")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
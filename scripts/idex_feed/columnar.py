@@ -0,0 +1,342 @@
+"""Columnar, dictionary-encoded cache of parsed feed snapshots.
+
+A snapshot is parsed once into NumPy arrays and written to a directory
+named after the source file's content hash:
+
+- numeric fields (Carat, Total Price, measurements, ...) as float64, NaN when empty
+- categorical fields (Cut, Color, Clarity, Grading Lab, ...) as integer codes
+  plus a label dictionary, code 0 being the empty string
+- everything else (IDs, certificate numbers, URLs) as one UTF-8 byte blob
+  with int64 row offsets
+
+Later runs memory-map the arrays instead of re-parsing the CSV.
+
+Requires numpy.
+"""
+import json
+import os
+import shutil
+import sys
+from array import array
+
+import numpy as np
+
+from .headers import CATEGORICAL_FIELDS, NUMERIC_FIELDS
+from .scan import Analyzer, FeedScanner
+from .sources import content_hash, default_cache_root, resolve_feed
+
+CACHE_VERSION = 1
+
+
+def field_kind(field):
+    if field in NUMERIC_FIELDS:
+        return 'numeric'
+    if field in CATEGORICAL_FIELDS:
+        return 'categorical'
+    return 'string'
+
+
+def parse_float(value):
+    """parseFloat() for a single cell; NaN when it doesn't hold a number"""
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+
+class ColumnCollector(Analyzer):
+    """Accumulates every mapped field into compact typed buffers"""
+
+    name = 'columns'
+
+    def bind(self, schema):
+        self.fields = tuple(schema.index)
+        super().bind(schema)
+        self.kinds = [field_kind(f) for f in self.fields]
+        self.buffers = []
+        for kind in self.kinds:
+            if kind == 'numeric':
+                self.buffers.append(array('d'))
+            elif kind == 'categorical':
+                self.buffers.append((array('i'), {'': 0}))
+            else:
+                self.buffers.append((bytearray(), array('q', [0])))
+        self.rows = 0
+
+    def process(self, row):
+        for kind, buffer, value in zip(self.kinds, self.buffers, self.get(row)):
+            value = value.strip()
+            if kind == 'numeric':
+                buffer.append(parse_float(value) if value else float('nan'))
+            elif kind == 'categorical':
+                codes, labels = buffer
+                code = labels.get(value)
+                if code is None:
+                    code = labels[value] = len(labels)
+                codes.append(code)
+            else:
+                data, offsets = buffer
+                data += value.encode('utf-8')
+                offsets.append(len(data))
+        self.rows += 1
+
+    def result(self):
+        return self.rows
+
+
+def build_cache(file_path, cache_root=None, source_hash=None):
+    """Parse a feed into a columnar cache directory and return its path"""
+    file_path = resolve_feed(file_path)
+    cache_root = cache_root or default_cache_root(file_path)
+    source_hash = source_hash or content_hash(file_path, cache_root)
+    target = os.path.join(cache_root, source_hash)
+
+    scanner = FeedScanner()
+    collector = scanner.register(ColumnCollector())
+    scanner.scan(file_path)
+
+    # Written to a scratch directory first so readers never see half a cache
+    scratch = target + '.partial'
+    shutil.rmtree(scratch, ignore_errors=True)
+    os.makedirs(scratch)
+
+    columns = {}
+    for field, kind, buffer in zip(collector.fields, collector.kinds, collector.buffers):
+        if kind == 'numeric':
+            np.save(os.path.join(scratch, f'{field}.npy'), np.frombuffer(buffer, dtype=np.float64))
+            columns[field] = {'kind': kind}
+        elif kind == 'categorical':
+            codes, labels = buffer
+            dtype = np.uint8 if len(labels) <= 256 else np.uint16 if len(labels) <= 65536 else np.int32
+            np.save(os.path.join(scratch, f'{field}.npy'),
+                    np.frombuffer(codes, dtype=np.int32).astype(dtype))
+            columns[field] = {'kind': kind, 'labels': list(labels)}
+        else:
+            data, offsets = buffer
+            np.save(os.path.join(scratch, f'{field}.data.npy'), np.frombuffer(bytes(data), dtype=np.uint8))
+            np.save(os.path.join(scratch, f'{field}.offsets.npy'), np.frombuffer(offsets, dtype=np.int64))
+            columns[field] = {'kind': kind}
+
+    meta = {
+        'version': CACHE_VERSION,
+        'source': os.path.basename(file_path),
+        'source_hash': source_hash,
+        'diamond_type': scanner.schema.diamond_type,
+        'rows': collector.rows,
+        'columns': columns,
+    }
+    with open(os.path.join(scratch, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(scratch, target)
+    return target
+
+
+def load_table(file_path, cache_root=None, source_hash=None):
+    """Memory-map the cache for a feed, building it first if needed"""
+    file_path = resolve_feed(file_path)
+    cache_root = cache_root or default_cache_root(file_path)
+    source_hash = source_hash or content_hash(file_path, cache_root)
+    target = os.path.join(cache_root, source_hash)
+    meta_path = os.path.join(target, 'meta.json')
+
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') == CACHE_VERSION:
+            return FeedTable(target, meta)
+
+    build_cache(file_path, cache_root, source_hash)
+    return FeedTable.open(target)
+
+
+class StringColumn:
+    """Lazily decoded view over a blob + offsets string column"""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.data[start:end].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def startswith(self, prefix):
+        """Boolean mask of rows whose value starts with an ASCII prefix"""
+        prefix = np.frombuffer(prefix.encode('ascii'), dtype=np.uint8)
+        starts = self.offsets[:-1]
+        mask = self.lengths() >= len(prefix)
+        rows = np.nonzero(mask)[0]
+        for i, byte in enumerate(prefix):
+            hit = self.data[starts[rows] + i] == byte
+            rows = rows[hit]
+        out = np.zeros(len(self), dtype=bool)
+        out[rows] = True
+        return out
+
+    def contains(self, needle, ignore_case=False):
+        """Boolean mask of rows whose value contains an ASCII substring"""
+        data = np.asarray(self.data)
+        if ignore_case:
+            needle = needle.upper()
+            lower = (data >= 97) & (data <= 122)
+            data = np.where(lower, data - 32, data).astype(np.uint8)
+        needle = np.frombuffer(needle.encode('ascii'), dtype=np.uint8)
+        span = len(data) - len(needle) + 1
+        if span <= 0:
+            return np.zeros(len(self), dtype=bool)
+        hits = data[:span] == needle[0]
+        for i in range(1, len(needle)):
+            hits &= data[i:i + span] == needle[i]
+        starts = np.nonzero(hits)[0]
+        rows = np.searchsorted(self.offsets, starts, side='right') - 1
+        # Drop matches that run past the end of their row
+        inside = starts + len(needle) <= np.asarray(self.offsets)[rows + 1]
+        out = np.zeros(len(self), dtype=bool)
+        out[rows[inside]] = True
+        return out
+
+
+class FeedTable:
+    """Read-only, memory-mapped columns of one feed snapshot"""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.rows = meta['rows']
+        self.diamond_type = meta['diamond_type']
+        self.columns = meta['columns']
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            return cls(path, json.load(f))
+
+    def has(self, field):
+        return field in self.columns
+
+    def load(self, name):
+        return np.load(os.path.join(self.path, name), mmap_mode='r')
+
+    def numeric(self, field):
+        """float64 values, NaN where the feed cell was empty"""
+        if not self.has(field):
+            return np.full(self.rows, np.nan)
+        return self.load(f'{field}.npy')
+
+    def codes(self, field):
+        if not self.has(field):
+            return np.zeros(self.rows, dtype=np.uint8)
+        return self.load(f'{field}.npy')
+
+    def labels(self, field):
+        if not self.has(field):
+            return ['']
+        return self.columns[field]['labels']
+
+    def categorical(self, field):
+        """Decoded labels per row as a NumPy object array"""
+        return np.asarray(self.labels(field), dtype=object)[self.codes(field)]
+
+    def strings(self, field):
+        if not self.has(field):
+            return StringColumn(np.zeros(0, dtype=np.uint8), np.zeros(self.rows + 1, dtype=np.int64))
+        return StringColumn(self.load(f'{field}.data.npy'), self.load(f'{field}.offsets.npy'))
+
+    def text(self, field, i):
+        """A single cell as text; numbers are re-formatted, '' when empty"""
+        kind = self.columns.get(field, {}).get('kind')
+        if kind == 'numeric':
+            value = float(self.numeric(field)[i])
+            return '' if value != value else repr(value)
+        if kind == 'categorical':
+            return self.labels(field)[self.codes(field)[i]]
+        if kind == 'string':
+            return self.strings(field)[i]
+        return ''
+
+
+def url_coverage(table):
+    """UrlCoverage.result() computed from cached columns"""
+    video = table.strings('videoUrl').startswith('http')
+    viewer = table.strings('threeDViewerUrl').startswith('http')
+    return {
+        'total': table.rows,
+        'with_video': int(video.sum()),
+        'with_3d': int(viewer.sum()),
+        'with_both': int((video & viewer).sum()),
+    }
+
+
+def price_stats(table, field='totalPrice', quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    """Count, min/max, mean and quantiles of a numeric column"""
+    values = np.asarray(table.numeric(field))
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {'count': 0}
+    stats = {
+        'count': int(len(values)),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'mean': float(values.mean()),
+    }
+    for q, value in zip(quantiles, np.quantile(values, quantiles)):
+        stats[f'p{int(q * 100)}'] = float(value)
+    return stats
+
+
+def three_d_rows(table, limit=50, skip=0):
+    """ThreeDExtractor output (first unique 3D URLs) from cached columns"""
+    viewer = table.strings('threeDViewerUrl')
+    rows = np.nonzero(viewer.startswith('http'))[0]
+    seen = set()
+    urls = []
+    for i in rows:
+        url = viewer[i].strip()
+        if url in seen:
+            continue
+        seen.add(url)
+        if len(seen) <= skip:
+            continue
+        urls.append({
+            'url': url,
+            'id': table.text('itemId', i),
+            'type': table.diamond_type,
+            'cut': table.text('cut', i),
+            'carat': table.text('carat', i),
+            'color': table.text('color', i),
+            'clarity': table.text('clarity', i),
+            'price': table.text('totalPrice', i),
+        })
+        if len(urls) >= limit:
+            break
+    return urls
+
+
+def main():
+    """Build (or reuse) the columnar cache for each feed given on the command line"""
+    if len(sys.argv) < 2:
+        print('Usage: python3 -m idex_feed.columnar <feed.csv|feed.zip> [...]')
+        sys.exit(1)
+
+    for file_path in sys.argv[1:]:
+        table = load_table(file_path)
+        print(f"\n{file_path} -> {table.path}")
+        print(f"  Type: {table.diamond_type}, rows: {table.rows:,}")
+        print(f"  URL coverage: {json.dumps(url_coverage(table))}")
+        print(f"  Total price: {json.dumps(price_stats(table))}")
+
+
+if __name__ == '__main__':
+    main()
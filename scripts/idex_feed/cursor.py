@@ -0,0 +1,280 @@
+"""Resumable 3D viewer URL extraction.
+
+A cursor file records where the last extraction stopped in a snapshot:
+
+- the snapshot's identity (size, mtime and content hash)
+- the byte offset just past the last row consumed
+- the dedup state: a Bloom filter over 64-bit URL fingerprints, stored in
+  a `.bloom` file next to the cursor
+
+"Give me the next N" seeks straight to the saved offset and reads only
+as many rows as it takes to find N new URLs, so each batch costs O(N)
+rather than a re-scan from row 0. The filter has a fixed size chosen up
+front from its capacity, so memory stays flat over the full feed. Its
+false-positive rate (1e-6 by default) means a new URL is occasionally
+taken for a repeat and skipped; it never lets a repeat through.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import zipfile
+from contextlib import contextmanager
+
+from .analyzers import ThreeDExtractor, media_url
+from .scan import FeedSchema
+from .sources import BLOCK_BYTES, content_hash, is_zip, resolve_feed, zip_csv_member
+
+CURSOR_VERSION = 1
+DEFAULT_CAPACITY = 1_000_000
+DEFAULT_ERROR_RATE = 1e-6
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter keyed by 64-bit fingerprints"""
+
+    def __init__(self, bits, hashes, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return cls(bits, hashes)
+
+    @staticmethod
+    def fingerprint(key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    def positions(self, fingerprint):
+        # Double hashing: the two 32-bit halves generate all k positions
+        low = fingerprint & 0xFFFFFFFF
+        high = (fingerprint >> 32) | 1
+        return [(low + i * high) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        """Insert a key; returns False when it was (probably) already present"""
+        data = self.data
+        new = False
+        for pos in self.positions(self.fingerprint(key)):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not data[byte] & mask:
+                data[byte] |= mask
+                new = True
+        return new
+
+    def __contains__(self, key):
+        data = self.data
+        return all(data[pos >> 3] & (1 << (pos & 7)) for pos in self.positions(self.fingerprint(key)))
+
+
+def snapshot_identity(file_path):
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class ExtractionCursor:
+    """Position and dedup state of an incremental extraction over one snapshot"""
+
+    def __init__(self, path, state, bloom):
+        self.path = path
+        self.state = state
+        self.bloom = bloom
+
+    @property
+    def bloom_path(self):
+        return os.path.splitext(self.path)[0] + '.bloom'
+
+    @classmethod
+    def open(cls, path, file_path, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        """Load the cursor at `path`, or start a new one at the top of the feed"""
+        identity = snapshot_identity(file_path)
+        if not os.path.exists(path):
+            state = {
+                'version': CURSOR_VERSION,
+                'source': os.path.basename(file_path),
+                **identity,
+                'content_hash': content_hash(file_path),
+                'offset': None,
+                'rows': 0,
+                'extracted': 0,
+            }
+            cursor = cls(path, state, BloomFilter.for_capacity(capacity, error_rate))
+            cursor.state['bloom'] = {'bits': cursor.bloom.bits, 'hashes': cursor.bloom.hashes}
+            return cursor
+
+        with open(path) as f:
+            state = json.load(f)
+        if state.get('version') != CURSOR_VERSION:
+            raise ValueError(f'{path}: unsupported cursor version {state.get("version")}')
+        # Size and mtime are enough to recognise an untouched snapshot; the
+        # full hash is only recomputed when they differ (e.g. after a copy)
+        if {k: state[k] for k in identity} != identity:
+            if content_hash(file_path) != state['content_hash']:
+                raise ValueError(f'{path} belongs to a different snapshot than {file_path}')
+            state.update(identity)
+
+        cursor = cls(path, state, None)
+        with open(cursor.bloom_path, 'rb') as f:
+            cursor.bloom = BloomFilter(state['bloom']['bits'], state['bloom']['hashes'], f.read())
+        return cursor
+
+    def save(self):
+        """Write the cursor and its filter, replacing the old ones atomically"""
+        for target, mode, payload in (
+            (self.bloom_path, 'wb', bytes(self.bloom.data)),
+            (self.path, 'w', json.dumps(self.state, indent=2)),
+        ):
+            scratch = target + '.tmp'
+            with open(scratch, mode) as f:
+                f.write(payload)
+            os.replace(scratch, target)
+
+
+def reset_cursor(cursor_path):
+    """Delete a cursor and its filter so the next extraction starts from the top"""
+    for path in (cursor_path, os.path.splitext(cursor_path)[0] + '.bloom'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def iter_lines_from(stream, offset, block_bytes=BLOCK_BYTES):
+    """Yield (decoded line, byte offset after it) from a binary stream positioned at `offset`"""
+    pending = b''
+    while True:
+        block = stream.read(block_bytes)
+        if not block:
+            break
+        lines = (pending + block).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            offset += len(line) + 1
+            yield line.decode('utf-8'), offset
+    if pending:
+        yield pending.decode('utf-8'), offset + len(pending)
+
+
+class OffsetLines:
+    """Line iterator for csv.reader that remembers the offset after the last line read"""
+
+    def __init__(self, lines, offset):
+        self.lines = lines
+        self.offset = offset
+
+    def __iter__(self):
+        for line, offset in self.lines:
+            self.offset = offset
+            yield line
+
+
+@contextmanager
+def open_binary(file_path):
+    """Seekable binary stream over the feed CSV (inside its zip when zipped)"""
+    if is_zip(file_path):
+        with zipfile.ZipFile(file_path) as archive:
+            # Zip members only decompress forwards: seeking to the offset still
+            # inflates the skipped bytes, but they are never parsed
+            with archive.open(zip_csv_member(archive)) as member:
+                yield member
+    else:
+        with open(file_path, 'rb') as f:
+            yield f
+
+
+def read_batch(stream, offset, schema, bloom, limit):
+    """Read rows from `offset` until `limit` new 3D URLs are found.
+
+    Returns (items, offset after the last row read, rows read).
+    """
+    stream.seek(offset)
+    lines = OffsetLines(iter_lines_from(stream, offset), offset)
+    pad = schema.pad
+    get = schema.extractor(ThreeDExtractor.fields)
+    found = []
+    rows = 0
+
+    for row in csv.reader(lines):
+        rows += 1
+        if not row:
+            continue
+        pad(row)
+        values = get(row)
+        url = media_url(values[6])
+        if not url or not bloom.add(url):
+            continue
+        item_id, cut, carat, color, clarity, price = values[:6]
+        found.append({
+            'url': url,
+            'id': item_id,
+            'type': schema.diamond_type,
+            'cut': cut,
+            'carat': carat,
+            'color': color,
+            'clarity': clarity,
+            'price': price,
+        })
+        if len(found) >= limit:
+            break
+
+    return found, lines.offset, rows
+
+
+def extract_next(file_path, cursor_path, limit=50, diamond_type=None,
+                 capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+    """Return the next `limit` unique 3D viewer URLs after the saved cursor.
+
+    The cursor is created on the first call and saved after every batch.
+    Returns (items, cursor state); fewer than `limit` items means the end
+    of the feed was reached.
+    """
+    file_path = resolve_feed(file_path)
+    cursor = ExtractionCursor.open(cursor_path, file_path, capacity, error_rate)
+    state = cursor.state
+
+    with open_binary(file_path) as stream:
+        header_line = stream.readline()
+        header = next(csv.reader([header_line.decode('utf-8-sig')]))
+        schema = FeedSchema(header, diamond_type)
+        offset = state['offset'] if state['offset'] is not None else len(header_line)
+        found, offset, rows = read_batch(stream, offset, schema, cursor.bloom, limit)
+
+    state['offset'] = offset
+    state['rows'] += rows
+    state['extracted'] += len(found)
+    cursor.save()
+    return found, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract the next batch of unique 3D viewer URLs from a feed')
+    parser.add_argument('feed', help='Feed .csv or .zip')
+    parser.add_argument('--cursor', help='Cursor file (default: <feed>.3d-cursor.json)')
+    parser.add_argument('--next', type=int, default=50, dest='limit', help='Number of new URLs to extract')
+    parser.add_argument('--type', choices=('natural', 'lab'), help='Diamond type (default: from the header)')
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY,
+                        help='Expected unique URLs, sizes the dedup filter of a new cursor')
+    parser.add_argument('--reset', action='store_true', help='Discard the cursor and start from the top')
+    parser.add_argument('--out', default='next_3d_urls.json')
+    args = parser.parse_args()
+
+    cursor_path = args.cursor or os.path.splitext(args.feed)[0] + '.3d-cursor.json'
+    if args.reset:
+        reset_cursor(cursor_path)
+
+    found, state = extract_next(args.feed, cursor_path, args.limit, args.type, args.capacity)
+    with open(args.out, 'w') as f:
+        json.dump(found, f, indent=2)
+    print(f"Extracted {len(found)} new 3D URLs ({state['extracted']:,} so far, "
+          f"{state['rows']:,} rows read, offset {state['offset']:,})")
+    if len(found) < args.limit:
+        print("Reached the end of the feed")
+    print(f"Saved to: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Snapshot-to-snapshot deltas keyed by Item ID.
+
+Each row is fingerprinted (64-bit BLAKE2b of the raw line) under its
+Item ID, and the two snapshots are compared to produce:
+
+- inserts.csv.gz  rows whose Item ID is new
+- updates.csv.gz  rows whose content changed
+- deletes.txt     Item IDs that disappeared
+- summary.json    counts
+
+Inserts and updates keep the feed's own header and line format, so they
+can go through the importer's parser unchanged. An Item ID listed more
+than once counts with its last row on both sides, like the loader's
+upsert. When the ID maps would not fit the memory budget, both feeds are
+first spilled into partitions by ID hash and each partition pair is
+compared on its own.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+import zlib
+
+from .parallel import read_header
+from .scan import FeedSchema
+from .sources import open_feed, resolve_feed
+
+# Rough in-memory cost of one ID -> fingerprint entry in a dict
+BYTES_PER_ENTRY = 160
+# The same for the new side's ID -> raw line map
+BYTES_PER_LINE = 1024
+DEFAULT_MEMORY_MB = 512
+
+
+def fingerprint(line):
+    return hashlib.blake2b(line.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def feed_lines(file_path):
+    """Yield (item_id, line) for each data row, splitting on ',' like the importer"""
+    header, _ = read_header(file_path)
+    id_col = FeedSchema(header).column('itemId')
+    with open_feed(file_path) as lines:
+        lines = iter(lines)
+        next(lines)
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            cells = line.split(',', id_col + 1)
+            if len(cells) > id_col:
+                item_id = cells[id_col].strip()
+                if item_id:
+                    yield item_id, line
+
+
+def estimate_rows(file_path):
+    """Upper-bound-ish row count from file size, used to size partitions"""
+    with open_feed(file_path) as lines:
+        sample = []
+        for line in lines:
+            sample.append(len(line.encode('utf-8')))
+            if len(sample) >= 1000:
+                break
+    average = max(1, sum(sample) / max(1, len(sample)))
+    size = os.path.getsize(file_path)
+    if file_path.lower().endswith('.zip'):
+        # IDEX CSVs compress roughly 8:1
+        size *= 8
+    return int(size / average) + 1
+
+
+class DeltaWriter:
+    """Writes the insert/update/delete outputs of one comparison"""
+
+    def __init__(self, out_dir, header_line):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.inserts = gzip.open(os.path.join(out_dir, 'inserts.csv.gz'), 'wt', encoding='utf-8', newline='')
+        self.updates = gzip.open(os.path.join(out_dir, 'updates.csv.gz'), 'wt', encoding='utf-8', newline='')
+        self.deletes = open(os.path.join(out_dir, 'deletes.txt'), 'w', encoding='utf-8')
+        self.inserts.write(header_line + '\n')
+        self.updates.write(header_line + '\n')
+        self.counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+
+    def insert(self, line):
+        self.inserts.write(line + '\n')
+        self.counts['inserted'] += 1
+
+    def update(self, line):
+        self.updates.write(line + '\n')
+        self.counts['updated'] += 1
+
+    def delete(self, item_id):
+        self.deletes.write(item_id + '\n')
+        self.counts['deleted'] += 1
+
+    def unchanged(self):
+        self.counts['unchanged'] += 1
+
+    def close(self, summary):
+        self.inserts.close()
+        self.updates.close()
+        self.deletes.close()
+        summary = {**summary, **self.counts}
+        with open(os.path.join(self.out_dir, 'summary.json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+def last_rows(rows):
+    """(item_id, line) with only the last line of each Item ID"""
+    return dict(rows).items()
+
+
+def compare(old_fingerprints, new_rows, writer):
+    """Diff one (partition of a) snapshot pair; consumes old_fingerprints"""
+    for item_id, line in last_rows(new_rows):
+        old = old_fingerprints.pop(item_id, None)
+        if old is None:
+            writer.insert(line)
+        elif old != fingerprint(line):
+            writer.update(line)
+        else:
+            writer.unchanged()
+    for item_id in old_fingerprints:
+        writer.delete(item_id)
+
+
+def partition_of(item_id, partitions):
+    return zlib.crc32(item_id.encode('utf-8')) % partitions
+
+
+def spill(rows, partitions, scratch, prefix, keep_line):
+    """Write rows into per-partition files; returns their paths"""
+    paths = [os.path.join(scratch, f'{prefix}-{p:04d}.tsv') for p in range(partitions)]
+    files = [open(path, 'w', encoding='utf-8') for path in paths]
+    try:
+        for item_id, line in rows:
+            out = files[partition_of(item_id, partitions)]
+            if keep_line:
+                out.write(f'{item_id}\t{line}\n')
+            else:
+                out.write(f'{item_id}\t{fingerprint(line)}\n')
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def read_spilled(path):
+    with open(path, encoding='utf-8') as f:
+        for entry in f:
+            item_id, rest = entry.rstrip('\n').split('\t', 1)
+            yield item_id, rest
+
+
+def compute_delta(old_path, new_path, out_dir, memory_mb=DEFAULT_MEMORY_MB, partitions=None):
+    """Compare two snapshots and write inserts/updates/deletes to out_dir"""
+    old_path = resolve_feed(old_path)
+    new_path = resolve_feed(new_path)
+    old_header, _ = read_header(old_path)
+    new_header, _ = read_header(new_path)
+    if FeedSchema(old_header).diamond_type != FeedSchema(new_header).diamond_type:
+        raise ValueError('Snapshots are of different diamond types')
+
+    if partitions is None:
+        needed = estimate_rows(old_path) * BYTES_PER_ENTRY + estimate_rows(new_path) * BYTES_PER_LINE
+        partitions = max(1, math.ceil(needed / (memory_mb * 1024 * 1024)))
+
+    writer = DeltaWriter(out_dir, ','.join(new_header))
+    summary = {
+        'old': os.path.basename(old_path),
+        'new': os.path.basename(new_path),
+        'partitions': partitions,
+        'header_changed': old_header != new_header,
+    }
+
+    if partitions == 1:
+        old = {item_id: fingerprint(line) for item_id, line in feed_lines(old_path)}
+        compare(old, feed_lines(new_path), writer)
+        return writer.close(summary)
+
+    scratch = tempfile.mkdtemp(prefix='idex-delta-', dir=out_dir)
+    try:
+        old_parts = spill(feed_lines(old_path), partitions, scratch, 'old', keep_line=False)
+        new_parts = spill(feed_lines(new_path), partitions, scratch, 'new', keep_line=True)
+        for old_part, new_part in zip(old_parts, new_parts):
+            old = dict(read_spilled(old_part))
+            compare(old, read_spilled(new_part), writer)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return writer.close(summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute the delta between two IDEX feed snapshots')
+    parser.add_argument('old', help='Previous snapshot (.csv or .zip)')
+    parser.add_argument('new', help='Current snapshot (.csv or .zip)')
+    parser.add_argument('--out', default='feed-delta', help='Output directory')
+    parser.add_argument('--memory-mb', type=int, default=DEFAULT_MEMORY_MB,
+                        help='Memory budget for the in-memory ID map')
+    parser.add_argument('--partitions', type=int, help='Force a partition count')
+    args = parser.parse_args()
+
+    summary = compute_delta(args.old, args.new, args.out, args.memory_mb, args.partitions)
+    print(json.dumps(summary, indent=2))
+    print(f"Saved to: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
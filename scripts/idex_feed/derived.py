@@ -0,0 +1,253 @@
+"""Derived attribute columns computed once per snapshot.
+
+getFilteredDiamonds() filters graded ranges, shape and L/W ratio on
+numeric columns instead of label lists (`clarity IN ('VS2', 'VS1', ...)`)
+and case-insensitive shape matches. This stage computes those columns for
+the whole feed at once:
+
+- colourOrdinal, clarityOrdinal, cutGradeOrdinal, polishOrdinal,
+  symmetryOrdinal, fluorescenceOrdinal, fancyIntensityOrdinal: position in
+  the storefront filter's label order, -1 when the stored value is
+  not on that scale. A label range filter becomes `min <= ordinal <= max`
+  and selects exactly the rows the label list does (colour is -1 for fancy
+  stones, which the colour filter excludes).
+- ratio: measurementsLength / measurementsWidth, NaN when either is missing
+- shapeCode: canonical shape (see SHAPES), case and variant insensitive
+  ('ROUND', 'Round Brilliant' and 'round' are all round), 0 for other shapes
+- fluorescenceBucket: fluorescence normalised across spellings ('Negligible',
+  'Med', 'VST', ...) onto the five storefront steps, -1 when unknown
+
+Every column is computed per dictionary label and then gathered through
+the categorical codes, so the cost is one table lookup per row. Columns
+are stored as .npy files under `derived/` in the snapshot's columnar cache.
+
+The TS importers compute the same values per row in
+app/services/diamond-derived.server.ts; keep the scales and aliases in sync.
+
+Requires numpy.
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .columnar import load_table
+
+DERIVED_VERSION = 1
+DERIVED_DIR = 'derived'
+
+# Label orders used by getFilteredDiamonds()
+COLOUR_LABELS = ['K', 'J', 'I', 'H', 'G', 'F', 'E', 'D']
+CLARITY_LABELS = ['SI2', 'SI1', 'VS2', 'VS1', 'VVS2', 'VVS1', 'IF', 'FL']
+GRADE_LABELS = ['Good', 'Very Good', 'Excellent']
+FLUORESCENCE_LABELS = ['None', 'Faint', 'Medium', 'Strong', 'Very Strong']
+INTENSITY_LABELS = ['Light', 'Fancy', 'Intense', 'Vivid', 'Deep', 'Dark']
+INTENSITY_VALUES = {
+    'Light': ['Light', 'Very Light', 'Faint', 'Fancy Light'],
+    'Fancy': ['Fancy'],
+    'Intense': ['Intense'],
+    'Vivid': ['Vivid'],
+    'Deep': ['Fancy Deep'],
+    'Dark': ['Fancy Dark'],
+}
+
+# Ordinal column -> (feed field, label order)
+ORDINALS = {
+    'colourOrdinal': ('color', COLOUR_LABELS),
+    'clarityOrdinal': ('clarity', CLARITY_LABELS),
+    'cutGradeOrdinal': ('cutGrade', GRADE_LABELS),
+    'polishOrdinal': ('polish', GRADE_LABELS),
+    'symmetryOrdinal': ('symmetry', GRADE_LABELS),
+    'fluorescenceOrdinal': ('fluorescenceIntensity', FLUORESCENCE_LABELS),
+}
+
+# Column name -> PostgreSQL type, in the order they are added to "Diamond"
+DERIVED_COLUMNS = {
+    'colourOrdinal': 'integer',
+    'clarityOrdinal': 'integer',
+    'cutGradeOrdinal': 'integer',
+    'polishOrdinal': 'integer',
+    'symmetryOrdinal': 'integer',
+    'fluorescenceOrdinal': 'integer',
+    'fancyIntensityOrdinal': 'integer',
+    'isFancy': 'boolean',
+    'ratio': 'double precision',
+    'shapeCode': 'integer',
+    'fluorescenceBucket': 'integer',
+}
+
+# shapeCode values; index 0 collects everything else
+SHAPES = ['other', 'round', 'oval', 'princess', 'cushion', 'emerald', 'pear', 'radiant',
+          'marquise', 'heart', 'asscher', 'baguette', 'trillion']
+SHAPE_ALIASES = {
+    'br': 'round', 'rb': 'round', 'rd': 'round', 'rbc': 'round',
+    'ov': 'oval', 'pr': 'princess', 'cu': 'cushion', 'cb': 'cushion', 'cmb': 'cushion',
+    'em': 'emerald', 'ps': 'pear', 'pe': 'pear', 'ra': 'radiant', 'mq': 'marquise',
+    'ma': 'marquise', 'hs': 'heart', 'ht': 'heart', 'as': 'asscher', 'ba': 'baguette',
+    'trilliant': 'trillion', 'triangle': 'trillion',
+}
+FLUORESCENCE_ALIASES = {
+    'none': 'None', 'non': 'None', 'nil': 'None', 'n': 'None', 'negligible': 'None',
+    'faint': 'Faint', 'fnt': 'Faint', 'f': 'Faint', 'slight': 'Faint', 'sl': 'Faint',
+    'very slight': 'Faint', 'vsl': 'Faint',
+    'medium': 'Medium', 'med': 'Medium', 'm': 'Medium', 'moderate': 'Medium',
+    'strong': 'Strong', 'stg': 'Strong', 'strg': 'Strong', 's': 'Strong',
+    'very strong': 'Very Strong', 'vst': 'Very Strong', 'vstg': 'Very Strong', 'vs': 'Very Strong',
+}
+
+
+def label_lookup(labels, value_of):
+    """int8 array mapping each categorical code to value_of(label)"""
+    return np.array([value_of(label) for label in labels], dtype=np.int8)
+
+
+def scale_position(scale):
+    positions = {label: i for i, label in enumerate(scale)}
+    return lambda label: positions.get(label.strip(), -1)
+
+
+def normalise_shape(label):
+    """Canonical shape name for a Cut value, 'other' when unrecognised"""
+    value = ' '.join(label.lower().replace('-', ' ').replace('.', ' ').split())
+    if value in SHAPE_ALIASES:
+        return SHAPE_ALIASES[value]
+    # 'Cushion Modified Brilliant', 'Square Emerald', 'Long Radiant', ...
+    for shape in SHAPES[1:]:
+        if shape in value.split():
+            return shape
+    return 'other'
+
+
+def shape_key(label):
+    """What the storefront's shape filter matches a Cut value (or a shape filter) by:
+    the canonical shape, or the lower-cased value for shapes without a code"""
+    shape = normalise_shape(label)
+    return shape if shape != 'other' else label.strip().lower()
+
+
+def fluorescence_bucket(label):
+    value = ' '.join(label.lower().replace('-', ' ').split())
+    bucket = FLUORESCENCE_ALIASES.get(value)
+    return FLUORESCENCE_LABELS.index(bucket) if bucket else -1
+
+
+def intensity_position(label):
+    label = label.strip()
+    for i, simple in enumerate(INTENSITY_LABELS):
+        if label in INTENSITY_VALUES[simple]:
+            return i
+    return -1
+
+
+def ratio_column(table):
+    length = np.asarray(table.numeric('measurementsLength'))
+    width = np.asarray(table.numeric('measurementsWidth'))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = length / width
+    ratio[~np.isfinite(ratio) | (ratio <= 0)] = np.nan
+    return ratio
+
+
+def compute_derived(table):
+    """All derived columns of a FeedTable as {name: array}"""
+    def gather(field, value_of):
+        return label_lookup(table.labels(field), value_of)[np.asarray(table.codes(field))]
+
+    columns = {name: gather(field, scale_position(scale)) for name, (field, scale) in ORDINALS.items()}
+    # The colour filter only ever matches stones without a fancy colour
+    is_fancy = gather('naturalFancyColor', lambda label: 1 if label.strip() else 0).astype(bool)
+    columns['colourOrdinal'][is_fancy] = -1
+    columns['isFancy'] = is_fancy
+    columns['fancyIntensityOrdinal'] = gather('naturalFancyColorIntensity', intensity_position)
+    columns['ratio'] = ratio_column(table)
+    columns['shapeCode'] = gather('cut', lambda label: SHAPES.index(normalise_shape(label))).astype(np.uint8)
+    columns['fluorescenceBucket'] = gather('fluorescenceIntensity', fluorescence_bucket)
+    return columns
+
+
+def derived_path(table):
+    return os.path.join(table.path, DERIVED_DIR)
+
+
+def load_derived(file_path):
+    """Derived columns of a feed, computed and saved next to its columnar cache on first use"""
+    table = load_table(file_path)
+    path = derived_path(table)
+    meta_path = os.path.join(path, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') == DERIVED_VERSION:
+            return table, {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+                           for name in meta['columns']}
+
+    columns = compute_derived(table)
+    scratch = path + '.partial'
+    shutil.rmtree(scratch, ignore_errors=True)
+    os.makedirs(scratch)
+    for name, values in columns.items():
+        np.save(os.path.join(scratch, f'{name}.npy'), values)
+    with open(os.path.join(scratch, 'meta.json'), 'w') as f:
+        json.dump({'version': DERIVED_VERSION, 'columns': list(columns), 'shapes': SHAPES,
+                   'fluorescence': FLUORESCENCE_LABELS}, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(scratch, path)
+    return table, columns
+
+
+def write_csv(table, columns, out):
+    """itemId plus every derived column, one row per diamond"""
+    names = list(columns)
+    item_ids = table.strings('itemId')
+    values = [np.asarray(columns[name]).tolist() for name in names]
+    with open(out, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['itemId'] + names)
+        for i, row in enumerate(zip(*values)):
+            writer.writerow([item_ids[i]] + ['' if v != v else int(v) if isinstance(v, bool) else v
+                                             for v in row])
+
+
+def summarize(columns):
+    out = {}
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if name == 'ratio':
+            known = values[~np.isnan(values)]
+            out[name] = {'known': int(len(known)),
+                         'median': round(float(np.median(known)), 3) if len(known) else None}
+        elif name == 'shapeCode':
+            counts = np.bincount(values, minlength=len(SHAPES))
+            out[name] = {SHAPES[i]: int(c) for i, c in enumerate(counts) if c}
+        else:
+            levels, counts = np.unique(values, return_counts=True)
+            out[name] = {str(int(level)): int(count) for level, count in zip(levels, counts)}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute derived ordinal, ratio and shape columns for IDEX feeds')
+    parser.add_argument('feeds', nargs='+', help='Feed .csv or .zip files')
+    parser.add_argument('--csv', help='Also write itemId + derived columns as CSV (first feed only)')
+    parser.add_argument('--out', default='derived-summary.json')
+    args = parser.parse_args()
+
+    summary = {}
+    for i, feed in enumerate(args.feeds):
+        table, columns = load_derived(feed)
+        summary[os.path.basename(feed)] = summarize(columns)
+        print(f"{os.path.basename(feed)}: {table.rows:,} rows, derived columns in {derived_path(table)}")
+        if args.csv and i == 0:
+            write_csv(table, columns, args.csv)
+            print(f"Saved to: {args.csv}")
+
+    with open(args.out, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Saved to: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""Cross-feed duplicate listings, matched by grading lab and certificate.
+
+The same stone is often listed by several suppliers, or in both the
+natural and the LgSingles feed, under different Item IDs. Every row with
+a certificate gets a key of normalised lab + certificate number
+('G.I.A.' / '  gia' -> 'GIA', '1234-567 ' -> '1234567'), and the feeds
+are hash-joined on that key. A relisted Item ID is first reduced to its
+last listing (across feeds, in feed order), like the loader's upsert, so
+an ID never clusters with itself:
+
+- all feeds fit the memory budget: one dict of Item ID -> last listing,
+  then one dict of key -> first listing
+- otherwise the rows are spilled into partitions by Item ID hash, reduced
+  per partition, spilled again by key hash, and each key partition is
+  joined on its own, so memory holds one partition
+
+Each key with more than one listing is a cluster. The cheapest listing
+(lowest Total Price, then feed order, then Item ID) is kept; the others
+are written to duplicate-ids.csv, which `idex_feed.loader --quarantine`
+accepts to keep them out of the Diamond table. Type follows the importer:
+a row is lab-grown when it comes from the lab feed or its certificate
+number contains "LG".
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+
+from .delta import DEFAULT_MEMORY_MB, estimate_rows, partition_of
+from .parallel import read_header
+from .scan import FeedSchema
+from .sources import open_feed, resolve_feed
+
+# Rough in-memory cost of one key -> listing entry in a dict
+BYTES_PER_ENTRY = 240
+FIELDS = ('itemId', 'gradingLab', 'certificateNumber', 'totalPrice')
+NOT_ALPHANUMERIC = re.compile(r'[^0-9A-Z]+')
+LAB_ALIASES = {
+    'GIAUSA': 'GIA',
+    'HRDANTWERP': 'HRD',
+    'IGIANTWERP': 'IGI', 'IGIUSA': 'IGI', 'IGINEWYORK': 'IGI',
+    'GCALUSA': 'GCAL',
+}
+PLACEHOLDERS = {'', 'NA', 'NONE', 'NIL', 'NULL', 'TBA', 'TBC', 'PENDING'}
+
+
+def normalise_lab(value):
+    lab = NOT_ALPHANUMERIC.sub('', value.upper())
+    return LAB_ALIASES.get(lab, lab)
+
+
+def normalise_certificate(value):
+    number = NOT_ALPHANUMERIC.sub('', value.upper())
+    if number in PLACEHOLDERS or not number.strip('0'):
+        return ''
+    return number
+
+
+def certificate_key(lab, certificate):
+    """'LAB:NUMBER', or None when the row has no usable certificate number"""
+    number = normalise_certificate(certificate)
+    if not number:
+        return None
+    return f'{normalise_lab(lab)}:{number}'
+
+
+def parse_price(value):
+    try:
+        price = float(value)
+    except ValueError:
+        return math.inf
+    return price if price > 0 else math.inf
+
+
+def certificate_rows(file_path, feed):
+    """Yield (key, listing) for each row with a certificate; a listing is
+    (price, feed index, item ID, lab, certificate number, type)"""
+    header, _ = read_header(file_path)
+    schema = FeedSchema(header)
+    get = schema.extractor(FIELDS)
+    with open_feed(file_path) as lines:
+        lines = iter(lines)
+        next(lines)
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            # Split on ',' like the importer does
+            item_id, lab, certificate, price = get(schema.pad(line.split(',')))
+            item_id = item_id.strip()
+            key = certificate_key(lab, certificate)
+            if not item_id or key is None:
+                continue
+            certificate = certificate.strip()
+            diamond_type = 'lab' if schema.diamond_type == 'lab' or 'LG' in certificate.upper() else 'natural'
+            yield key, (parse_price(price), feed, item_id, lab.strip(), certificate, diamond_type)
+
+
+class ClusterWriter:
+    """Writes the cluster and duplicate-ID outputs"""
+
+    def __init__(self, out_dir, feed_names):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.feed_names = feed_names
+        self.clusters_file = open(os.path.join(out_dir, 'clusters.csv'), 'w', newline='', encoding='utf-8')
+        self.ids_file = open(os.path.join(out_dir, 'duplicate-ids.csv'), 'w', newline='', encoding='utf-8')
+        self.clusters = csv.writer(self.clusters_file)
+        self.ids = csv.writer(self.ids_file)
+        self.clusters.writerow(['key', 'itemId', 'feed', 'type', 'gradingLab', 'certificateNumber',
+                                'totalPrice', 'kept'])
+        self.ids.writerow(['itemId', 'keptItemId', 'key'])
+        self.counts = {'clusters': 0, 'duplicates': 0, 'cross_feed': 0, 'cross_type': 0}
+        self.sizes = Counter()
+        self.largest = []
+
+    def cluster(self, key, listings):
+        listings = sorted(listings)
+        if len({listing[2] for listing in listings}) < 2:
+            return
+        kept = listings[0]
+        for listing in listings:
+            price, feed, item_id, lab, certificate, diamond_type = listing
+            self.clusters.writerow([key, item_id, self.feed_names[feed], diamond_type, lab, certificate,
+                                    '' if price == math.inf else f'{price:g}',
+                                    'yes' if listing is kept else 'no'])
+            if listing is not kept and item_id != kept[2]:
+                self.ids.writerow([item_id, kept[2], key])
+        self.counts['clusters'] += 1
+        self.counts['duplicates'] += len(listings) - 1
+        if len({listing[1] for listing in listings}) > 1:
+            self.counts['cross_feed'] += 1
+        if len({listing[5] for listing in listings}) > 1:
+            self.counts['cross_type'] += 1
+        self.sizes[len(listings)] += 1
+        self.largest.append((len(listings), key))
+        self.largest = sorted(self.largest, key=lambda e: (-e[0], e[1]))[:10]
+
+    def close(self, summary):
+        self.clusters_file.close()
+        self.ids_file.close()
+        summary = {**summary, **self.counts,
+                   'cluster_sizes': {str(size): count for size, count in sorted(self.sizes.items())},
+                   'largest': [{'key': key, 'listings': size} for size, key in self.largest]}
+        with open(os.path.join(self.out_dir, 'summary.json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+def last_per_item(rows):
+    """Keep the last (key, listing) of each Item ID, in row order"""
+    last = {}
+    for key, listing in rows:
+        last[listing[2]] = (key, listing)
+    return last.values()
+
+
+def join(rows, writer):
+    """Hash-join (key, listing) pairs and write every key seen more than once"""
+    first = {}
+    clusters = {}
+    for key, listing in rows:
+        seen = first.get(key)
+        if seen is None:
+            first[key] = listing
+        elif key in clusters:
+            clusters[key].append(listing)
+        else:
+            clusters[key] = [seen, listing]
+    for key in sorted(clusters):
+        writer.cluster(key, clusters[key])
+    return len(first)
+
+
+def spill(rows, partitions, scratch, prefix, by_item=False):
+    """Write (key, listing) pairs into per-partition files by key (or Item ID) hash; returns their paths"""
+    paths = [os.path.join(scratch, f'{prefix}-{p:04d}.tsv') for p in range(partitions)]
+    files = [open(path, 'w', encoding='utf-8') for path in paths]
+    try:
+        for key, (price, feed, item_id, lab, certificate, diamond_type) in rows:
+            # Tabs never survive the importer's split, but lab and certificate are free text
+            lab = lab.replace('\t', ' ')
+            certificate = certificate.replace('\t', ' ')
+            files[partition_of(item_id if by_item else key, partitions)].write(
+                f'{key}\t{price!r}\t{feed}\t{item_id}\t{lab}\t{certificate}\t{diamond_type}\n')
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def read_spilled(paths):
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for entry in f:
+                key, price, feed, item_id, lab, certificate, diamond_type = entry.rstrip('\n').split('\t')
+                yield key, (float(price), int(feed), item_id, lab, certificate, diamond_type)
+
+
+def find_duplicates(feeds, out_dir, memory_mb=DEFAULT_MEMORY_MB, partitions=None):
+    """Cluster the listings of all feeds by certificate and write the results to out_dir"""
+    feeds = [resolve_feed(feed) for feed in feeds]
+    if partitions is None:
+        needed = sum(estimate_rows(feed) for feed in feeds) * BYTES_PER_ENTRY
+        partitions = max(1, math.ceil(needed / (memory_mb * 1024 * 1024)))
+
+    writer = ClusterWriter(out_dir, [os.path.basename(feed) for feed in feeds])
+    summary = {'feeds': [os.path.basename(feed) for feed in feeds], 'partitions': partitions}
+
+    def all_rows():
+        for i, feed in enumerate(feeds):
+            yield from certificate_rows(feed, i)
+
+    if partitions == 1:
+        summary['certificates'] = join(last_per_item(all_rows()), writer)
+        return writer.close(summary)
+
+    scratch = tempfile.mkdtemp(prefix='idex-duplicates-', dir=out_dir)
+    try:
+        # Every listing of an Item ID lands in the same partition, read back in feed order
+        by_item = [spill(certificate_rows(feed, i), partitions, scratch, f'feed{i}', by_item=True)
+                   for i, feed in enumerate(feeds)]
+        reduced = (row for partition in zip(*by_item) for row in last_per_item(read_spilled(partition)))
+        parts = spill(reduced, partitions, scratch, 'keys')
+        summary['certificates'] = 0
+        for path in parts:
+            summary['certificates'] += join(read_spilled([path]), writer)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return writer.close(summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find listings of the same certificate across IDEX feeds')
+    parser.add_argument('feeds', nargs='+', help='Feed .csv or .zip files')
+    parser.add_argument('--out', default='feed-duplicates', help='Output directory')
+    parser.add_argument('--memory-mb', type=int, default=DEFAULT_MEMORY_MB,
+                        help='Memory budget for the in-memory certificate map')
+    parser.add_argument('--partitions', type=int, help='Force a partition count')
+    args = parser.parse_args()
+
+    summary = find_duplicates(args.feeds, args.out, args.memory_mb, args.partitions)
+    print(f"{summary['certificates']:,} certificates in {len(summary['feeds'])} feed(s), "
+          f"{summary['partitions']} partition(s)")
+    print(f"{summary['clusters']:,} clusters, {summary['duplicates']:,} duplicate listings "
+          f"({summary['cross_feed']:,} clusters across feeds, {summary['cross_type']:,} across types)")
+    print(f"Saved to: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,462 @@
+"""Bitmap facet index and slider bounds for a feed snapshot.
+
+Built from the columnar cache, the index holds:
+
+- one bitmap (packed 64-bit words) per facet value: type, shape, colour,
+  clarity, cut grade, polish, symmetry, fluorescence, grading lab, fancy
+  colour group and fancy intensity group
+- the non-empty values of each numeric filter (carat, price, table, ratio)
+  sorted, with their row numbers
+
+A storefront filter set, keyed like DiamondFilters in diamond-db.server.ts
+and translated with the same label ranges, becomes one bitmap per active
+filter. The count for a facet value is then the popcount of that value's
+bitmap ANDed with every other active filter (a facet never filters
+itself), which is how the UI can show "(123)" next to each option.
+
+The index is saved next to the columnar cache, storing each bitmap either
+as sorted row numbers or as packed words, whichever is smaller.
+
+Requires numpy.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from .columnar import load_table
+from .derived import (CLARITY_LABELS, COLOUR_LABELS, FLUORESCENCE_LABELS, GRADE_LABELS,
+                      INTENSITY_LABELS, INTENSITY_VALUES, ratio_column, shape_key)
+from .repricing import fallback_intervals, load_intervals, reprice
+
+INDEX_VERSION = 2
+INDEX_FILE = 'facets.npz'
+RANGE_CACHE_SIZE = 64
+
+# Substrings behind the fancy colour buttons; anything else is 'other'
+FANCY_COLOUR_WORDS = ['yellow', 'pink', 'blue', 'red', 'green', 'purple', 'orange', 'violet',
+                      'gray', 'black', 'brown', 'cognac', 'white', 'salt', 'pepper']
+
+CATEGORICAL_FACETS = {
+    'shape': 'cut',
+    'clarity': 'clarity',
+    'cutGrade': 'cutGrade',
+    'polish': 'polish',
+    'symmetry': 'symmetry',
+    'fluorescence': 'fluorescenceIntensity',
+    'gradingLab': 'gradingLab',
+}
+NUMERIC_FILTERS = {
+    'carat': ('minCarat', 'maxCarat'),
+    'totalPrice': ('minPrice', 'maxPrice'),
+    'finalPriceSek': ('minPriceSek', 'maxPriceSek'),
+    'tablePercent': ('minTable', 'maxTable'),
+    'ratio': ('minRatio', 'maxRatio'),
+}
+# (facet, filter key prefix, labels, case-insensitive match) for the min/max label filters
+RANGE_FILTERS = [
+    ('clarity', 'Clarity', CLARITY_LABELS, False),
+    ('cutGrade', 'CutGrade', GRADE_LABELS, True),
+    ('polish', 'Polish', GRADE_LABELS, True),
+    ('symmetry', 'Symmetry', GRADE_LABELS, True),
+    ('fluorescence', 'Fluorescence', FLUORESCENCE_LABELS, True),
+]
+
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(words):
+        return int(np.bitwise_count(words).sum())
+else:
+    _BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(words):
+        return int(_BYTE_COUNTS[words.view(np.uint8)].sum(dtype=np.int64))
+
+
+def pack(mask):
+    """Boolean row mask -> little-endian packed uint64 words"""
+    padded = np.zeros(-(-len(mask) // 64) * 64, dtype=bool)
+    padded[:len(mask)] = mask
+    return np.packbits(padded, bitorder='little').view(np.uint64)
+
+
+def unpack(words, rows):
+    return np.unpackbits(words.view(np.uint8), bitorder='little')[:rows].astype(bool)
+
+
+def label_range(labels, low, high, ignore_case):
+    """Labels between two filter values (either may be None), like the TS slices"""
+    def position(value):
+        value = value[:-4] if value.upper().endswith('_MAX') else value
+        for i, label in enumerate(labels):
+            if (label.lower() == value.lower()) if ignore_case else (label == value.upper()):
+                return i
+        return -1
+
+    lo = position(low) if low else 0
+    hi = position(high) if high else len(labels) - 1
+    if lo == -1 or hi == -1:
+        return None
+    return labels[lo:hi + 1]
+
+
+class FacetIndex:
+    """Facet value bitmaps and sorted numeric columns over one snapshot"""
+
+    def __init__(self, rows, bitmaps, numeric):
+        self.rows = rows
+        self.words = -(-rows // 64)
+        self.bitmaps = bitmaps
+        self.numeric = numeric
+        self.all_rows = pack(np.ones(rows, dtype=bool))
+        # Slider drags change one range at a time; the others hit this cache
+        self.ranges = {}
+
+    @classmethod
+    def build(cls, table, exchange_rate=None, intervals=None):
+        n = table.rows
+        bitmaps = {}
+
+        def add(facet, value, mask):
+            if mask.any():
+                bitmaps.setdefault(facet, {})[value] = pack(mask)
+
+        prices = None
+        if exchange_rate is not None:
+            prices = reprice(table, exchange_rate, intervals or {
+                'natural': fallback_intervals(), 'lab': fallback_intervals()})
+            is_lab = prices['type'] == 'lab'
+        else:
+            is_lab = table.strings('certificateNumber').contains('LG', ignore_case=True)
+            if table.diamond_type == 'lab':
+                is_lab[:] = True
+        add('type', 'natural', ~is_lab)
+        add('type', 'lab', is_lab)
+
+        for facet, field in CATEGORICAL_FACETS.items():
+            codes = np.asarray(table.codes(field))
+            labels = table.labels(field)
+            for code, label in enumerate(labels):
+                value = label.strip()
+                if facet == 'shape':
+                    # Shape is matched by its normalised shape code, like shapeCode
+                    value = shape_key(value)
+                if value:
+                    mask = codes == code
+                    existing = bitmaps.get(facet, {}).get(value)
+                    if existing is not None:
+                        mask |= unpack(existing, n)
+                    add(facet, value, mask)
+
+        # White colours only count for stones without a fancy colour
+        fancy_labels = table.labels('naturalFancyColor')
+        fancy_codes = np.asarray(table.codes('naturalFancyColor'))
+        blank_fancy = np.array([not label.strip() for label in fancy_labels], dtype=bool)
+        is_white = blank_fancy[fancy_codes]
+        colour_codes = np.asarray(table.codes('color'))
+        for code, label in enumerate(table.labels('color')):
+            if label.strip():
+                add('colour', label.strip(), (colour_codes == code) & is_white)
+
+        add('fancyColour', 'ALL_FANCY', ~is_white)
+        lowered = [label.lower() for label in fancy_labels]
+        for word in FANCY_COLOUR_WORDS + ['other']:
+            if word == 'other':
+                hit = [bool(label.strip()) and not any(w in label for w in FANCY_COLOUR_WORDS)
+                       for label in lowered]
+            else:
+                hit = [word in label for label in lowered]
+            add('fancyColour', word, np.array(hit, dtype=bool)[fancy_codes])
+
+        intensity_codes = np.asarray(table.codes('naturalFancyColorIntensity'))
+        intensity_labels = [label.strip() for label in table.labels('naturalFancyColorIntensity')]
+        for simple, values in INTENSITY_VALUES.items():
+            hit = np.array([label in values for label in intensity_labels], dtype=bool)
+            add('fancyIntensity', simple, hit[intensity_codes])
+
+        columns = {
+            'carat': np.asarray(table.numeric('carat')),
+            'totalPrice': np.asarray(table.numeric('totalPrice')),
+            'tablePercent': np.asarray(table.numeric('tablePercent')),
+            'ratio': ratio_column(table),
+        }
+        if prices is not None:
+            columns['finalPriceSek'] = prices['finalPriceSek']
+        numeric = {}
+        for field, values in columns.items():
+            rows = np.nonzero(~np.isnan(values))[0]
+            order = np.argsort(values[rows], kind='stable')
+            numeric[field] = (values[rows][order], rows[order].astype(np.uint32))
+        return cls(n, bitmaps, numeric)
+
+    def save(self, path):
+        """Write the index, each bitmap as row numbers or packed words"""
+        arrays = {}
+        layout = {}
+        for facet, values in self.bitmaps.items():
+            layout[facet] = []
+            for i, (value, words) in enumerate(values.items()):
+                count = popcount(words)
+                key = f'b/{facet}/{i}'
+                if count * 4 < words.nbytes:
+                    arrays[key] = np.nonzero(unpack(words, self.rows))[0].astype(np.uint32)
+                    layout[facet].append([value, 'rows'])
+                else:
+                    arrays[key] = words
+                    layout[facet].append([value, 'words'])
+        for field, (values, rows) in self.numeric.items():
+            arrays[f'n/{field}/values'] = values
+            arrays[f'n/{field}/rows'] = rows
+        meta = {'version': INDEX_VERSION, 'rows': self.rows, 'layout': layout,
+                'numeric': list(self.numeric)}
+        arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+        scratch = path + '.partial.npz'
+        np.savez(scratch, **arrays)
+        os.replace(scratch, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+            if meta.get('version') != INDEX_VERSION:
+                return None
+            rows = meta['rows']
+            bitmaps = {}
+            for facet, entries in meta['layout'].items():
+                bitmaps[facet] = {}
+                for i, (value, kind) in enumerate(entries):
+                    stored = data[f'b/{facet}/{i}']
+                    if kind == 'rows':
+                        mask = np.zeros(rows, dtype=bool)
+                        mask[stored] = True
+                        stored = pack(mask)
+                    bitmaps[facet][value] = stored
+            numeric = {field: (data[f'n/{field}/values'], data[f'n/{field}/rows'])
+                       for field in meta['numeric']}
+        return cls(rows, bitmaps, numeric)
+
+    def values(self, facet, wanted):
+        """OR of the bitmaps of the given facet values"""
+        out = np.zeros(self.words, dtype=np.uint64)
+        for value in wanted:
+            words = self.bitmaps.get(facet, {}).get(value)
+            if words is not None:
+                out |= words
+        return out
+
+    def numeric_range(self, field, low=None, high=None):
+        """Rows with low <= value <= high (NaN never matches)"""
+        if field not in self.numeric:
+            raise ValueError(f'{field} is not indexed (repricing needs an exchange rate)')
+        key = (field, low, high)
+        if key in self.ranges:
+            return self.ranges[key]
+        values, rows = self.numeric[field]
+        start = np.searchsorted(values, low, side='left') if low is not None else 0
+        stop = np.searchsorted(values, high, side='right') if high is not None else len(values)
+        mask = np.zeros(self.words * 64, dtype=bool)
+        mask[rows[start:stop]] = True
+        if len(self.ranges) >= RANGE_CACHE_SIZE:
+            self.ranges.pop(next(iter(self.ranges)))
+        words = self.ranges[key] = np.packbits(mask, bitorder='little').view(np.uint64)
+        return words
+
+    def clauses(self, filters):
+        """Translate DiamondFilters into [(facet, bitmap)] clauses ANDed together"""
+        f = filters
+        out = []
+
+        if f.get('type') in ('natural', 'lab'):
+            out.append(('type', self.bitmaps.get('type', {}).get(f['type'], np.zeros(self.words, np.uint64))))
+        if f.get('shape'):
+            out.append(('shape', self.values('shape', [shape_key(f['shape'])])))
+
+        # Price: SEK filters win over USD ones; rows without a price never match
+        if f.get('minPriceSek') is not None or f.get('maxPriceSek') is not None:
+            out.append(('price', self.numeric_range('finalPriceSek', f.get('minPriceSek'), f.get('maxPriceSek'))))
+        else:
+            out.append(('price', self.numeric_range('totalPrice', f.get('minPrice'), f.get('maxPrice'))))
+
+        for field in ('carat', 'tablePercent', 'ratio'):
+            low_key, high_key = NUMERIC_FILTERS[field]
+            if f.get(low_key) is not None or f.get(high_key) is not None:
+                out.append((field, self.numeric_range(field, f.get(low_key), f.get(high_key))))
+
+        if f.get('minColour') or f.get('maxColour'):
+            labels = label_range(COLOUR_LABELS, f.get('minColour'), f.get('maxColour'), False)
+            if labels is not None:
+                out.append(('colour', self.values('colour', labels)))
+
+        if f.get('fancyColours'):
+            if f['fancyColours'] == 'ALL_FANCY':
+                out.append(('fancyColour', self.values('fancyColour', ['ALL_FANCY'])))
+            else:
+                groups = []
+                for colour in f['fancyColours'].lower().split(','):
+                    groups.extend(['salt', 'pepper'] if colour == 's-and-p' else [colour])
+                out.append(('fancyColour', self.values('fancyColour', groups)))
+        if f.get('minFancyIntensity') or f.get('maxFancyIntensity'):
+            labels = label_range(INTENSITY_LABELS, f.get('minFancyIntensity'),
+                                 f.get('maxFancyIntensity'), True)
+            if labels is not None:
+                out.append(('fancyIntensity', self.values('fancyIntensity', labels)))
+
+        for facet, key, labels, ignore_case in RANGE_FILTERS:
+            low, high = f.get(f'min{key}'), f.get(f'max{key}')
+            if low or high:
+                wanted = label_range(labels, low, high, ignore_case)
+                if wanted is not None:
+                    out.append((facet, self.values(facet, wanted)))
+
+        if f.get('gradingLab'):
+            out.append(('gradingLab', self.values('gradingLab', f['gradingLab'].split(','))))
+        return out
+
+    def count(self, filters):
+        """Number of diamonds getFilteredDiamonds() would count for these filters"""
+        mask = self.all_rows.copy()
+        for _, words in self.clauses(filters):
+            mask &= words
+        return popcount(mask)
+
+    def facet_counts(self, filters, facets=None):
+        """{facet: {value: count}} with each facet's own filter left out"""
+        clauses = self.clauses(filters)
+        # Prefix/suffix ANDs give "everything but clause i" without re-ANDing
+        prefix = [self.all_rows]
+        for _, words in clauses:
+            prefix.append(prefix[-1] & words)
+        suffix = [self.all_rows]
+        for _, words in reversed(clauses):
+            suffix.append(suffix[-1] & words)
+        suffix.reverse()
+
+        by_facet = {}
+        for i, (facet, _) in enumerate(clauses):
+            by_facet.setdefault(facet, []).append(i)
+
+        counts = {}
+        for facet in facets or self.bitmaps:
+            own = by_facet.get(facet)
+            if own is None:
+                base = prefix[-1]
+            elif len(own) == 1:
+                base = prefix[own[0]] & suffix[own[0] + 1]
+            else:
+                base = self.all_rows.copy()
+                for i, (other, words) in enumerate(clauses):
+                    if other != facet:
+                        base &= words
+            counts[facet] = {value: popcount(base & words)
+                             for value, words in self.bitmaps.get(facet, {}).items()}
+        return counts
+
+    def bounds(self, facet_filters=None):
+        """Slider min/max per numeric field, optionally within type/shape"""
+        mask = self.all_rows.copy()
+        for facet, value in (facet_filters or {}).items():
+            mask &= self.values(facet, [value])
+        selected = unpack(mask, self.rows)
+        out = {'count': int(selected.sum())}
+        for field, (values, rows) in self.numeric.items():
+            inside = np.nonzero(selected[rows])[0]
+            if len(inside):
+                # values are sorted, so the first and last hits are the extremes
+                out[field] = {'min': float(values[inside[0]]), 'max': float(values[inside[-1]])}
+        return out
+
+
+def index_path(table):
+    return os.path.join(table.path, INDEX_FILE)
+
+
+def load_index(file_path, exchange_rate=None, intervals=None):
+    """Facet index of a feed, built and saved next to its columnar cache on first use"""
+    table = load_table(file_path)
+    # SEK prices depend on the rate, so only the rate-free index is cached
+    path = index_path(table)
+    if exchange_rate is None and os.path.exists(path):
+        index = FacetIndex.load(path)
+        if index is not None:
+            return index
+    index = FacetIndex.build(table, exchange_rate, intervals)
+    if exchange_rate is None:
+        index.save(path)
+    return index
+
+
+def slider_bounds(indexes):
+    """Bounds per type and per type x shape across the given indexes"""
+    out = {}
+    for index in indexes:
+        for diamond_type in index.bitmaps.get('type', {}):
+            entry = out.setdefault(diamond_type, {'all': None, 'shapes': {}})
+            merge_bounds(entry, 'all', index.bounds({'type': diamond_type}))
+            for shape in index.bitmaps.get('shape', {}):
+                bounds = index.bounds({'type': diamond_type, 'shape': shape})
+                if bounds['count']:
+                    merge_bounds(entry['shapes'], shape, bounds)
+    return out
+
+
+def merge_bounds(target, key, bounds):
+    current = target.get(key)
+    if not current:
+        target[key] = bounds
+        return
+    current['count'] += bounds['count']
+    for field, value in bounds.items():
+        if field == 'count':
+            continue
+        if field in current:
+            current[field] = {'min': min(current[field]['min'], value['min']),
+                              'max': max(current[field]['max'], value['max'])}
+        else:
+            current[field] = value
+
+
+def combined_counts(indexes, filters):
+    """count() and facet_counts() summed over several snapshots"""
+    total = 0
+    facets = {}
+    for index in indexes:
+        total += index.count(filters)
+        for facet, values in index.facet_counts(filters).items():
+            merged = facets.setdefault(facet, {})
+            for value, count in values.items():
+                merged[value] = merged.get(value, 0) + count
+    return total, facets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Facet counts and slider bounds for IDEX feed snapshots')
+    parser.add_argument('feeds', nargs='+', help='Feed .csv or .zip files')
+    parser.add_argument('--rate', type=float, help='USD to SEK rate, enables SEK price filters and bounds')
+    parser.add_argument('--intervals', help='Markup intervals JSON (defaults to the fallback intervals)')
+    parser.add_argument('--query', default='{}', help='DiamondFilters as JSON, e.g. \'{"type": "natural", "minColour": "G"}\'')
+    parser.add_argument('--bounds-out', default='facet-bounds.json')
+    args = parser.parse_args()
+
+    intervals = load_intervals(args.intervals) if args.intervals else None
+    started = time.perf_counter()
+    indexes = [load_index(feed, args.rate, intervals) for feed in args.feeds]
+    print(f"Indexed {sum(i.rows for i in indexes):,} rows in {time.perf_counter() - started:.2f}s")
+
+    filters = json.loads(args.query)
+    started = time.perf_counter()
+    total, facets = combined_counts(indexes, filters)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"\n{total:,} diamonds match {json.dumps(filters)} ({elapsed:.2f} ms incl. facet counts)")
+    for facet, values in facets.items():
+        top = sorted(values.items(), key=lambda kv: -kv[1])[:8]
+        print(f"  {facet}: " + ', '.join(f'{value} ({count:,})' for value, count in top))
+
+    with open(args.bounds_out, 'w') as f:
+        json.dump(slider_bounds(indexes), f, indent=2)
+    print(f"\nSaved to: {args.bounds_out}")
+
+
+if __name__ == '__main__':
+    main()
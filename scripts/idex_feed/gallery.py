@@ -0,0 +1,407 @@
+"""Paginated 3D viewer galleries written straight to disk.
+
+Cards are appended to numbered page bodies as items arrive, so a gallery
+of every 3D viewer in a full feed is produced without ever holding the
+whole page (or the whole extraction) in memory. Only per-page counters,
+facet totals (type, shape, host) and an 8-byte hash per URL (to skip
+repeated viewers) are kept until the index is written.
+
+In the browser, iframes carry their URL in `data-src` and are only loaded
+once they scroll near the viewport; viewers that scroll far away are
+unloaded again, so a page never runs more than a screenful of viewers.
+The type, shape and host filters hide cards on the current page only;
+the filter is kept in the query string when moving between pages, and
+"previous/next page with matches" links jump over pages that hold none
+(the pages of every facet value are listed once in `facets.js`).
+"""
+import argparse
+import hashlib
+import json
+import os
+from html import escape
+from urllib.parse import urlencode
+
+from .analyzers import ThreeDExtractor, media_url, url_domain
+from .scan import Analyzer, FeedScanner
+
+DEFAULT_PAGE_SIZE = 100
+
+STYLE = '''
+        body { font-family: Arial, sans-serif; background-color: #f5f5f5; padding: 20px; }
+        .container { max-width: 1400px; margin: 0 auto; }
+        h1 { text-align: center; color: #333; margin-bottom: 10px; }
+        .summary { text-align: center; color: #666; margin-bottom: 20px; font-size: 16px; }
+        .toolbar { display: flex; flex-wrap: wrap; gap: 12px; justify-content: center; align-items: center; margin-bottom: 20px; }
+        .toolbar select { padding: 4px 8px; }
+        .pager a, .pager span { margin: 0 6px; }
+        .viewer-grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(340px, 1fr)); gap: 24px; }
+        .viewer-card { background: white; border-radius: 8px; padding: 16px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
+        .viewer-card.hidden { display: none; }
+        .diamond-type { display: inline-block; padding: 4px 12px; border-radius: 20px; font-size: 12px; font-weight: bold; text-transform: uppercase; margin-bottom: 8px; }
+        .natural { background-color: #e8f5e9; color: #2e7d32; }
+        .lab { background-color: #e3f2fd; color: #1565c0; }
+        .viewer-info { margin-bottom: 10px; font-size: 14px; color: #666; }
+        .diamond-id { font-weight: bold; color: #333; }
+        .price { float: right; font-weight: bold; color: #1976d2; }
+        .url-display { background-color: #f5f5f5; padding: 8px; border-radius: 4px; font-size: 12px; word-break: break-all; margin-bottom: 10px; color: #555; border: 1px solid #ddd; max-height: 40px; overflow-y: auto; }
+        .viewer-frame { width: 100%; aspect-ratio: 1; border: 1px solid #ddd; border-radius: 4px; background-color: #fafafa; }
+        iframe { width: 100%; height: 100%; border: 0; display: block; }
+        table { border-collapse: collapse; margin: 0 auto 30px; background: white; }
+        td, th { padding: 6px 12px; border-bottom: 1px solid #eee; text-align: left; }
+'''
+
+# Loads viewers near the viewport, unloads far-away ones and applies the filters
+SCRIPT = '''
+(function () {
+    var params = new URLSearchParams(location.search);
+    var facets = ['type', 'shape', 'domain'];
+    var page = parseInt(document.body.dataset.page, 10);
+    var cards = Array.prototype.slice.call(document.querySelectorAll('.viewer-card'));
+
+    function load(card) {
+        var frame = card.querySelector('.viewer-frame');
+        if (!frame.firstChild) {
+            var iframe = document.createElement('iframe');
+            iframe.src = frame.dataset.src;
+            iframe.scrolling = 'no';
+            frame.appendChild(iframe);
+        }
+    }
+    function unload(card) {
+        var frame = card.querySelector('.viewer-frame');
+        while (frame.firstChild) frame.removeChild(frame.firstChild);
+    }
+
+    var near = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) { if (entry.isIntersecting) load(entry.target); });
+    }, { rootMargin: '400px 0px' });
+    var far = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) { if (!entry.isIntersecting) unload(entry.target); });
+    }, { rootMargin: '2000px 0px' });
+    cards.forEach(function (card) { near.observe(card); far.observe(card); });
+
+    function apply() {
+        var shown = 0;
+        cards.forEach(function (card) {
+            var match = facets.every(function (f) { return !params.get(f) || card.dataset[f] === params.get(f); });
+            card.classList.toggle('hidden', !match);
+            if (match) shown++;
+        });
+        document.getElementById('shown').textContent = shown;
+        document.querySelectorAll('a.keep-filter').forEach(function (a) {
+            a.search = params.toString();
+        });
+        jumps();
+    }
+    // Pages holding every selected facet value (from facets.js), nearest before and after this one
+    function jumps() {
+        var selected = facets.filter(function (f) { return params.get(f); });
+        var candidates = null;
+        selected.forEach(function (f) {
+            var pages = ((window.GALLERY_PAGES || {})[f] || {})[params.get(f)] || [];
+            candidates = candidates === null ? pages
+                : candidates.filter(function (n) { return pages.indexOf(n) >= 0; });
+        });
+        var before = null, after = null;
+        (candidates || []).forEach(function (n) {
+            if (n < page) before = n;
+            if (n > page && after === null) after = n;
+        });
+        [['prev-match', before], ['next-match', after]].forEach(function (pair) {
+            var link = document.getElementById(pair[0]);
+            link.hidden = !selected.length || pair[1] === null;
+            if (pair[1] !== null) link.href = 'page-' + String(pair[1]).padStart(4, '0') + '.html?' + params.toString();
+        });
+    }
+    facets.forEach(function (f) {
+        var select = document.getElementById('filter-' + f);
+        select.value = params.get(f) || '';
+        select.addEventListener('change', function () {
+            if (select.value) params.set(f, select.value); else params.delete(f);
+            history.replaceState(null, '', '?' + params.toString());
+            apply();
+        });
+    });
+    apply();
+})();
+'''
+
+
+def page_name(number):
+    return f'page-{number:04d}.html'
+
+
+def price_display(price):
+    price = (price or '').strip()
+    return f'${price}' if price and price.replace('.', '').isdigit() else ''
+
+
+def render_card(item):
+    url = item['url']
+    shape = (item.get('cut') or '').strip()
+    color = (item.get('color') or '').strip() or 'N/A'
+    price = price_display(item.get('price'))
+    price_html = f'<span class="price">{escape(price)}</span>' if price else ''
+    return f'''            <div class="viewer-card" data-type="{escape(item['type'])}" data-shape="{escape(shape)}" data-domain="{escape(url_domain(url))}">
+                <span class="diamond-type {escape(item['type'])}">{escape(item['type'])}</span>
+                <div class="viewer-info">
+                    <span class="diamond-id">Diamond #{escape(str(item['id']))}</span> - {escape(str(item.get('carat', '')))}ct {escape(shape)} {escape(color)} {escape(str(item.get('clarity', '')))}
+                    {price_html}
+                </div>
+                <div class="url-display">{escape(url)}</div>
+                <div class="viewer-frame" data-src="{escape(url)}"></div>
+            </div>
+'''
+
+
+def render_select(facet, label, counts):
+    options = [f'<option value="">All {label}</option>']
+    for value, count in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])):
+        options.append(f'<option value="{escape(value)}">{escape(value)} ({count})</option>')
+    return f'<label>{label} on this page <select id="filter-{facet}">{"".join(options)}</select></label>'
+
+
+class GalleryWriter:
+    """Streams viewer cards into fixed-size pages and writes an index at the end"""
+
+    def __init__(self, out_dir, page_size=DEFAULT_PAGE_SIZE, title='Diamond 3D Viewer Gallery'):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.page_size = page_size
+        self.title = title
+        self.pages = []
+        self.current = None
+        self.facets = {'type': {}, 'shape': {}, 'domain': {}}
+        self.total = 0
+
+    def add(self, item):
+        if self.current is None or self.pages[-1]['count'] >= self.page_size:
+            self.start_page()
+        card = render_card(item)
+        self.current.write(card)
+
+        page = self.pages[-1]
+        page['count'] += 1
+        values = {
+            'type': item['type'],
+            'shape': (item.get('cut') or '').strip(),
+            'domain': url_domain(item['url']),
+        }
+        for facet, value in values.items():
+            for counts in (self.facets[facet], page['facets'][facet]):
+                counts[value] = counts.get(value, 0) + 1
+        self.total += 1
+
+    def start_page(self):
+        self.finish_page()
+        number = len(self.pages) + 1
+        path = os.path.join(self.out_dir, page_name(number))
+        # Cards go into a body file; the page shell (with its facet filters,
+        # which need the page's counts) is wrapped around it in finish_page()
+        self.current = open(path + '.cards', 'w', encoding='utf-8')
+        self.pages.append({
+            'number': number,
+            'file': page_name(number),
+            'count': 0,
+            'facets': {'type': {}, 'shape': {}, 'domain': {}},
+        })
+
+    def finish_page(self):
+        if self.current is None:
+            return
+        self.current.close()
+        self.current = None
+
+    def write_page(self, page, last):
+        number = page['number']
+        path = os.path.join(self.out_dir, page['file'])
+        prev_link = (f'<a class="keep-filter" href="{page_name(number - 1)}">&larr; Previous</a>'
+                     if number > 1 else '<span>&larr; Previous</span>')
+        next_link = (f'<a class="keep-filter" href="{page_name(number + 1)}">Next &rarr;</a>'
+                     if number < last else '<span>Next &rarr;</span>')
+        pager = (f'<div class="pager">{prev_link}<a class="keep-filter" href="index.html">Index</a>'
+                 f'<span>Page {number} of {last}</span>{next_link}</div>')
+        jumps = ('<div class="pager"><a id="prev-match" hidden>&larr; Previous page with matches</a>'
+                 '<a id="next-match" hidden>Next page with matches &rarr;</a></div>')
+        facets = page['facets']
+        selects = ''.join(render_select(facet, label, facets[facet])
+                          for facet, label in (('type', 'types'), ('shape', 'shapes'), ('domain', 'hosts')))
+
+        with open(path, 'w', encoding='utf-8') as out:
+            out.write(f'''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{escape(self.title)} - Page {number}</title>
+    <style>{STYLE}    </style>
+</head>
+<body data-page="{number}">
+    <div class="container">
+        <h1>{escape(self.title)}</h1>
+        <div class="summary">Page {number} of {last}: showing <span id="shown">{page['count']}</span> of {page['count']} viewers on this page ({self.total:,} in total; filters apply to this page only)</div>
+        <div class="toolbar">{selects}{pager}{jumps}</div>
+        <div class="viewer-grid">
+''')
+            with open(path + '.cards', encoding='utf-8') as cards:
+                while True:
+                    block = cards.read(1 << 20)
+                    if not block:
+                        break
+                    out.write(block)
+            out.write(f'''        </div>
+        <div class="toolbar">{pager}</div>
+    </div>
+    <script src="facets.js"></script>
+    <script>{SCRIPT}</script>
+</body>
+</html>
+''')
+        os.remove(path + '.cards')
+
+    def write_facet_pages(self):
+        """facets.js: the page numbers holding each facet value, shared by every page"""
+        pages = {facet: {} for facet in self.facets}
+        for page in self.pages:
+            for facet, counts in page['facets'].items():
+                for value in counts:
+                    pages[facet].setdefault(value, []).append(page['number'])
+        with open(os.path.join(self.out_dir, 'facets.js'), 'w', encoding='utf-8') as out:
+            out.write('window.GALLERY_PAGES = ' + json.dumps(pages, separators=(',', ':')) + ';\n')
+
+    def write_index(self):
+        rows = []
+        for page in self.pages:
+            types = ', '.join(f'{escape(k)}: {v}' for k, v in sorted(page['facets']['type'].items()))
+            shapes = ', '.join(escape(k) for k in sorted(page['facets']['shape']) if k)
+            rows.append(f'<tr><td><a href="{page["file"]}">Page {page["number"]}</a></td>'
+                        f'<td>{page["count"]}</td><td>{types}</td><td>{shapes}</td></tr>')
+
+        facet_tables = []
+        first = page_name(1)
+        for facet, label in (('type', 'Type'), ('shape', 'Shape'), ('domain', 'Host')):
+            links = []
+            for value, count in sorted(self.facets[facet].items(), key=lambda kv: (-kv[1], kv[0])):
+                pages = [p for p in self.pages if value in p['facets'][facet]]
+                target = pages[0]['file'] if pages else first
+                query = escape('?' + urlencode({facet: value}))
+                links.append(f'<tr><td><a href="{target}{query}">{escape(value) or "(none)"}</a></td>'
+                             f'<td>{count:,}</td><td>{len(pages)}</td></tr>')
+            facet_tables.append(f'<h2>By {label}</h2><table><tr><th>{label}</th><th>Viewers</th>'
+                                f'<th>Pages</th></tr>{"".join(links)}</table>')
+
+        with open(os.path.join(self.out_dir, 'index.html'), 'w', encoding='utf-8') as out:
+            out.write(f'''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{escape(self.title)}</title>
+    <style>{STYLE}    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>{escape(self.title)}</h1>
+        <div class="summary">{self.total:,} viewers on {len(self.pages)} pages of up to {self.page_size}</div>
+        <table><tr><th>Page</th><th>Viewers</th><th>Types</th><th>Shapes</th></tr>{"".join(rows)}</table>
+        {"".join(facet_tables)}
+    </div>
+</body>
+</html>
+''')
+
+    def close(self):
+        """Finish the last page, wrap every page and write index.html + gallery.json"""
+        self.finish_page()
+        for page in self.pages:
+            self.write_page(page, len(self.pages))
+        self.write_facet_pages()
+        self.write_index()
+        manifest = {'title': self.title, 'total': self.total, 'page_size': self.page_size,
+                    'facets': self.facets, 'pages': self.pages}
+        with open(os.path.join(self.out_dir, 'gallery.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+class GalleryFeeder(Analyzer):
+    """Hands every new unique 3D viewer URL of a scan to a GalleryWriter"""
+
+    name = 'gallery'
+    fields = ThreeDExtractor.fields
+
+    def __init__(self, writer, limit=None):
+        self.writer = writer
+        self.limit = limit
+        self.seen = set()
+        self.added = 0
+
+    def process(self, row):
+        if self.done:
+            return
+        values = self.get(row)
+        url = media_url(values[6])
+        if not url:
+            return
+        # A short hash keeps the seen set at a fraction of the URLs' size
+        key = hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest()
+        if key in self.seen:
+            return
+        self.seen.add(key)
+        item_id, cut, carat, color, clarity, price = values[:6]
+        self.writer.add({
+            'url': url, 'id': item_id, 'type': self.diamond_type, 'cut': cut,
+            'carat': carat, 'color': color, 'clarity': clarity, 'price': price,
+        })
+        self.added += 1
+        self.done = bool(self.limit) and self.added >= self.limit
+
+    def result(self):
+        return self.added
+
+
+def iter_json_items(file_path):
+    """Items from a JSON list (3D URL extracts, samples) or a JSON-lines file"""
+    with open(file_path, encoding='utf-8') as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == '[':
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a paginated 3D viewer gallery')
+    parser.add_argument('sources', nargs='+',
+                        help='Feed .csv/.zip files, or JSON / JSON-lines lists of extracted URLs')
+    parser.add_argument('--out', default='diamond-3d-gallery', help='Output directory')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument('--limit', type=int, help='Stop after this many viewers per feed')
+    parser.add_argument('--title', default='Diamond 3D Viewer Gallery')
+    args = parser.parse_args()
+
+    writer = GalleryWriter(args.out, args.page_size, args.title)
+    for source in args.sources:
+        if source.lower().endswith(('.json', '.jsonl')):
+            for i, item in enumerate(iter_json_items(source)):
+                if args.limit and i >= args.limit:
+                    break
+                writer.add(item)
+        else:
+            scanner = FeedScanner()
+            feeder = scanner.register(GalleryFeeder(writer, args.limit))
+            scanner.scan(source)
+            print(f"{source}: {feeder.added:,} viewers from {scanner.rows:,} rows")
+
+    manifest = writer.close()
+    print(f"Generated {manifest['total']:,} viewers on {len(manifest['pages'])} pages")
+    print(f"Saved to: {os.path.join(args.out, 'index.html')}")
+
+
+if __name__ == '__main__':
+    main()
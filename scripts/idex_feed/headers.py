@@ -0,0 +1,249 @@
+"""IDEX feed column layouts, mirrored from app/services/idex.service.server.ts"""
+
+NATURAL_DIAMOND_HEADERS = [
+    'Item ID #',
+    'Supplier Stock Ref.',
+    'Cut',
+    'Carat',
+    'Color',
+    'Natural Fancy Color',
+    'Natural Fancy Color Intensity',
+    'Natural Fancy Color Overtone',
+    'Treated Color',
+    'Clarity',
+    'Cut Grade',
+    'Grading Lab',
+    'Certificate Number',
+    'Certificate Path',
+    'Image Path',
+    'Online Report',
+    'Video URL',
+    '3DViewer URL',
+    'Price Per Carat',
+    'Total Price',
+    '% Off IDEX List',
+    'Polish',
+    'Symmetry',
+    'Measurements Length',
+    'Measurements Width',
+    'Measurements Height',
+    'Depth',
+    'Table',
+    'Crown Height',
+    'Crown Angle',
+    'Pavilion Depth',
+    'Pavilion Angle',
+    'Girdle From',
+    'Girdle To',
+    'Culet Size',
+    'Culet Condition',
+    'Graining',
+    'Fluorescence Intensity',
+    'Fluorescence Color',
+    'Enhancement',
+    'Country',
+    'State / Region',
+    'Pair Stock Ref.',
+    'Asking Price For Pair',
+    'Shade',
+    'Milky',
+    'Black Inclusion',
+    'Eye Clean',
+    'Provenance Report',
+    'Provenance Number',
+    'Brand',
+    'Guaranteed Availability',
+]
+
+LAB_GROWN_DIAMOND_HEADERS = [
+    'Item ID',
+    'Supplier Stock Ref',
+    'Cut',
+    'Carat',
+    'Color',
+    'Natural Fancy Color',
+    'Natural Fancy Color Intensity',
+    'Natural Fancy Color Overtone',
+    'Treated Color',
+    'Clarity',
+    'Cut Grade',
+    'Grading Lab',
+    'Certificate Number',
+    'Certificate URL',
+    'Image URL',
+    'Online Report URL',
+    'Polish',
+    'Symmetry',
+    'Price Per Carat',
+    'Total Price',
+    'Measurements Length',
+    'Measurements Width',
+    'Measurements Height',
+    'Depth',
+    'Table',
+    'Crown Height',
+    'Crown Angle',
+    'Pavilion Depth',
+    'Pavilion Angle',
+    'Girdle From',
+    'Girdle To',
+    'Culet Size',
+    'Culet Condition',
+    'Graining',
+    'Fluorescence Intensity',
+    'Fluorescence Color',
+    'Enhancement',
+    'Country Code',
+    'Country Name',
+    'State Code',
+    'State Name',
+    'Pair Stock Ref',
+    'Pair Separable',
+    'Asking Price Per Carat For Pair',
+    'Shade',
+    'Milky',
+    'Black Inclusion',
+    'Eye Clean',
+    'Provenance Report',
+    'Provenance Number',
+    'Brand',
+    'Availability',
+    'Video URL',
+    '3DViewer URL',
+]
+
+# Same mapping as headerToCamelCase() so field names match the Diamond model
+HEADER_TO_FIELD = {
+    'Item ID #': 'itemId',
+    'Item ID': 'itemId',
+    'Supplier Stock Ref.': 'supplierStockRef',
+    'Supplier Stock Ref': 'supplierStockRef',
+    'Cut': 'cut',
+    'Carat': 'carat',
+    'Color': 'color',
+    'Natural Fancy Color': 'naturalFancyColor',
+    'Natural Fancy Color Intensity': 'naturalFancyColorIntensity',
+    'Natural Fancy Color Overtone': 'naturalFancyColorOvertone',
+    'Treated Color': 'treatedColor',
+    'Clarity': 'clarity',
+    'Cut Grade': 'cutGrade',
+    'Make (Cut Grade)': 'cutGrade',
+    'Grading Lab': 'gradingLab',
+    'Certificate Number': 'certificateNumber',
+    'Certificate Path': 'certificatePath',
+    'Certificate URL': 'certificateUrl',
+    'Image Path': 'imagePath',
+    'Image URL': 'imagePath',
+    'Online Report': 'onlineReport',
+    'Online Report URL': 'onlineReportUrl',
+    'Video URL': 'videoUrl',
+    '3DViewer URL': 'threeDViewerUrl',
+    'Price Per Carat': 'pricePerCarat',
+    'Total Price': 'totalPrice',
+    '% Off IDEX List': 'percentOffIdexList',
+    'Polish': 'polish',
+    'Symmetry': 'symmetry',
+    'Measurements Length': 'measurementsLength',
+    'Measurements Width': 'measurementsWidth',
+    'Measurements Height': 'measurementsHeight',
+    'Depth': 'depthPercent',
+    'Table': 'tablePercent',
+    'Crown Height': 'crownHeight',
+    'Crown Angle': 'crownAngle',
+    'Pavilion Depth': 'pavilionDepth',
+    'Pavilion Angle': 'pavilionAngle',
+    'Girdle From': 'girdleFrom',
+    'Girdle To': 'girdleTo',
+    'Culet Size': 'culetSize',
+    'Culet Condition': 'culetCondition',
+    'Graining': 'graining',
+    'Fluorescence Intensity': 'fluorescenceIntensity',
+    'Fluorescence Color': 'fluorescenceColor',
+    'Enhancement': 'enhancement',
+    'Country': 'country',
+    'Country Code': 'countryCode',
+    'Country Name': 'countryName',
+    'State / Region': 'stateRegion',
+    'State Code': 'stateCode',
+    'State Name': 'stateName',
+    'Pair Stock Ref.': 'pairStockRef',
+    'Pair Stock Ref': 'pairStockRef',
+    'Pair Separable': 'pairSeparable',
+    'Asking Price For Pair': 'askingPriceForPair',
+    'Asking Price Per Carat For Pair': 'askingPricePerCaratForPair',
+    'Shade': 'shade',
+    'Milky': 'milky',
+    'Black Inclusion': 'blackInclusion',
+    'Eye Clean': 'eyeClean',
+    'Provenance Report': 'provenanceReport',
+    'Provenance Number': 'provenanceNumber',
+    'Brand': 'brand',
+    'Guaranteed Availability': 'guaranteedAvailability',
+    'Availability': 'availability',
+}
+
+# Fields parsed with parseFloat() by the importer
+NUMERIC_FIELDS = (
+    'carat',
+    'pricePerCarat',
+    'totalPrice',
+    'percentOffIdexList',
+    'measurementsLength',
+    'measurementsWidth',
+    'measurementsHeight',
+    'depthPercent',
+    'tablePercent',
+    'crownHeight',
+    'crownAngle',
+    'pavilionDepth',
+    'pavilionAngle',
+    'askingPriceForPair',
+    'askingPricePerCaratForPair',
+)
+
+# Low-cardinality text fields that repeat across millions of rows
+CATEGORICAL_FIELDS = (
+    'cut',
+    'color',
+    'naturalFancyColor',
+    'naturalFancyColorIntensity',
+    'naturalFancyColorOvertone',
+    'treatedColor',
+    'clarity',
+    'cutGrade',
+    'gradingLab',
+    'polish',
+    'symmetry',
+    'girdleFrom',
+    'girdleTo',
+    'culetSize',
+    'culetCondition',
+    'graining',
+    'fluorescenceIntensity',
+    'fluorescenceColor',
+    'enhancement',
+    'country',
+    'countryCode',
+    'countryName',
+    'stateRegion',
+    'stateCode',
+    'stateName',
+    'pairSeparable',
+    'shade',
+    'milky',
+    'blackInclusion',
+    'eyeClean',
+    'brand',
+    'guaranteedAvailability',
+    'availability',
+)
+
+
+def detect_type(header):
+    """Guess the diamond type from a feed header row"""
+    names = [h.strip() for h in header]
+    if 'Item ID #' in names:
+        return 'natural'
+    if 'Item ID' in names:
+        return 'lab'
+    raise ValueError('Header has neither "Item ID #" nor "Item ID" column')
@@ -0,0 +1,269 @@
+"""Per-snapshot analysis history in SQLite, with a watch mode.
+
+Every snapshot is scanned once (URL coverage, media domains, price
+quantiles) and its aggregates are stored under the file's content hash,
+so a copied or renamed snapshot is recognised instead of re-analysed.
+Hashes come from sources.content_hash(), which remembers them with the
+file's size and mtime, so polling a directory only reads files that are
+new or changed.
+
+Watch mode polls a directory and only picks up a file once its size and
+mtime have stayed the same across two polls, so a snapshot that is still
+being downloaded or unzipped is never analysed half-written.
+
+Trend queries read the stored aggregates only; no CSV is opened.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+from .analyzers import PriceQuantiles, url_report_analyzers
+from .metrics import RunMetrics, print_summary
+from .parallel import run_parallel_scans
+from .sources import content_hash
+
+SNAPSHOT_PATTERNS = ('Idex_*.csv', 'Idex_*.zip')
+TIMESTAMP = re.compile(r'(\d{4})_(\d{2})_(\d{2})_(\d{2})_(\d{2})_(\d{2})')
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS snapshots ('
+    ' content_hash TEXT PRIMARY KEY, source TEXT, diamond_type TEXT, taken_at TEXT,'
+    ' size INTEGER, rows INTEGER, analyzed_at REAL, seconds REAL)',
+    'CREATE TABLE IF NOT EXISTS coverage ('
+    ' content_hash TEXT PRIMARY KEY, total INTEGER, with_video INTEGER, with_3d INTEGER,'
+    ' with_both INTEGER)',
+    'CREATE TABLE IF NOT EXISTS domains ('
+    ' content_hash TEXT, kind TEXT, domain TEXT, count INTEGER,'
+    ' PRIMARY KEY (content_hash, kind, domain))',
+    'CREATE TABLE IF NOT EXISTS prices ('
+    ' content_hash TEXT PRIMARY KEY, count INTEGER, mean REAL, min REAL, max REAL,'
+    ' p05 REAL, p25 REAL, p50 REAL, p75 REAL, p95 REAL)',
+    'CREATE INDEX IF NOT EXISTS snapshots_by_time ON snapshots (diamond_type, taken_at)',
+)
+QUANTILE_COLUMNS = {'0.05': 'p05', '0.25': 'p25', '0.5': 'p50', '0.75': 'p75', '0.95': 'p95'}
+
+
+def snapshot_time(file_path):
+    """Timestamp from an Idex_..._YYYY_MM_DD_HH_MM_SS name, else the file's mtime"""
+    match = TIMESTAMP.search(os.path.basename(file_path))
+    if match:
+        return datetime(*map(int, match.groups())).isoformat()
+    return datetime.fromtimestamp(os.path.getmtime(file_path)).replace(microsecond=0).isoformat()
+
+
+def find_snapshots(directory, patterns=SNAPSHOT_PATTERNS):
+    """Feed files in a directory, oldest name first"""
+    names = [n for n in os.listdir(directory) if any(fnmatch.fnmatch(n, p) for p in patterns)]
+    return [os.path.join(directory, n) for n in sorted(names)]
+
+
+def history_analyzers():
+    return url_report_analyzers(sample_limit=0) + [PriceQuantiles()]
+
+
+class HistoryStore:
+    """SQLite store of per-snapshot aggregates keyed by content hash"""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        for statement in SCHEMA:
+            self.db.execute(statement)
+
+    def has_snapshot(self, source_hash):
+        return self.db.execute('SELECT 1 FROM snapshots WHERE content_hash = ?',
+                               (source_hash,)).fetchone() is not None
+
+    def store(self, source_hash, file_path, report, seconds):
+        """Write one snapshot's aggregates in a single transaction"""
+        coverage = report['coverage']
+        prices = report['prices']
+        quantiles = prices.get('quantiles', {})
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (source_hash, os.path.basename(file_path), report['file_type'], snapshot_time(file_path),
+                 os.path.getsize(file_path), report['rows'], time.time(), seconds))
+            self.db.execute(
+                'INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?)',
+                (source_hash, coverage['total'], coverage['with_video'], coverage['with_3d'],
+                 coverage['with_both']))
+            self.db.execute('DELETE FROM domains WHERE content_hash = ?', (source_hash,))
+            self.db.executemany(
+                'INSERT INTO domains VALUES (?, ?, ?, ?)',
+                [(source_hash, kind.split('_')[0], domain, count)
+                 for kind in ('video_domains', '3d_domains')
+                 for domain, count in report['domains'][kind].items()])
+            self.db.execute(
+                'INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (source_hash, prices['count'], prices.get('mean'), prices.get('min'), prices.get('max'),
+                 *(quantiles.get(q) for q in QUANTILE_COLUMNS)))
+
+    def coverage_trend(self, diamond_type=None, since=None):
+        return self.query(
+            'SELECT s.taken_at, s.diamond_type, s.source, c.total, c.with_video, c.with_3d, c.with_both,'
+            ' round(100.0 * c.with_video / c.total, 2) AS video_pct,'
+            ' round(100.0 * c.with_3d / c.total, 2) AS viewer_pct'
+            ' FROM snapshots s JOIN coverage c USING (content_hash) WHERE c.total > 0',
+            diamond_type, since)
+
+    def price_trend(self, diamond_type=None, since=None):
+        return self.query(
+            'SELECT s.taken_at, s.diamond_type, s.source, p.count, p.mean, p.min, p.p05, p.p25,'
+            ' p.p50, p.p75, p.p95, p.max FROM snapshots s JOIN prices p USING (content_hash) WHERE 1',
+            diamond_type, since)
+
+    def domain_trend(self, kind='3d', diamond_type=None, since=None, top=5):
+        """Counts over time for the domains that are largest across the selected snapshots"""
+        select, params = self.filtered(
+            'SELECT d.domain FROM snapshots s JOIN domains d USING (content_hash) WHERE d.kind = ?',
+            diamond_type, since, [kind])
+        leaders = [row[0] for row in self.db.execute(
+            f'{select} GROUP BY d.domain ORDER BY sum(d.count) DESC, d.domain LIMIT ?', params + [top])]
+        if not leaders:
+            return []
+        marks = ','.join('?' * len(leaders))
+        return self.query(
+            f'SELECT s.taken_at, s.diamond_type, s.source, d.domain, d.count'
+            f' FROM snapshots s JOIN domains d USING (content_hash)'
+            f' WHERE d.kind = ? AND d.domain IN ({marks})',
+            diamond_type, since, [kind] + leaders, order='s.taken_at, d.domain')
+
+    def filtered(self, select, diamond_type, since, params=()):
+        """A snapshots query narrowed to one type and to snapshots taken since a date"""
+        params = list(params)
+        if diamond_type:
+            select += ' AND s.diamond_type = ?'
+            params.append(diamond_type)
+        if since:
+            select += ' AND s.taken_at >= ?'
+            params.append(since)
+        return select, params
+
+    def query(self, select, diamond_type, since, params=(), order='s.taken_at'):
+        select, params = self.filtered(select, diamond_type, since, params)
+        cursor = self.db.execute(f'{select} ORDER BY {order}', params)
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def close(self):
+        self.db.close()
+
+
+def ingest(store, files, workers=None, log=print, metrics=None):
+    """Analyse the snapshots the store hasn't seen; returns the newly stored hashes"""
+    pending = {}
+    for file_path in files:
+        source_hash = content_hash(file_path)
+        if store.has_snapshot(source_hash) or source_hash in pending:
+            log(f"  {os.path.basename(file_path)}: already analysed ({source_hash[:12]})")
+            continue
+        pending[source_hash] = file_path
+
+    stored = []
+    for source_hash, file_path in pending.items():
+        label = os.path.basename(file_path)
+        started = time.perf_counter()
+        scanner = run_parallel_scans({label: file_path}, history_analyzers(), workers, metrics=metrics)[label]
+        seconds = time.perf_counter() - started
+        report = scanner.results()
+        store.store(source_hash, file_path, report, seconds)
+        stored.append(source_hash)
+        log(f"  {os.path.basename(file_path)}: {report['rows']:,} rows analysed in {seconds:.1f}s")
+    return stored
+
+
+def watch(store, directory, interval=60.0, workers=None, once=False, log=print, metrics=None):
+    """Poll a directory and ingest snapshots once they have stopped growing"""
+    previous = {}
+    ingested = {}
+    while True:
+        current = {}
+        for file_path in find_snapshots(directory):
+            stat = os.stat(file_path)
+            current[file_path] = (stat.st_size, stat.st_mtime_ns)
+        settled = [f for f, identity in current.items() if previous.get(f) == identity]
+        if once:
+            settled = list(current)
+        # Files already handed to ingest() unchanged are not looked at again
+        settled = [f for f in settled if ingested.get(f) != current[f]]
+        if settled:
+            ingest(store, settled, workers, log, metrics)
+            ingested.update((f, current[f]) for f in settled)
+        if once:
+            return
+        previous = current
+        time.sleep(interval)
+
+
+def print_rows(rows):
+    if not rows:
+        print("  (no snapshots)")
+        return
+    columns = list(rows[0])
+    print('  ' + '  '.join(f'{c:>12}' for c in columns))
+    for row in rows:
+        cells = [f'{v:>12,.2f}' if isinstance(v, float) else f'{str(v):>12}' for v in row.values()]
+        print('  ' + '  '.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Store and query per-snapshot feed analysis history')
+    parser.add_argument('paths', nargs='*', help='Snapshot files or directories to ingest')
+    parser.add_argument('--db', default='feed-history.sqlite', help='SQLite history store')
+    parser.add_argument('--watch', metavar='DIR', help='Keep polling a directory for new snapshots')
+    parser.add_argument('--interval', type=float, default=60.0, help='Seconds between polls')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--metrics', help='Append scan timings and per-analyzer costs to this JSON-lines file')
+    parser.add_argument('--trend', choices=('coverage', 'prices', 'domains'),
+                        help='Print a trend from the stored aggregates')
+    parser.add_argument('--type', choices=('natural', 'lab'))
+    parser.add_argument('--since', help='Only snapshots taken on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--kind', choices=('video', '3d'), default='3d', help='Domain trend media kind')
+    parser.add_argument('--out', help='Also write the trend as JSON')
+    args = parser.parse_args()
+
+    store = HistoryStore(args.db)
+    metrics = RunMetrics(args.metrics, run='history') if args.metrics else None
+    try:
+        files = []
+        for path in args.paths:
+            files.extend(find_snapshots(path) if os.path.isdir(path) else [path])
+        if files:
+            print(f"Ingesting {len(files)} snapshot(s) into {args.db}")
+            ingest(store, files, args.workers, metrics=metrics)
+
+        if args.watch:
+            print(f"Watching {args.watch} every {args.interval:g}s (Ctrl-C to stop)")
+            try:
+                watch(store, args.watch, args.interval, args.workers, metrics=metrics)
+            except KeyboardInterrupt:
+                pass
+
+        if args.trend:
+            if args.trend == 'coverage':
+                rows = store.coverage_trend(args.type, args.since)
+            elif args.trend == 'prices':
+                rows = store.price_trend(args.type, args.since)
+            else:
+                rows = store.domain_trend(args.kind, args.type, args.since)
+            print(f"\n=== {args.trend} trend ===")
+            print_rows(rows)
+            if args.out:
+                with open(args.out, 'w') as f:
+                    json.dump(rows, f, indent=2)
+                print(f"Saved to: {args.out}")
+        if metrics is not None and metrics.feeds:
+            print_summary(metrics.summary())
+    finally:
+        store.close()
+        if metrics is not None:
+            metrics.close()
+
+
+if __name__ == '__main__':
+    main()
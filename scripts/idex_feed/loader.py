@@ -0,0 +1,382 @@
+"""Bulk load of parsed and priced feeds into the Diamond table.
+
+Replaces the 200-500 row INSERT batches of import-diamonds-direct.ts with:
+
+1. COPY of every row (parsed via the columnar cache, priced with the same
+   rules as the importer) into an UNLOGGED staging table without indexes
+2. one set-based INSERT ... SELECT ... ON CONFLICT ("itemId") DO UPDATE
+   from the staging table into "Diamond"
+3. one DELETE of stones of the loaded types that are no longer listed,
+   which is what clearExistingDiamonds() achieved before the import
+
+All three run in a single transaction, so the storefront keeps seeing the
+previous snapshot until the new one is complete. Rows whose values did not
+change are skipped by the upsert, so they cost no new tuples and no
+index maintenance. ImportJob rows are created per feed and their
+processedRecords is updated from a second connection while COPY runs.
+
+Also fills the derived attribute columns (see derived.py) and can hold back
+rows quarantined by the price anomaly check (see anomalies.py).
+
+Requires numpy and psycopg.
+"""
+import argparse
+import os
+import time
+import uuid
+
+import numpy as np
+import psycopg
+from psycopg import sql
+
+from .anomalies import read_quarantine
+from .derived import DERIVED_COLUMNS, load_derived
+from .headers import NUMERIC_FIELDS
+from .repricing import PRICE_COLUMNS, load_intervals, reprice
+
+# Same column order as the INSERT in import-diamonds-direct.ts, minus the
+# generated id, type and timestamps, plus the derived attribute columns
+FEED_COLUMNS = (
+    'itemId', 'supplierStockRef', 'cut', 'carat', 'color', 'naturalFancyColor',
+    'naturalFancyColorIntensity', 'naturalFancyColorOvertone', 'treatedColor', 'clarity',
+    'cutGrade', 'gradingLab', 'certificateNumber', 'certificatePath', 'certificateUrl',
+    'imagePath', 'imageUrl', 'onlineReport', 'onlineReportUrl', 'videoUrl', 'threeDViewerUrl',
+    'pricePerCarat', 'totalPrice', 'totalPriceSek', 'priceWithMarkupSek', 'finalPriceSek',
+    'percentOffIdexList', 'polish', 'symmetry',
+    'measurementsLength', 'measurementsWidth', 'measurementsHeight', 'depthPercent',
+    'tablePercent', 'crownHeight', 'crownAngle', 'pavilionDepth', 'pavilionAngle',
+    'girdleFrom', 'girdleTo', 'culetSize', 'culetCondition', 'graining',
+    'fluorescenceIntensity', 'fluorescenceColor', 'enhancement', 'country', 'countryCode',
+    'countryName', 'stateRegion', 'stateCode', 'stateName', 'pairStockRef', 'pairSeparable',
+    'askingPriceForPair', 'askingPricePerCaratForPair', 'shade', 'milky', 'blackInclusion',
+    'eyeClean', 'provenanceReport', 'provenanceNumber', 'brand', 'guaranteedAvailability',
+    'availability',
+) + tuple(DERIVED_COLUMNS)
+STAGING_COLUMNS = ('seq',) + FEED_COLUMNS + ('type', 'importJobId')
+FLOAT_COLUMNS = set(NUMERIC_FIELDS) | set(PRICE_COLUMNS)
+
+NULL = b'\\N'
+DEFAULT_CHUNK_ROWS = 50_000
+DEFAULT_PROGRESS_EVERY = 100_000
+
+
+def escape(value):
+    """COPY text-format escaping for one cell"""
+    return (value.replace(b'\\', b'\\\\').replace(b'\t', b'\\t')
+            .replace(b'\n', b'\\n').replace(b'\r', b'\\r'))
+
+
+def float_cells(values):
+    return [NULL if v != v else repr(v).encode('ascii') for v in values.tolist()]
+
+
+def derived_cells(values):
+    values = np.asarray(values)
+    if values.dtype == np.bool_:
+        return [b't' if v else b'f' for v in values.tolist()]
+    if values.dtype.kind == 'f':
+        return float_cells(values)
+    # Ordinals and buckets are -1 off-scale, stored as NULL
+    return [NULL if v < 0 else str(v).encode('ascii') for v in values.tolist()]
+
+
+def pair_separable(label):
+    # The importer turns yes/no into booleans, which land in the text column as true/false
+    return {'yes': 'true', 'no': 'false'}.get(label.lower(), label)
+
+
+class CopyEncoder:
+    """Turns row ranges of a FeedTable plus its prices into COPY text lines"""
+
+    def __init__(self, table, prices, derived, job_id, excluded=()):
+        self.table = table
+        self.prices = prices
+        self.derived = derived
+        self.job_id = job_id.encode('ascii')
+        self.labels = {}
+        for field in FEED_COLUMNS:
+            if table.columns.get(field, {}).get('kind') == 'categorical':
+                labels = table.labels(field)
+                if field == 'pairSeparable':
+                    labels = [pair_separable(label) for label in labels]
+                self.labels[field] = np.array(
+                    [escape(label.encode('utf-8')) if label else NULL for label in labels], dtype=object)
+        self.types = np.where(prices['type'] == 'lab', b'lab', b'natural').astype(object)
+        # The importer drops rows without an item ID; quarantined rows are held back too
+        self.keep = table.strings('itemId').lengths() > 0
+        if excluded:
+            self.keep &= np.fromiter((item_id not in excluded for item_id in table.strings('itemId')),
+                                     dtype=bool, count=table.rows)
+
+    def cells(self, field, start, stop):
+        table = self.table
+        if field in PRICE_COLUMNS:
+            return float_cells(self.prices[field][start:stop])
+        if field in DERIVED_COLUMNS:
+            return derived_cells(self.derived[field][start:stop])
+        kind = table.columns.get(field, {}).get('kind')
+        if kind is None:
+            return [NULL] * (stop - start)
+        if kind == 'numeric':
+            return float_cells(np.asarray(table.numeric(field)[start:stop]))
+        if kind == 'categorical':
+            return self.labels[field][np.asarray(table.codes(field)[start:stop])].tolist()
+
+        column = table.strings(field)
+        base = int(column.offsets[start])
+        ends = (np.asarray(column.offsets[start:stop + 1]) - base).tolist()
+        blob = column.data[base:base + ends[-1]].tobytes()
+        cells = [blob[a:b] or NULL for a, b in zip(ends[:-1], ends[1:])]
+        if any(c in blob for c in (b'\\', b'\t', b'\n', b'\r')):
+            cells = [c if c is NULL else escape(c) for c in cells]
+        return cells
+
+    def chunk(self, start, stop, seq):
+        """COPY payload for rows [start, stop) and the number of rows in it"""
+        keep = self.keep[start:stop]
+        count = int(keep.sum())
+        columns = [[str(seq + i).encode('ascii') for i in range(count)]]
+        for field in FEED_COLUMNS:
+            cells = self.cells(field, start, stop)
+            columns.append(cells if count == len(cells) else [c for c, k in zip(cells, keep) if k])
+        columns.append(self.types[start:stop][keep].tolist())
+        columns.append([self.job_id] * count)
+        return b''.join(b'\t'.join(row) + b'\n' for row in zip(*columns)), count
+
+
+def staging_ddl(name):
+    columns = [sql.SQL('seq bigint')]
+    for field in STAGING_COLUMNS[1:]:
+        kind = 'double precision' if field in FLOAT_COLUMNS else DERIVED_COLUMNS.get(field, 'text')
+        columns.append(sql.SQL('{} {}').format(sql.Identifier(field), sql.SQL(kind)))
+    return sql.SQL('CREATE UNLOGGED TABLE {} ({})').format(sql.Identifier(name), sql.SQL(', ').join(columns))
+
+
+def upsert_sql(staging):
+    """One INSERT ... SELECT over the latest staged row per itemId"""
+    target = [sql.Identifier(c) for c in ('id',) + FEED_COLUMNS + ('type', 'createdAt', 'updatedAt', 'importJobId')]
+    source = [sql.SQL('gen_random_uuid()::text')]
+    source += [sql.SQL('s.{}').format(sql.Identifier(c)) for c in FEED_COLUMNS]
+    source += [sql.SQL('s.type::"DiamondType"'), sql.SQL('now()'), sql.SQL('now()'), sql.SQL('s."importJobId"')]
+    updated = FEED_COLUMNS[1:] + ('type',)
+    assignments = [sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(c))
+                   for c in updated + ('updatedAt', 'importJobId')]
+    current = [sql.SQL('"Diamond".{}').format(sql.Identifier(c)) for c in updated]
+    incoming = [sql.SQL('EXCLUDED.{}').format(sql.Identifier(c)) for c in updated]
+    return sql.SQL(
+        'INSERT INTO "Diamond" ({target}) '
+        'SELECT {source} FROM (SELECT DISTINCT ON ("itemId") * FROM {staging} '
+        'ORDER BY "itemId", seq DESC) s '
+        'ON CONFLICT ("itemId") DO UPDATE SET {assignments} '
+        'WHERE ({current}) IS DISTINCT FROM ({incoming})'
+    ).format(
+        target=sql.SQL(', ').join(target),
+        source=sql.SQL(', ').join(source),
+        staging=sql.Identifier(staging),
+        assignments=sql.SQL(', ').join(assignments),
+        current=sql.SQL(', ').join(current),
+        incoming=sql.SQL(', ').join(incoming),
+    )
+
+
+def delete_missing_sql(staging):
+    return sql.SQL(
+        'DELETE FROM "Diamond" d WHERE d.type::text = ANY(%s) '
+        'AND NOT EXISTS (SELECT 1 FROM {} s WHERE s."itemId" = d."itemId")'
+    ).format(sql.Identifier(staging))
+
+
+def latest_exchange_rate(conn):
+    """USD->SEK rate as getLatestExchangeRate() picks it, or None"""
+    row = conn.execute(
+        'SELECT rate FROM "ExchangeRate" WHERE "fromCurrency" = %s AND "toCurrency" = %s '
+        'AND ("validUntil" IS NULL OR "validUntil" >= now()) ORDER BY "validFrom" DESC LIMIT 1',
+        ('USD', 'SEK')).fetchone()
+    return row[0] if row and row[0] else None
+
+
+def markup_intervals(conn):
+    """MarkupInterval rows per type, ordered like getMarkupIntervals()"""
+    intervals = {'natural': [], 'lab': []}
+    rows = conn.execute('SELECT type::text, "minCarat", "maxCarat", multiplier FROM "MarkupInterval" '
+                        'ORDER BY "minCarat"')
+    for diamond_type, min_carat, max_carat, multiplier in rows:
+        intervals[diamond_type].append({'min': min_carat, 'max': max_carat, 'multiplier': multiplier})
+    return intervals
+
+
+def price_table(table, exchange_rate, intervals):
+    # A NaN rate leaves every SEK column empty, as the importer does without a rate
+    return reprice(table, exchange_rate if exchange_rate else float('nan'), intervals)
+
+
+class ImportJobs:
+    """ImportJob bookkeeping on its own autocommit connection, visible while the load runs"""
+
+    def __init__(self, conninfo):
+        self.conn = psycopg.connect(conninfo, autocommit=True)
+
+    def create(self, diamond_type, total):
+        return self.conn.execute(
+            'INSERT INTO "ImportJob" (id, type, status, "totalRecords", "processedRecords", '
+            '"startedAt", "createdAt", "updatedAt") '
+            "VALUES (gen_random_uuid(), %s::\"DiamondType\", 'IN_PROGRESS', %s, 0, NOW(), NOW(), NOW()) RETURNING id",
+            (diamond_type, total)).fetchone()[0]
+
+    def progress(self, job_id, processed):
+        self.conn.execute('UPDATE "ImportJob" SET "processedRecords" = %s, "updatedAt" = NOW() WHERE id = %s',
+                          (processed, job_id))
+
+    def finish(self, job_id, status, processed, error=None):
+        self.conn.execute(
+            'UPDATE "ImportJob" SET status = %s::"ImportStatus", '
+            '"processedRecords" = COALESCE(%s, "processedRecords"), "completedAt" = NOW(), '
+            '"updatedAt" = NOW(), error = %s WHERE id = %s',
+            (status, processed, error, job_id))
+
+    def close(self):
+        self.conn.close()
+
+
+def copy_feed(copy, encoder, seq, chunk_rows, on_progress=None):
+    """Stream one feed into an open COPY; returns the number of rows sent"""
+    sent = 0
+    for start in range(0, encoder.table.rows, chunk_rows):
+        payload, count = encoder.chunk(start, min(start + chunk_rows, encoder.table.rows), seq + sent)
+        copy.write(payload)
+        sent += count
+        if on_progress:
+            on_progress(sent)
+    return sent
+
+
+def load_feeds(conninfo, feeds, exchange_rate=None, intervals=None, delete_missing=True,
+               chunk_rows=DEFAULT_CHUNK_ROWS, progress_every=DEFAULT_PROGRESS_EVERY, excluded=()):
+    """COPY feeds into staging and upsert them into "Diamond" in one transaction.
+
+    Returns a summary dict. Rate and intervals default to what the database
+    holds (latest ExchangeRate, MarkupInterval rows).
+    """
+    loaded = [load_derived(feed) for feed in feeds]
+    staging = f'DiamondStaging_{uuid.uuid4().hex[:12]}'
+    jobs = ImportJobs(conninfo)
+    job_ids = []
+    summary = {'feeds': {}, 'stages': {}}
+    started = time.perf_counter()
+
+    try:
+        with psycopg.connect(conninfo) as conn:
+            if exchange_rate is None:
+                exchange_rate = latest_exchange_rate(conn)
+            if intervals is None:
+                intervals = markup_intervals(conn)
+            summary['exchange_rate'] = exchange_rate
+
+            for table, _ in loaded:
+                job_ids.append(jobs.create(table.diamond_type, table.rows))
+
+            conn.execute(staging_ddl(staging))
+            copy_sql = sql.SQL('COPY {} ({}) FROM STDIN').format(
+                sql.Identifier(staging), sql.SQL(', ').join(sql.Identifier(c) for c in STAGING_COLUMNS))
+            seq = 0
+            mark = time.perf_counter()
+            with conn.cursor() as cur:
+                for (table, derived), job_id in zip(loaded, job_ids):
+                    encoder = CopyEncoder(table, price_table(table, exchange_rate, intervals), derived,
+                                          str(job_id), excluded)
+                    reported = [0]
+
+                    def on_progress(sent, job_id=job_id, reported=reported):
+                        if sent - reported[0] >= progress_every:
+                            jobs.progress(job_id, sent)
+                            reported[0] = sent
+
+                    with cur.copy(copy_sql) as copy:
+                        sent = copy_feed(copy, encoder, seq, chunk_rows, on_progress)
+                    jobs.progress(job_id, sent)
+                    seq += sent
+                    summary['feeds'][os.path.basename(table.meta['source'])] = {
+                        'type': table.diamond_type, 'rows': table.rows, 'copied': sent, 'job': str(job_id)}
+                summary['stages']['copy'] = time.perf_counter() - mark
+
+                mark = time.perf_counter()
+                cur.execute(sql.SQL('CREATE INDEX ON {} ("itemId", seq)').format(sql.Identifier(staging)))
+                cur.execute(sql.SQL('ANALYZE {}').format(sql.Identifier(staging)))
+                cur.execute(upsert_sql(staging))
+                summary['upserted'] = cur.rowcount
+                summary['stages']['upsert'] = time.perf_counter() - mark
+
+                summary['deleted'] = 0
+                if delete_missing:
+                    mark = time.perf_counter()
+                    cur.execute(delete_missing_sql(staging), (sorted({t.diamond_type for t, _ in loaded}),))
+                    summary['deleted'] = cur.rowcount
+                    summary['stages']['delete'] = time.perf_counter() - mark
+
+                cur.execute(sql.SQL('DROP TABLE {}').format(sql.Identifier(staging)))
+
+        for job_id, feed in zip(job_ids, summary['feeds'].values()):
+            jobs.finish(job_id, 'COMPLETED', feed['copied'])
+    except Exception as error:
+        for job_id in job_ids:
+            jobs.finish(job_id, 'FAILED', None, str(error))
+        raise
+    finally:
+        jobs.close()
+
+    summary['seconds'] = time.perf_counter() - started
+    return summary
+
+
+def write_copy_file(feeds, out, exchange_rate, intervals, chunk_rows=DEFAULT_CHUNK_ROWS, excluded=()):
+    """Write the staging COPY payload to a file instead of a database (psql \\copy or inspection)"""
+    rows = 0
+    with open(out, 'wb') as f:
+        for feed in feeds:
+            table, derived = load_derived(feed)
+            encoder = CopyEncoder(table, price_table(table, exchange_rate, intervals), derived,
+                                  str(uuid.uuid4()), excluded)
+            rows += copy_feed(f, encoder, rows, chunk_rows)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk load IDEX feeds into the Diamond table with COPY')
+    parser.add_argument('feeds', nargs='+', help='Feed .csv or .zip files')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='PostgreSQL connection URL (default: $DATABASE_URL)')
+    parser.add_argument('--rate', type=float, help='USD to SEK rate (default: latest ExchangeRate row)')
+    parser.add_argument('--intervals', help='Markup intervals JSON (default: MarkupInterval rows)')
+    parser.add_argument('--keep-missing', action='store_true',
+                        help='Keep diamonds of the loaded types that are no longer in the feed')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--quarantine', action='append', default=[],
+                        help='Skip the item IDs in this CSV (idex_feed.anomalies or idex_feed.duplicates output);'
+                             ' repeatable')
+    parser.add_argument('--copy-out', help='Only write the COPY payload to this file, no database')
+    args = parser.parse_args()
+
+    intervals = load_intervals(args.intervals) if args.intervals else None
+    excluded = set().union(*(read_quarantine(path) for path in args.quarantine))
+    if args.copy_out:
+        rows = write_copy_file(args.feeds, args.copy_out, args.rate, intervals or {}, args.chunk_rows,
+                               excluded)
+        print(f"Encoded {rows:,} rows ({', '.join(STAGING_COLUMNS[:3])}, ...)")
+        print(f"Saved to: {args.copy_out}")
+        return
+    if not args.database_url:
+        parser.error('set DATABASE_URL or pass --database-url')
+
+    summary = load_feeds(args.database_url, args.feeds, args.rate, intervals,
+                         delete_missing=not args.keep_missing, chunk_rows=args.chunk_rows,
+                         excluded=excluded)
+    print(f"\n=== Bulk load ({summary['seconds']:.1f}s, rate {summary['exchange_rate']}) ===")
+    for name, feed in summary['feeds'].items():
+        print(f"  {name}: {feed['copied']:,} of {feed['rows']:,} rows copied (job {feed['job']})")
+    for stage, seconds in summary['stages'].items():
+        print(f"  {stage:<8} {seconds:>8.2f}s")
+    print(f"  Inserted or changed: {summary['upserted']:,}, removed: {summary['deleted']:,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,558 @@
+"""Storefront load generator for /diamonds/all.
+
+Replays a weighted mix of the storefront's filter requests at a fixed
+concurrency against a running app and reports how getFilteredDiamonds()
+holds up. Each mix entry builds requests the way diamond-api.js does: the
+initial-load defaults (ROUND, natural, minPriceSek=2500, colour K-D,
+GIA/IGI/HRD), then slider ranges drawn from the sliders' own limits and
+label orders (price, carat, colour, clarity, cut grade, polish, symmetry,
+fluorescence, table, ratio, fancy colours and intensity) and `page`
+offsets from load-more clicks down to deep pages. With `--bounds` (the
+slider bounds written by idex_feed.facets) shapes are weighted by their
+catalogue counts, price and carat ranges stay inside what exists and
+deep pages stay inside the result.
+
+A fixed pool of asyncio workers shares one keep-alive connection pool;
+each sends its next request as soon as the previous one answers, so
+`--concurrency` is the number of requests in flight. The same `--seed`
+replays the same request sequence, so runs before and after an index or
+query change are comparable (`--baseline` prints the differences).
+
+The report has p50/p95/p99 latency and throughput overall, per mix entry
+and per filter shape (the set of parameters sent, plus the page depth),
+since those decide which of the `@@index`es on Diamond a query can use.
+With `--database-url` the pg_stat_statements counters on "Diamond" are
+read before and after the run, and each of the slowest shapes is sent
+once more on its own to see which statements it runs; the report lists
+them with their calls and mean time during the run.
+
+Requires aiohttp, numpy and psycopg (with the pg_stat_statements
+extension for the SQL report).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+import numpy as np
+import psycopg
+
+from .derived import CLARITY_LABELS, COLOUR_LABELS, FLUORESCENCE_LABELS, GRADE_LABELS, INTENSITY_LABELS
+from .shards import SHAPES
+
+DEFAULT_URL = 'http://localhost:3000/diamonds/all'
+DEFAULT_LIMIT = 24
+DEFAULT_MAX_PAGE = 200
+DEFAULT_TOP = 10
+# Defaults of DiamondAPI.buildFilterQueryString() before the first load
+STOREFRONT_DEFAULTS = {
+    'shape': 'ROUND', 'type': 'natural', 'minPriceSek': 2500,
+    'minColour': 'K', 'maxColour': 'D', 'gradingLab': 'GIA,IGI,HRD',
+}
+# Slider limits and steps of diamond-filters-sliders.js / DEFAULT_FILTER_RANGES
+PRICE_RANGE = (2500, 1000000, 100)
+CARAT_RANGE = (0.1, 5.0, 0.05)
+TABLE_RANGE = (0, 100, 1)
+RATIO_RANGE = (0.8, 3.0, 0.01)
+# Fancy colour buttons of diamond-search-colour-filter.liquid
+FANCY_COLOURS = ['pink', 'yellow', 'blue', 'red', 'green', 'purple', 'orange', 'violet', 'gray',
+                 'black', 'brown', 'cognac', 'white', 's-and-p', 'other']
+ELONGATED_SHAPES = ['OVAL', 'PEAR', 'MARQUISE', 'EMERALD', 'RADIANT', 'CUSHION', 'HEART', 'PRINCESS']
+LABS = ['GIA', 'IGI', 'HRD']
+
+# Mix entry -> weight; roughly how often shoppers send each kind of request
+MIX = {
+    'initial': 30,
+    'shape': 15,
+    'price-carat': 15,
+    'colour-clarity': 12,
+    'cut-grade': 8,
+    'fancy': 6,
+    'all-fancy': 2,
+    'ratio': 4,
+    'advanced': 5,
+    'deep-page': 3,
+}
+
+STATEMENTS_SQL = (
+    'SELECT queryid, query, calls, total_exec_time, rows, shared_blks_hit, shared_blks_read'
+    ' FROM pg_stat_statements'
+    ' WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())'
+    ' AND query LIKE %s'
+)
+
+
+def slider_value(rng, low, high, step, log=False):
+    """A value between low and high on the slider's step grid"""
+    if log:
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    return round(round((value - low) / step) * step + low, 6)
+
+
+def slider_range(rng, low, high, step, log=False):
+    """(min, max) as a shopper leaves a two-handle slider"""
+    return tuple(sorted((slider_value(rng, low, high, step, log), slider_value(rng, low, high, step, log))))
+
+
+def label_range(rng, labels):
+    """(min label, max label) of a label slider, low to high"""
+    a, b = sorted((rng.randrange(len(labels)), rng.randrange(len(labels))))
+    return labels[a], labels[b]
+
+
+def page_bucket(page):
+    if page <= 1:
+        return 'page 1'
+    if page <= 10:
+        return 'pages 2-10'
+    if page <= 100:
+        return 'pages 11-100'
+    return 'pages 101+'
+
+
+def filter_shape(params):
+    """Filters sent and the page depth of a request, e.g. 'carat,priceSek>=,shape,type @ page 1'"""
+    sides = {}
+    for key in params:
+        if key in ('page', 'limit'):
+            continue
+        if key[:3] in ('min', 'max') and key[3:4].isupper():
+            sides.setdefault(key[3].lower() + key[4:], set()).add(key[:3])
+        else:
+            sides.setdefault(key, set())
+    names = [name + ('>=' if sides[name] == {'min'} else '<=' if sides[name] == {'max'} else '')
+             for name in sorted(sides)]
+    return f"{','.join(names)} @ {page_bucket(params.get('page', 1))}"
+
+
+class QueryMix:
+    """Draws storefront /diamonds/all requests from the weighted mix"""
+
+    def __init__(self, weights=None, seed=0, bounds=None, limit=DEFAULT_LIMIT, max_page=DEFAULT_MAX_PAGE):
+        weights = MIX if weights is None else weights
+        unknown = set(weights) - set(MIX)
+        if unknown:
+            raise ValueError(f"unknown mix entries: {', '.join(sorted(unknown))}")
+        self.names = [name for name in weights if weights[name] > 0]
+        self.weights = [weights[name] for name in self.names]
+        if not self.names:
+            raise ValueError('the mix has no entries with a positive weight')
+        self.rng = random.Random(seed)
+        self.bounds = bounds or {}
+        self.limit = limit
+        self.max_page = max_page
+
+    def next(self):
+        """(mix entry, query parameters) of the next request"""
+        name = self.rng.choices(self.names, self.weights)[0]
+        builder = getattr(self, 'build_' + name.replace('-', '_'))
+        params = builder()
+        params.setdefault('page', self.load_more_page())
+        params['limit'] = self.limit
+        return name, params
+
+    def shape_bounds(self, diamond_type, shape):
+        entry = self.bounds.get(diamond_type) or {}
+        return (entry.get('shapes') or {}).get(shape.lower()) or entry.get('all') or {}
+
+    def pick_type(self):
+        return 'natural' if self.rng.random() < 0.7 else 'lab'
+
+    def pick_shape(self, diamond_type, shapes=SHAPES):
+        """A shape, weighted by catalogue counts when bounds are known"""
+        counts = [self.shape_bounds(diamond_type, shape).get('count', 0) for shape in shapes]
+        if diamond_type in self.bounds and any(counts):
+            return self.rng.choices(shapes, counts)[0]
+        return self.rng.choice(shapes)
+
+    def numeric_range(self, diamond_type, shape, field, low, high, step, log=False):
+        """A slider range, narrowed to the catalogue's min/max when bounds are known"""
+        known = self.shape_bounds(diamond_type, shape).get(field)
+        if known:
+            low = max(low, math.floor(known['min'] / step) * step)
+            high = min(high, math.ceil(known['max'] / step) * step)
+            if high <= low:
+                return low, low
+        return slider_range(self.rng, low, high, step, log)
+
+    def load_more_page(self):
+        """Page 1 mostly, a few load-more clicks otherwise"""
+        return 1 if self.rng.random() < 0.85 else self.rng.randint(2, 6)
+
+    def base(self, diamond_type=None, shape=None):
+        diamond_type = diamond_type or self.pick_type()
+        params = dict(STOREFRONT_DEFAULTS, type=diamond_type, shape=shape or self.pick_shape(diamond_type))
+        if self.rng.random() < 0.2:
+            params['gradingLab'] = ','.join(sorted(self.rng.sample(LABS, self.rng.randint(1, 2))))
+        return params
+
+    def add_price_carat(self, params):
+        price = self.numeric_range(params['type'], params['shape'], 'finalPriceSek', *PRICE_RANGE, log=True)
+        params['minPriceSek'], params['maxPriceSek'] = price
+        carat = self.numeric_range(params['type'], params['shape'], 'carat', *CARAT_RANGE, log=True)
+        params['minCarat'], params['maxCarat'] = carat
+
+    def build_initial(self):
+        return dict(STOREFRONT_DEFAULTS)
+
+    def build_shape(self):
+        return self.base()
+
+    def build_price_carat(self):
+        params = self.base()
+        self.add_price_carat(params)
+        return params
+
+    def build_colour_clarity(self):
+        params = self.base()
+        params['minColour'], params['maxColour'] = label_range(self.rng, COLOUR_LABELS)
+        params['minClarity'], params['maxClarity'] = label_range(self.rng, CLARITY_LABELS)
+        if self.rng.random() < 0.5:
+            self.add_price_carat(params)
+        return params
+
+    def build_cut_grade(self):
+        params = self.base(shape='ROUND')
+        params['minCutGrade'], params['maxCutGrade'] = label_range(self.rng, GRADE_LABELS)
+        if self.rng.random() < 0.5:
+            params['minColour'], params['maxColour'] = label_range(self.rng, COLOUR_LABELS)
+            params['minClarity'], params['maxClarity'] = label_range(self.rng, CLARITY_LABELS)
+        return params
+
+    def build_fancy(self):
+        # The fancy tab sends no white colour range
+        params = self.base()
+        del params['minColour'], params['maxColour']
+        params['fancyColours'] = ','.join(self.rng.sample(FANCY_COLOURS, self.rng.choice([1, 1, 1, 2, 3])))
+        if self.rng.random() < 0.4:
+            params['minFancyIntensity'], params['maxFancyIntensity'] = label_range(self.rng, INTENSITY_LABELS)
+        return params
+
+    def build_all_fancy(self):
+        params = self.base()
+        del params['minColour'], params['maxColour']
+        params['fancyColours'] = 'ALL_FANCY'
+        return params
+
+    def build_ratio(self):
+        diamond_type = self.pick_type()
+        params = self.base(diamond_type, self.pick_shape(diamond_type, ELONGATED_SHAPES))
+        params['minRatio'], params['maxRatio'] = slider_range(self.rng, *RATIO_RANGE)
+        return params
+
+    def build_advanced(self):
+        params = self.base()
+        choices = [
+            ('Fluorescence', FLUORESCENCE_LABELS), ('Polish', GRADE_LABELS), ('Symmetry', GRADE_LABELS),
+            ('Table', None), ('Ratio', None),
+        ]
+        for key, labels in self.rng.sample(choices, self.rng.randint(1, 3)):
+            if labels:
+                params[f'min{key}'], params[f'max{key}'] = label_range(self.rng, labels)
+            elif key == 'Table':
+                params['minTable'], params['maxTable'] = slider_range(self.rng, *TABLE_RANGE)
+            else:
+                params['minRatio'], params['maxRatio'] = slider_range(self.rng, *RATIO_RANGE)
+        return params
+
+    def build_deep_page(self):
+        params = self.base() if self.rng.random() < 0.5 else dict(STOREFRONT_DEFAULTS)
+        count = self.shape_bounds(params['type'], params['shape']).get('count')
+        last = min(self.max_page, max(11, -(-count // self.limit))) if count else self.max_page
+        # Log-uniform between page 11 and the last page
+        params['page'] = int(round(math.exp(self.rng.uniform(math.log(11), math.log(max(last, 11))))))
+        return params
+
+
+def request_url(base_url, params):
+    return f'{base_url}?{urlencode(params)}'
+
+
+def latency_stats(latencies):
+    """count, mean, p50/p95/p99 and max of latencies given in seconds, in ms"""
+    if not latencies:
+        return {'count': 0}
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]).tolist()
+    return {'count': len(values), 'mean_ms': round(float(values.mean()), 2), 'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2), 'max_ms': round(float(values.max()), 2)}
+
+
+async def replay(base_url, mix, concurrency, requests=None, duration=None, warmup=0, timeout=30.0, log=print):
+    """Send the mix's requests until `requests` were sent or `duration` passed.
+
+    Returns (one result dict per measured request, measured wall seconds).
+    """
+    results = []
+    sent = 0
+    deadline = None
+    started = None
+    total = (requests or 0) + warmup
+
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        async def worker():
+            nonlocal sent, deadline, started
+            while True:
+                if requests is not None and sent >= total:
+                    return
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                sent += 1
+                measured = sent > warmup
+                if measured and started is None:
+                    started = time.monotonic()
+                    deadline = started + duration if duration else None
+                name, params = mix.next()
+                result = {'mix': name, 'shape': filter_shape(params), 'params': params,
+                          'status': None, 'error': None, 'bytes': 0}
+                began = time.monotonic()
+                try:
+                    async with session.get(request_url(base_url, params)) as response:
+                        body = await response.read()
+                        result.update(status=response.status, bytes=len(body))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    result['error'] = type(error).__name__ + (f': {error}' if str(error) else '')
+                result['latency'] = time.monotonic() - began
+                if measured:
+                    results.append(result)
+                    if len(results) % 1000 == 0:
+                        log(f"  {len(results):,} requests, {len(results) / (time.monotonic() - started):,.1f}/s")
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, (time.monotonic() - started) if started is not None else 0.0
+
+
+def summarize(results, elapsed, top=DEFAULT_TOP, min_samples=5):
+    """Overall, per-mix and per-filter-shape latency; the slowest shapes by p95"""
+    ok = [r for r in results if r['status'] == 200]
+    errors = {}
+    for r in results:
+        if r['status'] != 200:
+            key = str(r['status'] or r['error'])
+            errors[key] = errors.get(key, 0) + 1
+
+    def grouped(key):
+        groups = {}
+        for r in ok:
+            groups.setdefault(r[key], []).append(r)
+        return groups
+
+    by_mix = {name: dict(latency_stats([r['latency'] for r in rows]), share=round(len(rows) / len(ok), 4))
+              for name, rows in sorted(grouped('mix').items())}
+    shapes = []
+    for shape, rows in grouped('shape').items():
+        stats = latency_stats([r['latency'] for r in rows])
+        slowest = max(rows, key=lambda r: r['latency'])
+        shapes.append(dict(stats, shape=shape, mix=sorted({r['mix'] for r in rows}),
+                           mean_bytes=round(sum(r['bytes'] for r in rows) / len(rows)),
+                           example=slowest['params']))
+    shapes.sort(key=lambda s: -s['p95_ms'])
+    return {
+        'requests': len(results),
+        'ok': len(ok),
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        'latency': latency_stats([r['latency'] for r in ok]),
+        'by_mix': by_mix,
+        'filter_shapes': len(shapes),
+        'slowest_shapes': [s for s in shapes if s['count'] >= min_samples][:top],
+    }
+
+
+def statement_counters(conn):
+    """{queryid: counters} of the pg_stat_statements entries on "Diamond" """
+    with conn.cursor() as cur:
+        cur.execute(STATEMENTS_SQL, ('%"Diamond"%',))
+        return {row[0]: {'query': row[1], 'calls': row[2], 'total_ms': row[3], 'rows': row[4],
+                         'hit': row[5], 'read': row[6]} for row in cur.fetchall()}
+
+
+def counter_delta(before, after):
+    """Per-statement calls, time, rows and blocks between two snapshots"""
+    delta = {}
+    for queryid, now in after.items():
+        was = before.get(queryid, {})
+        calls = now['calls'] - was.get('calls', 0)
+        if calls <= 0:
+            continue
+        delta[queryid] = {
+            'query': now['query'],
+            'calls': calls,
+            'total_ms': now['total_ms'] - was.get('total_ms', 0.0),
+            'rows': now['rows'] - was.get('rows', 0),
+            'hit': now['hit'] - was.get('hit', 0),
+            'read': now['read'] - was.get('read', 0),
+        }
+    return delta
+
+
+async def fetch_once(url, timeout):
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async with session.get(url) as response:
+            await response.read()
+            return response.status
+
+
+def attach_statements(conn, base_url, shapes, during_run, timeout=30.0):
+    """Send each shape's slowest request on its own and attach the statements it ran"""
+    for shape in shapes:
+        before = statement_counters(conn)
+        asyncio.run(fetch_once(request_url(base_url, shape['example']), timeout))
+        ran = counter_delta(before, statement_counters(conn))
+        statements = []
+        for queryid in ran:
+            stats = during_run.get(queryid) or ran[queryid]
+            statements.append({
+                'queryid': queryid,
+                'calls': stats['calls'],
+                'mean_ms': round(stats['total_ms'] / stats['calls'], 3),
+                'rows_per_call': round(stats['rows'] / stats['calls'], 1),
+                'cache_hit': round(stats['hit'] / (stats['hit'] + stats['read']), 4)
+                if stats['hit'] + stats['read'] else None,
+                'query': stats['query'],
+            })
+        shape['statements'] = sorted(statements, key=lambda s: -s['mean_ms'])
+
+
+def compare(report, baseline):
+    """Latency and throughput differences against an earlier report, as printable lines"""
+    lines = []
+
+    def line(label, now, was):
+        parts = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if now.get(key) is not None and was.get(key):
+                parts.append(f"{key[:3]} {was[key]:.1f} -> {now[key]:.1f} ({(now[key] / was[key] - 1) * 100:+.0f}%)")
+        if parts:
+            lines.append(f"  {label}: " + ', '.join(parts))
+
+    line('all', report['latency'], baseline.get('latency', {}))
+    for name, stats in report['by_mix'].items():
+        line(name, stats, baseline.get('by_mix', {}).get(name, {}))
+    was = baseline.get('throughput_rps')
+    if was:
+        lines.append(f"  throughput: {was:.1f} -> {report['throughput_rps']:.1f} req/s "
+                     f"({(report['throughput_rps'] / was - 1) * 100:+.0f}%)")
+    return lines
+
+
+def parse_mix(text):
+    """'initial=50,fancy=10' -> weights; unnamed entries keep their default weight"""
+    weights = dict(MIX)
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        name, _, weight = part.partition('=')
+        if name not in MIX:
+            raise ValueError(f"unknown mix entry {name!r} (choose from {', '.join(MIX)})")
+        weights[name] = float(weight)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay storefront filter requests against /diamonds/all')
+    parser.add_argument('--url', default=DEFAULT_URL, help='The /diamonds/all endpoint of a running app')
+    parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight')
+    parser.add_argument('--requests', type=int, help='Stop after this many measured requests')
+    parser.add_argument('--duration', type=float, help='Stop after this many seconds (default 30 without --requests)')
+    parser.add_argument('--warmup', type=int, default=0, help='Requests to send first and leave out of the report')
+    parser.add_argument('--mix', default='', help=f"Weights to change, e.g. 'deep-page=20,initial=0' "
+                                                  f"(entries: {', '.join(MIX)})")
+    parser.add_argument('--bounds', help='Slider bounds JSON from idex_feed.facets, to draw realistic ranges')
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help='Page size, as the theme requests')
+    parser.add_argument('--max-page', type=int, default=DEFAULT_MAX_PAGE, help='Deepest page requested')
+    parser.add_argument('--seed', type=int, default=0, help='Same seed, same request sequence')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='Slowest filter shapes to report')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='PostgreSQL URL of the app database, for the SQL of the slowest shapes '
+                             '(default: $DATABASE_URL)')
+    parser.add_argument('--no-sql', action='store_true', help='Skip the pg_stat_statements report')
+    parser.add_argument('--baseline', help='An earlier report to compare against')
+    parser.add_argument('--out', default='loadgen-report.json')
+    args = parser.parse_args()
+
+    try:
+        weights = parse_mix(args.mix)
+    except ValueError as error:
+        parser.error(str(error))
+    bounds = None
+    if args.bounds:
+        with open(args.bounds) as f:
+            bounds = json.load(f)
+    mix = QueryMix(weights, args.seed, bounds, args.limit, args.max_page)
+    duration = args.duration if args.duration or args.requests else 30.0
+
+    conn = None
+    before = {}
+    if args.database_url and not args.no_sql:
+        try:
+            conn = psycopg.connect(args.database_url, autocommit=True)
+            before = statement_counters(conn)
+        except psycopg.Error as error:
+            print(f"No SQL report: {str(error).strip()} "
+                  f"(needs CREATE EXTENSION pg_stat_statements and shared_preload_libraries)")
+            if conn:
+                conn.close()
+            conn = None
+
+    print(f"Replaying {'%d requests' % args.requests if args.requests else '%gs' % duration} "
+          f"at concurrency {args.concurrency} against {args.url}")
+    results, elapsed = asyncio.run(replay(args.url, mix, args.concurrency, args.requests, duration,
+                                          args.warmup, args.timeout))
+    report = summarize(results, elapsed, args.top)
+    report.update(url=args.url, concurrency=args.concurrency, seed=args.seed, limit=args.limit,
+                  mix=weights, bounds=args.bounds)
+
+    if conn:
+        try:
+            during_run = counter_delta(before, statement_counters(conn))
+            attach_statements(conn, args.url, report['slowest_shapes'], during_run, args.timeout)
+            report['statements'] = sorted(
+                ({'queryid': q, 'calls': s['calls'], 'mean_ms': round(s['total_ms'] / s['calls'], 3),
+                  'query': s['query']} for q, s in during_run.items()),
+                key=lambda s: -s['mean_ms'])[:args.top]
+        finally:
+            conn.close()
+
+    latency = report['latency']
+    print(f"\n{report['ok']:,} of {report['requests']:,} requests OK in {report['seconds']:.1f}s, "
+          f"{report['throughput_rps']:,.1f} req/s")
+    if latency['count']:
+        print(f"Latency: p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, "
+              f"p99 {latency['p99_ms']:.1f} ms, max {latency['max_ms']:.1f} ms")
+    if report['errors']:
+        print('Errors: ' + ', '.join(f'{key} ({count:,})' for key, count in report['errors'].items()))
+    print('\nBy mix entry:')
+    for name, stats in report['by_mix'].items():
+        print(f"  {name:<15} {stats['count']:>7,}  p50 {stats['p50_ms']:>8.1f}  p95 {stats['p95_ms']:>8.1f}  "
+              f"p99 {stats['p99_ms']:>8.1f} ms")
+    print(f"\nSlowest filter shapes by p95 (of {report['filter_shapes']:,}):")
+    for shape in report['slowest_shapes']:
+        print(f"  p95 {shape['p95_ms']:>8.1f} ms  p50 {shape['p50_ms']:>8.1f} ms  n={shape['count']:<5} "
+              f"{shape['shape']}")
+        for statement in shape.get('statements', []):
+            print(f"      {statement['mean_ms']:>9.2f} ms/call  {' '.join(statement['query'].split())[:160]}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nAgainst {args.baseline}:")
+        for line in compare(report, baseline):
+            print(line)
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved to: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
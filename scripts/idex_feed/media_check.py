@@ -0,0 +1,275 @@
+"""Concurrent health checks for `Video URL` / `3DViewer URL` links.
+
+URLs are probed with HEAD (falling back to a one-byte ranged GET for hosts
+that refuse HEAD) by a fixed pool of asyncio workers sharing one
+keep-alive connection pool. Requests are capped globally and per host by
+a scheduler that queues URLs per host: a worker only takes a URL whose
+host has a free slot, so a slow supplier bucket holds at most `per_host`
+workers and URLs never spend their timeout waiting for a connection.
+Every result lands in a SQLite cache keyed by URL; later runs only
+re-probe URLs that are new or older than the TTL. Timeouts, connection
+errors and 429/5xx answers say little about the link itself, so they are
+only trusted for the much shorter error TTL.
+
+Requires aiohttp.
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+from collections import Counter, deque
+
+import aiohttp
+
+from .analyzers import media_url, url_domain
+from .scan import Analyzer, FeedScanner
+
+DEFAULT_TTL_HOURS = 24
+DEFAULT_ERROR_TTL_HOURS = 1
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Hosts that reject HEAD outright, or answer it differently from GET
+HEAD_FALLBACK_STATUSES = {403, 405, 501}
+
+
+class MediaUrls(Analyzer):
+    """Collects the unique video and 3D viewer URLs of a feed"""
+
+    name = 'media_urls'
+    fields = ('videoUrl', 'threeDViewerUrl')
+
+    def __init__(self):
+        self.urls = {}
+
+    def process(self, row):
+        video, viewer = self.get(row)
+        video = media_url(video)
+        if video:
+            self.urls.setdefault(video, 'video')
+        viewer = media_url(viewer)
+        if viewer:
+            self.urls.setdefault(viewer, '3d')
+
+    def merge(self, other):
+        for url, kind in other.urls.items():
+            self.urls.setdefault(url, kind)
+
+    def result(self):
+        return self.urls
+
+
+class CheckCache:
+    """Persistent URL -> last check result store"""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS media_checks ('
+            ' url TEXT PRIMARY KEY, ok INTEGER, status INTEGER, final_url TEXT,'
+            ' error TEXT, elapsed REAL, checked_at REAL)'
+        )
+
+    def fresh(self, urls, ttl_seconds, error_ttl_seconds=DEFAULT_ERROR_TTL_HOURS * 3600):
+        """Cached results for `urls` younger than the TTL (transient failures: the error TTL)"""
+        now = time.time()
+        cutoff = now - ttl_seconds
+        error_cutoff = now - error_ttl_seconds
+        transient = ','.join(str(status) for status in sorted(RETRY_STATUSES))
+        found = {}
+        urls = list(urls)
+        for i in range(0, len(urls), 500):
+            batch = urls[i:i + 500]
+            marks = ','.join('?' * len(batch))
+            rows = self.db.execute(
+                f'SELECT url, ok, status, final_url, error, elapsed, checked_at'
+                f' FROM media_checks WHERE checked_at >= ? AND url IN ({marks})'
+                f' AND ((status IS NOT NULL AND status NOT IN ({transient})) OR checked_at >= ?)',
+                [cutoff] + batch + [error_cutoff],
+            )
+            for url, ok, status, final_url, error, elapsed, checked_at in rows:
+                found[url] = {
+                    'url': url, 'ok': bool(ok), 'status': status, 'final_url': final_url,
+                    'error': error, 'elapsed': elapsed, 'checked_at': checked_at,
+                }
+        return found
+
+    def store(self, results):
+        self.db.executemany(
+            'INSERT OR REPLACE INTO media_checks'
+            ' (url, ok, status, final_url, error, elapsed, checked_at)'
+            ' VALUES (:url, :ok, :status, :final_url, :error, :elapsed, :checked_at)',
+            results,
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+async def probe(session, url, retries, backoff):
+    """Check one URL; returns a result dict"""
+    started = time.monotonic()
+    result = {'url': url, 'ok': False, 'status': None, 'final_url': None, 'error': None}
+
+    for attempt in range(retries + 1):
+        try:
+            async with session.head(url, allow_redirects=True) as response:
+                status = response.status
+                final_url = str(response.url)
+            if status in HEAD_FALLBACK_STATUSES:
+                headers = {'Range': 'bytes=0-0'}
+                async with session.get(url, headers=headers, allow_redirects=True) as response:
+                    status = response.status
+                    final_url = str(response.url)
+            result.update(status=status, final_url=final_url, error=None)
+            if status not in RETRY_STATUSES:
+                break
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            result.update(status=None, error=type(error).__name__ + (f': {error}' if str(error) else ''))
+        if attempt < retries:
+            await asyncio.sleep(backoff * 2 ** attempt)
+
+    status = result['status']
+    result['ok'] = status is not None and 200 <= status < 300
+    result['elapsed'] = round(time.monotonic() - started, 3)
+    result['checked_at'] = time.time()
+    return result
+
+
+async def run_per_host(urls, handle, concurrency, per_host):
+    """Await handle(url) for every URL, at most `concurrency` at once and `per_host` per host.
+
+    URLs wait in per-host queues and a worker only takes one whose host has
+    a free slot, so a slow host never holds more than `per_host` workers and
+    no request's timeout runs while it waits for its turn.
+    """
+    pending = {}
+    for url in urls:
+        pending.setdefault(url_domain(url), deque()).append(url)
+    active = Counter()
+    changed = asyncio.Condition()
+
+    def take():
+        for host, queue in pending.items():
+            if active[host] < per_host:
+                active[host] += 1
+                url = queue.popleft()
+                if not queue:
+                    del pending[host]
+                return host, url
+        return None
+
+    async def worker():
+        while True:
+            async with changed:
+                picked = take()
+                while picked is None:
+                    if not pending:
+                        return
+                    await changed.wait()
+                    picked = take()
+            host, url = picked
+            try:
+                await handle(url)
+            finally:
+                async with changed:
+                    active[host] -= 1
+                    changed.notify_all()
+
+    total = sum(map(len, pending.values()))
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, max(1, total)))))
+
+
+async def check_urls(urls, concurrency=100, per_host=8, timeout=15.0, retries=2, backoff=0.5):
+    """Probe URLs with bounded global and per-host concurrency"""
+    results = []
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        async def check(url):
+            results.append(await probe(session, url, retries, backoff))
+
+        await run_per_host(urls, check, concurrency, per_host)
+    return results
+
+
+def run_checks(urls, cache_path=None, ttl_hours=DEFAULT_TTL_HOURS, error_ttl_hours=DEFAULT_ERROR_TTL_HOURS,
+               **options):
+    """Check URLs, re-using cached results younger than the TTL (or the error TTL for transient failures).
+
+    Returns (results by URL, number of URLs actually probed).
+    """
+    cache = CheckCache(cache_path) if cache_path else None
+    try:
+        cached = cache.fresh(urls, ttl_hours * 3600, error_ttl_hours * 3600) if cache else {}
+        pending = [url for url in urls if url not in cached]
+        probed = asyncio.run(check_urls(pending, **options)) if pending else []
+        if cache and probed:
+            cache.store(probed)
+    finally:
+        if cache:
+            cache.close()
+
+    results = dict(cached)
+    results.update((r['url'], r) for r in probed)
+    return results, len(probed)
+
+
+def summarize(results, kinds):
+    """Per-kind and per-domain dead link counts"""
+    summary = {'checked': len(results), 'ok': 0, 'dead': 0, 'by_status': Counter(),
+               'dead_by_domain': Counter(), 'dead_by_kind': Counter()}
+    for url, result in results.items():
+        summary['by_status'][str(result['status'] or result['error'])] += 1
+        if result['ok']:
+            summary['ok'] += 1
+        else:
+            summary['dead'] += 1
+            summary['dead_by_domain'][url_domain(url)] += 1
+            summary['dead_by_kind'][kinds.get(url, '?')] += 1
+    for key in ('by_status', 'dead_by_domain', 'dead_by_kind'):
+        summary[key] = dict(summary[key].most_common())
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check video and 3D viewer URLs of IDEX feeds')
+    parser.add_argument('feeds', nargs='+', help='Feed .csv or .zip files')
+    parser.add_argument('--cache', default='media-checks.sqlite', help='SQLite result cache')
+    parser.add_argument('--ttl-hours', type=float, default=DEFAULT_TTL_HOURS)
+    parser.add_argument('--error-ttl-hours', type=float, default=DEFAULT_ERROR_TTL_HOURS,
+                        help='How long timeouts, connection errors and 429/5xx answers stay cached')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--per-host', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=15.0)
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--out', default='media-check-report.json')
+    args = parser.parse_args()
+
+    kinds = {}
+    for feed in args.feeds:
+        scanner = FeedScanner()
+        collector = scanner.register(MediaUrls())
+        scanner.scan(feed)
+        for url, kind in collector.urls.items():
+            kinds.setdefault(url, kind)
+    print(f"Found {len(kinds):,} unique media URLs")
+
+    results, probed = run_checks(
+        list(kinds), args.cache, args.ttl_hours, args.error_ttl_hours,
+        concurrency=args.concurrency, per_host=args.per_host,
+        timeout=args.timeout, retries=args.retries,
+    )
+    summary = summarize(results, kinds)
+    summary['probed'] = probed
+    summary['from_cache'] = len(results) - probed
+    print(json.dumps({k: v for k, v in summary.items() if k != 'dead_by_domain'}, indent=2))
+
+    dead = sorted(url for url, r in results.items() if not r['ok'])
+    with open(args.out, 'w') as f:
+        json.dump({'summary': summary, 'dead': [results[url] for url in dead]}, f, indent=2)
+    print(f"Saved to: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
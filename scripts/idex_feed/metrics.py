@@ -0,0 +1,163 @@
+"""Throughput and memory instrumentation for feed-processing runs.
+
+A RunMetrics collects, for one run:
+
+- stage timers (open, read_parse, analyze, write, or any name a script uses)
+- rows and bytes per feed, giving rows/s and MB/s
+- peak RSS of this process, sampled with each event, and of the largest
+  worker process that has finished (parallel scans run in workers, which
+  the parent's figure leaves out; live workers can't be measured this way)
+- per-analyzer cost, estimated by timing every `sample_every`-th row only
+
+Events are written as JSON lines as they happen (progress every
+`report_every` rows), followed by one summary event. The unsampled rows go
+through the same tight loop as an uninstrumented scan, so the overhead
+stays at a couple of timer calls per sampled row.
+
+Reading and splitting aren't separable for zipped feeds (the archive is
+inflated lazily as the CSV reader pulls lines), so `read_parse` covers
+decompression and CSV parsing together: scan time minus analyzer time.
+"""
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+DEFAULT_SAMPLE_EVERY = 64
+DEFAULT_REPORT_EVERY = 100_000
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size of this process so far (RUSAGE_CHILDREN: its largest finished child)"""
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class CountingLines:
+    """Wraps a line iterator and counts the characters it hands out"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.chars = 0
+
+    def __iter__(self):
+        for line in self.lines:
+            self.chars += len(line) + 1
+            yield line
+
+
+class RunMetrics:
+    """Stage timers, throughput counters and an optional JSON-lines event log"""
+
+    def __init__(self, out=None, run=None, sample_every=DEFAULT_SAMPLE_EVERY,
+                 report_every=DEFAULT_REPORT_EVERY):
+        # Powers of two let the hot loop test `rows & mask` instead of a modulo
+        self.sample_mask = (1 << max(0, (sample_every - 1).bit_length())) - 1
+        self.sample_every = self.sample_mask + 1
+        self.report_every = report_every
+        self.run = run or os.path.basename(sys.argv[0]) or 'run'
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.feeds = {}
+        self.analyzers = {}
+        self.out = open(out, 'a', encoding='utf-8') if isinstance(out, str) else out
+
+    def emit(self, event, **fields):
+        if self.out is None:
+            return
+        record = {
+            'event': event,
+            'run': self.run,
+            'time': round(time.time(), 3),
+            'elapsed': round(time.perf_counter() - self.started, 3),
+            **fields,
+            'peak_rss_mb': peak_rss_mb(),
+            'worker_peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+        }
+        self.out.write(json.dumps(record) + '\n')
+        self.out.flush()
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Time a block of work under a stage name"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.add_stage(name, seconds)
+            self.emit('stage', stage=name, seconds=round(seconds, 4), **fields)
+
+    def feed(self, label):
+        """Counters for one feed: rows, bytes and scan seconds"""
+        if label not in self.feeds:
+            self.feeds[label] = {'rows': 0, 'bytes': 0, 'seconds': 0.0}
+        return self.feeds[label]
+
+    def progress(self, label, rows, chars, seconds):
+        self.emit('progress', feed=label, rows=rows,
+                  rows_per_s=round(rows / seconds) if seconds else None,
+                  mb_per_s=round(chars / seconds / 1e6, 2) if seconds else None)
+
+    def record_analyzers(self, analyzers, sampled_seconds, sampled_rows):
+        """Scale sampled per-analyzer times up to the whole scan"""
+        for analyzer, seconds in zip(analyzers, sampled_seconds):
+            entry = self.analyzers.setdefault(analyzer.name, {'seconds': 0.0, 'sampled_rows': 0})
+            entry['seconds'] += seconds * self.sample_every
+            entry['sampled_rows'] += sampled_rows
+
+    def summary(self):
+        """Totals for the run; also emitted as the final event"""
+        elapsed = time.perf_counter() - self.started
+        feeds = {}
+        for label, feed in self.feeds.items():
+            seconds = feed['seconds']
+            feeds[label] = {
+                'rows': feed['rows'],
+                'mb': round(feed['bytes'] / 1e6, 1),
+                'seconds': round(seconds, 3),
+                'rows_per_s': round(feed['rows'] / seconds) if seconds else None,
+                'mb_per_s': round(feed['bytes'] / seconds / 1e6, 2) if seconds else None,
+            }
+        analyzers = {}
+        for name, entry in self.analyzers.items():
+            rows = entry['sampled_rows'] * self.sample_every
+            analyzers[name] = {
+                'seconds': round(entry['seconds'], 3),
+                'us_per_row': round(entry['seconds'] / rows * 1e6, 3) if rows else None,
+            }
+        summary = {
+            'seconds': round(elapsed, 3),
+            'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            'feeds': feeds,
+            'analyzers': analyzers,
+            'peak_rss_mb': peak_rss_mb(),
+            'worker_peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+        }
+        self.emit('summary', **summary)
+        return summary
+
+    def close(self):
+        if self.out is not None and self.out not in (sys.stdout, sys.stderr):
+            self.out.close()
+        self.out = None
+
+
+def print_summary(summary):
+    """Human-readable version of RunMetrics.summary()"""
+    workers = summary.get('worker_peak_rss_mb')
+    print(f"\n=== Run metrics ({summary['seconds']:.1f}s, peak RSS {summary['peak_rss_mb']} MB in this process"
+          f"{f', {workers} MB in the largest worker' if workers else ''}) ===")
+    for name, seconds in summary['stages'].items():
+        print(f"  {name:<12} {seconds:>9.2f}s")
+    for label, feed in summary['feeds'].items():
+        print(f"  {label}: {feed['rows']:,} rows, {feed['rows_per_s'] or 0:,} rows/s, "
+              f"{feed['mb_per_s'] or 0} MB/s")
+    for name, analyzer in summary['analyzers'].items():
+        print(f"  analyzer {name}: ~{analyzer['seconds']:.2f}s ({analyzer['us_per_row']} us/row)")
@@ -0,0 +1,161 @@
+"""Multi-core scans of full IDEX feeds.
+
+The feed file is cut into newline-aligned byte ranges and every range is
+scanned in a worker process with its own copy of the analyzers. The
+importer splits the CSV on '\\n' as well, so no record spans two ranges.
+Partial analyzers are merged back in file order, which keeps counters,
+totals and first-N samples identical from run to run.
+
+Zip archives can't be entered mid-stream, so a zipped feed is scanned by a
+single worker while other feeds still run alongside it.
+"""
+import copy
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .scan import FeedScanner
+from .sources import is_zip, mmap_lines, open_feed, open_mmap, resolve_feed
+
+DEFAULT_CHUNK_BYTES = 32 * 1024 * 1024
+
+
+def read_header(file_path):
+    """Return (header cells, byte offset of the first data row)"""
+    if is_zip(file_path):
+        with open_feed(file_path) as lines:
+            return next(csv.reader(lines)), None
+    with open(file_path, 'rb') as f:
+        line = f.readline()
+    header = next(csv.reader([line.decode('utf-8-sig')]))
+    return header, len(line)
+
+
+def split_ranges(file_path, start, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Cut [start, EOF) into (start, end) ranges that each end after a newline"""
+    size = os.path.getsize(file_path)
+    ranges = []
+    with open(file_path, 'rb') as f:
+        while start < size:
+            end = start + chunk_bytes
+            if end >= size:
+                end = size
+            else:
+                f.seek(end)
+                f.readline()
+                end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def scan_range(file_path, start, end, header, diamond_type, analyzers, sample_every=None):
+    """Worker: scan one byte range and return (rows, analyzers, sampled seconds, sampled rows)"""
+    scanner = FeedScanner(diamond_type, sample_every=sample_every)
+    for analyzer in analyzers:
+        scanner.register(analyzer)
+    scanner.start(header)
+    with open_mmap(file_path) as mm:
+        scanner.feed(csv.reader(mmap_lines(mm, start, end)))
+    return scanner.rows, scanner.analyzers, scanner.sampled, scanner.sampled_rows
+
+
+def scan_whole(file_path, diamond_type, analyzers, sample_every=None):
+    """Worker: sequential scan of a feed that can't be split (zip archives)"""
+    scanner = FeedScanner(diamond_type, sample_every=sample_every)
+    for analyzer in analyzers:
+        scanner.register(analyzer)
+    scanner.scan(file_path)
+    return scanner.rows, scanner.analyzers, scanner.sampled, scanner.sampled_rows
+
+
+def merge_parts(parts):
+    """Merge (rows, analyzers, sampled seconds, sampled rows) parts in file order"""
+    rows, merged, sampled, sampled_rows = parts[0]
+    for part_rows, analyzers, part_sampled, part_sampled_rows in parts[1:]:
+        rows += part_rows
+        for target, part in zip(merged, analyzers):
+            target.merge(part)
+        if sampled is not None:
+            sampled = [total + seconds for total, seconds in zip(sampled, part_sampled)]
+            sampled_rows += part_sampled_rows
+    return rows, merged, sampled, sampled_rows
+
+
+def run_parallel_scans(feeds, analyzers, workers=None, chunk_bytes=DEFAULT_CHUNK_BYTES, metrics=None):
+    """Scan several feeds at once over one process pool.
+
+    `feeds` maps a label to a file path (or a (path, diamond_type) pair) and
+    `analyzers` is a list of unbound prototypes copied into every chunk.
+    Returns {label: FeedScanner} holding the merged analyzers of each feed.
+    With a RunMetrics, each feed's rows, file bytes and wall time until its
+    merge finished are recorded under the 'scan' stage, progress is emitted
+    as its chunks come back, and the workers' sampled analyzer times are
+    merged into the per-analyzer costs (worker CPU time, summed over chunks).
+    """
+    started = time.perf_counter()
+    sample_every = metrics.sample_every if metrics is not None else None
+    jobs = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for label, feed in feeds.items():
+            file_path, diamond_type = feed if isinstance(feed, tuple) else (feed, None)
+            file_path = resolve_feed(file_path)
+            scanner = FeedScanner(diamond_type)
+            header, data_start = read_header(file_path)
+            schema = scanner.start(header)
+            if is_zip(file_path):
+                ranges = [(0, os.path.getsize(file_path))]
+                futures = [pool.submit(scan_whole, file_path, schema.diamond_type,
+                                       copy.deepcopy(analyzers), sample_every)]
+            else:
+                ranges = split_ranges(file_path, data_start, chunk_bytes)
+                futures = [
+                    pool.submit(scan_range, file_path, start, end, header,
+                                schema.diamond_type, copy.deepcopy(analyzers), sample_every)
+                    for start, end in ranges
+                ]
+            jobs[label] = (scanner, futures, ranges, file_path)
+
+        scanners = {}
+        for label, (scanner, futures, ranges, file_path) in jobs.items():
+            # Collected in submission order so merges don't depend on timing
+            parts = []
+            for future, (start, end) in zip(futures, ranges):
+                parts.append(future.result())
+                if metrics is not None:
+                    metrics.progress(label, sum(part[0] for part in parts), end,
+                                     time.perf_counter() - started)
+            if parts:
+                scanner.rows, scanner.analyzers, sampled, sampled_rows = merge_parts(parts)
+            else:
+                scanner.analyzers = copy.deepcopy(analyzers)
+            scanners[label] = scanner
+            if metrics is not None:
+                seconds = time.perf_counter() - started
+                feed = metrics.feed(label)
+                feed['rows'] += scanner.rows
+                feed['bytes'] += os.path.getsize(file_path)
+                feed['seconds'] += seconds
+                analyze = 0.0
+                if parts:
+                    metrics.record_analyzers(scanner.analyzers, sampled, sampled_rows)
+                    analyze = sum(sampled) * metrics.sample_every
+                metrics.emit('scan', feed=label, rows=scanner.rows, seconds=round(seconds, 3),
+                             analyze_seconds=round(analyze, 3), workers=workers or os.cpu_count())
+    if metrics is not None:
+        metrics.add_stage('scan', time.perf_counter() - started)
+    return scanners
+
+
+def scan_feeds_parallel(feeds, analyzers, workers=None, chunk_bytes=DEFAULT_CHUNK_BYTES, metrics=None):
+    """Like run_parallel_scans(), returning {label: FeedScanner.results()}"""
+    scanners = run_parallel_scans(feeds, analyzers, workers, chunk_bytes, metrics)
+    return {label: scanner.results() for label, scanner in scanners.items()}
+
+
+def scan_feed_parallel(file_path, analyzers, diamond_type=None, workers=None,
+                       chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Parallel equivalent of FeedScanner.scan() for a single feed"""
+    feed = (file_path, diamond_type)
+    return scan_feeds_parallel({'feed': feed}, analyzers, workers, chunk_bytes)['feed']
@@ -0,0 +1,675 @@
+"""Checkpointed, resumable nightly refresh: feed stages as a DAG.
+
+`npm run import:all` downloads, parses, prices and inserts in one go, so
+a failure late in the run starts everything again from the download.
+Here each feed type is a branch of stages
+
+    fetch -> decompress -> parse -> price -> validate -> load
+
+and both branches end in one `publish`. Branches run concurrently. Every
+stage's output is recorded in the run's state.json as soon as it
+finishes, and intermediate files are content-addressed:
+
+- fetch       the IDEX zip (POST like fetchDiamondsStream()), saved as
+              artifacts/<hash>.zip; or a copy of an existing snapshot
+              (--natural, --lab) as artifacts/<hash>.zip or .csv
+- decompress  the CSV member, saved as artifacts/<hash>.csv
+- parse       the columnar cache and derived columns (.idex-cache/<hash>/)
+- price       SEK prices for the run's rate and markup intervals,
+              artifacts/prices-<hash of csv, rate, intervals>.npz, which
+              records the CSV hash it was priced from
+- validate    row count, Item ID share, drop against the last completed
+              run; a failing check stops the branch before it is loaded
+- load        COPY into the run's staging table in chunks; each chunk is
+              committed together with its ImportJob's processedRecords
+- publish     upsert from both staging tables and delete delisted stones
+              in one transaction, then ImportJob COMPLETED
+
+Running again with the same --work directory resumes the last unfinished
+run: completed stages whose inputs are unchanged (and whose files, and a
+--natural/--lab snapshot, still have the size and mtime they were
+recorded with) are skipped. A load continues after the last committed
+chunk of the same CSV; when the CSV changed, its staged chunks are
+discarded and the load starts over.
+The rate and intervals are fixed when a run starts, so a resumed run
+prices like the attempt it continues.
+
+Instead of a database, --copy-out DIR loads into local COPY files with the
+same chunk checkpoints (the loader's --copy-out payload, one per type);
+together with `idex_feed.standins idex` the whole pipeline runs offline.
+
+Requires numpy and psycopg.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import psycopg
+from psycopg import sql
+
+from .anomalies import read_quarantine
+from .derived import load_derived
+from .loader import (STAGING_COLUMNS, CopyEncoder, ImportJobs, delete_missing_sql, latest_exchange_rate,
+                     markup_intervals, price_table, staging_ddl, upsert_sql)
+from .repricing import PRICE_COLUMNS, fallback_intervals, load_intervals
+from .shards import new_version
+from .sources import is_zip, zip_csv_member
+
+IDEX_API_BASE_URL = 'https://api.idexonline.com/onsite/api'
+ENDPOINTS = {
+    'natural': ('fullfeed', 'format_20230628_extended'),
+    'lab': ('labgrownfullfile', 'format_lg_20221130'),
+}
+TYPES = ('natural', 'lab')
+# Staging seq ranges per type, so the lab feed's rows win a repeated Item ID like in the loader
+SEQ_BASE = {'natural': 0, 'lab': 10 ** 12}
+DEFAULT_CHUNK_ROWS = 50_000
+DEFAULT_RETRIES = 3
+DEFAULT_MAX_DROP = 0.5
+MIN_ITEM_ID_SHARE = 0.99
+DOWNLOAD_BLOCK = 1024 * 1024
+
+
+class ValidationError(ValueError):
+    pass
+
+
+def digest_of(*parts):
+    return hashlib.blake2b(json.dumps(parts, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def file_identity(path):
+    """Size and mtime, compared on resume to tell whether a file was replaced"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def save_hashed(stream, scratch):
+    """Copy a binary stream into a scratch file; returns the hex digest content_hash() gives for it"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(scratch, 'wb') as f:
+        for block in iter(lambda: stream.read(DOWNLOAD_BLOCK), b''):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+def read_prices(path, source_hash):
+    """A price table, checked to be priced from the CSV with this hash"""
+    prices = dict(np.load(path))
+    priced_from = str(prices.pop('source_hash', ''))
+    if priced_from != source_hash:
+        raise RuntimeError(f'{path} was priced from CSV {priced_from or "?"}, not {source_hash}')
+    return prices
+
+
+def write_json(path, data):
+    """Replace a JSON file atomically"""
+    scratch = path + '.partial'
+    with open(scratch, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(scratch, path)
+
+
+class RunState:
+    """state.json of one run: parameters, stage results and load checkpoints"""
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self.lock = threading.Lock()
+
+    @classmethod
+    def create(cls, runs_dir, params):
+        # Runs started in the same second get '-002', '-003'... suffixes
+        run_id = new_version(runs_dir)
+        path = os.path.join(runs_dir, run_id, 'state.json')
+        state = cls(path, {'run': run_id, 'status': 'running', 'params': params, 'stages': {}})
+        state.save()
+        return state
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(path, json.load(f))
+
+    @property
+    def run_id(self):
+        return self.data['run']
+
+    @property
+    def params(self):
+        return self.data['params']
+
+    def stage(self, name):
+        return self.data['stages'].get(name, {})
+
+    def update(self, name, **fields):
+        with self.lock:
+            self.data['stages'].setdefault(name, {}).update(fields)
+            self.save()
+
+    def finish(self, status):
+        with self.lock:
+            self.data['status'] = status
+            self.save()
+
+    def save(self):
+        write_json(self.path, self.data)
+
+
+def run_dirs(runs_dir):
+    if not os.path.isdir(runs_dir):
+        return []
+    return sorted(name for name in os.listdir(runs_dir)
+                  if os.path.exists(os.path.join(runs_dir, name, 'state.json')))
+
+
+def latest_state(runs_dir, status=None):
+    """Most recent run, optionally the most recent with a given status"""
+    for name in reversed(run_dirs(runs_dir)):
+        state = RunState.load(os.path.join(runs_dir, name, 'state.json'))
+        if status is None or state.data['status'] == status:
+            return state
+    return None
+
+
+# Stages: each takes the pipeline and its dependencies' outputs and returns a JSON-able output
+
+def fetch(pipeline, diamond_type, inputs):
+    source = pipeline.params['sources'].get(diamond_type)
+    if source:
+        # A copy, so replacing or rewriting the snapshot can't change what later stages read
+        scratch = os.path.join(pipeline.artifacts, f'copy-{diamond_type}-{uuid.uuid4().hex[:8]}.partial')
+        identity = file_identity(source)
+        with open(source, 'rb') as f:
+            source_hash = save_hashed(f, scratch)
+        path = os.path.join(pipeline.artifacts, source_hash + ('.zip' if is_zip(source) else '.csv'))
+        os.replace(scratch, path)
+        return {'path': path, 'hash': source_hash, 'source': os.path.abspath(source), 'source_identity': identity}
+
+    api_key, api_secret = os.environ.get('IDEX_API_KEY'), os.environ.get('IDEX_API_SECRET')
+    if not api_key or not api_secret:
+        raise RuntimeError(f'no --{diamond_type} snapshot and IDEX_API_KEY / IDEX_API_SECRET not set')
+    endpoint, data_format = ENDPOINTS[diamond_type]
+    body = json.dumps({
+        'authentication_details': {'api_key': api_key, 'api_secret': api_secret},
+        'parameters': {'file_format': 'csv', 'data_format': data_format, 'create_zip_file': True},
+    }).encode('utf-8')
+    url = f"{pipeline.params['api_base'].rstrip('/')}/{endpoint}"
+    scratch = os.path.join(pipeline.artifacts, f'download-{diamond_type}-{uuid.uuid4().hex[:8]}.partial')
+
+    for attempt in range(pipeline.params['retries'] + 1):
+        try:
+            request = urllib.request.Request(url, body, {'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=600) as response:
+                source_hash = save_hashed(response, scratch)
+            break
+        except (urllib.error.URLError, OSError) as error:
+            status = getattr(error, 'code', None)
+            if attempt == pipeline.params['retries'] or (status is not None and status < 500):
+                raise
+            pipeline.log(f'fetch:{diamond_type}', f'{error}, retrying')
+            time.sleep(2 ** attempt)
+
+    path = os.path.join(pipeline.artifacts, f'{source_hash}.zip')
+    os.replace(scratch, path)
+    return {'path': path, 'hash': source_hash, 'bytes': os.path.getsize(path)}
+
+
+def decompress(pipeline, diamond_type, inputs):
+    source = inputs[f'fetch:{diamond_type}']
+    if not is_zip(source['path']):
+        return {'path': source['path'], 'hash': source['hash']}
+    scratch = os.path.join(pipeline.artifacts, f'extract-{diamond_type}-{uuid.uuid4().hex[:8]}.partial')
+    with zipfile.ZipFile(source['path']) as archive, archive.open(zip_csv_member(archive)) as member:
+        # Same digest as content_hash() of the extracted file, so the parse cache keys match
+        csv_hash = save_hashed(member, scratch)
+    path = os.path.join(pipeline.artifacts, f'{csv_hash}.csv')
+    os.replace(scratch, path)
+    return {'path': path, 'hash': csv_hash}
+
+
+def parse(pipeline, diamond_type, inputs):
+    csv = inputs[f'decompress:{diamond_type}']
+    table, derived = load_derived(csv['path'])
+    if table.diamond_type != diamond_type:
+        raise ValidationError(f"{csv['path']} has {table.diamond_type} headers, expected {diamond_type}")
+    return {'path': table.path, 'rows': table.rows}
+
+
+def price(pipeline, diamond_type, inputs):
+    csv = inputs[f'decompress:{diamond_type}']
+    rate, intervals = pipeline.params['exchange_rate'], pipeline.params['intervals']
+    path = os.path.join(pipeline.artifacts, f"prices-{digest_of(csv['hash'], rate, intervals)}.npz")
+    if os.path.exists(path):
+        try:
+            read_prices(path, csv['hash'])
+            return {'path': path, 'hash': csv['hash']}
+        except (RuntimeError, OSError, ValueError):
+            pipeline.log(f'price:{diamond_type}', f'{os.path.basename(path)} does not match, pricing again')
+    table, _ = load_derived(csv['path'])
+    prices = price_table(table, rate, intervals)
+    scratch = path[:-len('.npz')] + '.partial.npz'
+    np.savez(scratch, source_hash=np.array(csv['hash']),
+             **{field: prices[field] for field in PRICE_COLUMNS + ('type',)})
+    os.replace(scratch, path)
+    return {'path': path, 'hash': csv['hash']}
+
+
+def validate(pipeline, diamond_type, inputs):
+    csv = inputs[f'decompress:{diamond_type}']
+    table, _ = load_derived(csv['path'])
+    prices = read_prices(inputs[f'price:{diamond_type}']['path'], csv['hash'])
+    with_id = int((table.strings('itemId').lengths() > 0).sum())
+    report = {
+        'rows': table.rows,
+        'with_item_id': with_id,
+        'priced': int((~np.isnan(prices['finalPriceSek'])).sum()),
+        'lab_rows': int((prices['type'] == 'lab').sum()),
+    }
+    failed = []
+    if table.rows < pipeline.params['min_rows']:
+        failed.append(f"{table.rows:,} rows, fewer than --min-rows {pipeline.params['min_rows']:,}")
+    if table.rows and with_id / table.rows < MIN_ITEM_ID_SHARE:
+        failed.append(f'only {with_id / table.rows:.1%} of rows have an Item ID')
+    previous = latest_state(pipeline.runs_dir, 'completed')
+    previous_rows = previous.stage(f'parse:{diamond_type}').get('output', {}).get('rows') if previous else None
+    if previous_rows:
+        report['previous_rows'] = previous_rows
+        if table.rows < previous_rows * (1 - pipeline.params['max_drop']):
+            failed.append(f'{table.rows:,} rows, down from {previous_rows:,} in run {previous.run_id}')
+    report['failed'] = failed
+    write_json(os.path.join(pipeline.run_dir, f'validate-{diamond_type}.json'), report)
+    if failed:
+        raise ValidationError('; '.join(failed))
+    return report
+
+
+def load(pipeline, diamond_type, inputs):
+    csv = inputs[f'decompress:{diamond_type}']
+    table, derived = load_derived(csv['path'])
+    prices = read_prices(inputs[f'price:{diamond_type}']['path'], csv['hash'])
+    name = f'load:{diamond_type}'
+    checkpoint = pipeline.state.stage(name).get('checkpoint')
+    if checkpoint and checkpoint.get('csv_hash') != csv['hash']:
+        # Chunks staged from another CSV (the snapshot was replaced) can't be continued
+        pipeline.log(name, 'CSV changed since the last attempt, discarding its staged rows')
+        pipeline.sink.discard_branch(diamond_type, checkpoint)
+        checkpoint = None
+    checkpoint = pipeline.sink.open_branch(pipeline.state.run_id, diamond_type, table.rows, checkpoint)
+    checkpoint['csv_hash'] = csv['hash']
+    pipeline.state.update(name, checkpoint=checkpoint)
+    encoder = CopyEncoder(table, prices, derived, checkpoint['job'], pipeline.excluded)
+    chunk_rows = pipeline.params['chunk_rows']
+    done = pipeline.sink.committed(diamond_type)
+    if done:
+        pipeline.log(name, f'resuming after {done:,} of {table.rows:,} rows')
+    copied = 0
+    for start in range(done, table.rows, chunk_rows):
+        stop = min(start + chunk_rows, table.rows)
+        payload, count = encoder.chunk(start, stop, SEQ_BASE[diamond_type] + start)
+        pipeline.sink.write_chunk(diamond_type, payload, stop)
+        copied += count
+    pipeline.sink.close_branch(diamond_type)
+    return {'rows': table.rows, 'copied_this_attempt': copied, **checkpoint}
+
+
+# Each branch stage with the same-type stages it reads
+BRANCH_STAGES = (
+    (fetch, ()),
+    (decompress, ('fetch',)),
+    (parse, ('decompress',)),
+    (price, ('decompress', 'parse')),
+    (validate, ('decompress', 'price')),
+    (load, ('decompress', 'price', 'validate')),
+)
+
+
+def publish(pipeline, inputs):
+    loads = {name.split(':')[1]: output for name, output in inputs.items()}
+    return pipeline.sink.publish(pipeline.state.run_id, loads, pipeline.params['delete_missing'])
+
+
+class CopyFileSink:
+    """Stand-in for the database: COPY payload files with committed-chunk checkpoints"""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.branches = {}
+
+    def pricing(self):
+        return None, None
+
+    def paths(self, run_id, diamond_type):
+        base = os.path.join(self.out_dir, f'{run_id}-{diamond_type}')
+        return base + '.copy', base + '.checkpoint.json'
+
+    def open_branch(self, run_id, diamond_type, total, checkpoint):
+        os.makedirs(self.out_dir, exist_ok=True)
+        data_path, checkpoint_path = self.paths(run_id, diamond_type)
+        committed = {'rows': 0, 'bytes': 0}
+        # Without a checkpoint to continue, files left by an attempt that never recorded one start over
+        if checkpoint and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                committed = json.load(f)
+        f = open(data_path, 'r+b' if os.path.exists(data_path) else 'wb')
+        # Drop whatever a crashed attempt wrote after its last committed chunk
+        f.truncate(committed['bytes'])
+        f.seek(committed['bytes'])
+        self.branches[diamond_type] = {'file': f, 'checkpoint': checkpoint_path, **committed}
+        return checkpoint or {'job': str(uuid.uuid4()), 'copy_file': data_path}
+
+    def committed(self, diamond_type):
+        return self.branches[diamond_type]['rows']
+
+    def discard_branch(self, diamond_type, checkpoint):
+        base = checkpoint['copy_file'][:-len('.copy')]
+        for path in (base + '.copy', base + '.checkpoint.json'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def write_chunk(self, diamond_type, payload, rows_done):
+        branch = self.branches[diamond_type]
+        branch['file'].write(payload)
+        branch['file'].flush()
+        os.fsync(branch['file'].fileno())
+        branch['rows'], branch['bytes'] = rows_done, branch['file'].tell()
+        write_json(branch['checkpoint'], {'rows': branch['rows'], 'bytes': branch['bytes']})
+
+    def close_branch(self, diamond_type):
+        self.branches.pop(diamond_type)['file'].close()
+
+    def fail(self, job, error):
+        pass
+
+    def publish(self, run_id, loads, delete_missing):
+        # One payload in load order (natural, then lab), ready for psql \copy into staging
+        out = os.path.join(self.out_dir, f'{run_id}.copy')
+        with open(out + '.partial', 'wb') as f:
+            for diamond_type in TYPES:
+                if diamond_type in loads:
+                    with open(loads[diamond_type]['copy_file'], 'rb') as part:
+                        shutil.copyfileobj(part, f)
+        os.replace(out + '.partial', out)
+        return {'copy_file': out, 'bytes': os.path.getsize(out), 'types': sorted(loads)}
+
+
+class PostgresSink:
+    """Loads into per-run staging tables of the database, then upserts like the loader"""
+
+    def __init__(self, conninfo):
+        self.conninfo = conninfo
+        self.branches = {}
+
+    def pricing(self):
+        with psycopg.connect(self.conninfo) as conn:
+            return latest_exchange_rate(conn), markup_intervals(conn)
+
+    def open_branch(self, run_id, diamond_type, total, checkpoint):
+        conn = psycopg.connect(self.conninfo, autocommit=True)
+        if checkpoint is None:
+            jobs = ImportJobs(self.conninfo)
+            try:
+                job = str(jobs.create(diamond_type, total))
+            finally:
+                jobs.close()
+            checkpoint = {'job': job, 'staging': f'DiamondStaging_{run_id}_{diamond_type}'}
+        if conn.execute('SELECT to_regclass(%s)', (f'"{checkpoint["staging"]}"',)).fetchone()[0] is None:
+            conn.execute(staging_ddl(checkpoint['staging']))
+        conn.execute('UPDATE "ImportJob" SET status = \'IN_PROGRESS\', "updatedAt" = NOW() WHERE id = %s',
+                     (checkpoint['job'],))
+        self.branches[diamond_type] = {'conn': conn, **checkpoint}
+        return checkpoint
+
+    def discard_branch(self, diamond_type, checkpoint):
+        with psycopg.connect(self.conninfo, autocommit=True) as conn:
+            conn.execute(sql.SQL('DROP TABLE IF EXISTS {}').format(sql.Identifier(checkpoint['staging'])))
+        self.fail(checkpoint['job'], 'superseded: the feed CSV changed before the load finished')
+
+    def committed(self, diamond_type):
+        branch = self.branches[diamond_type]
+        row = branch['conn'].execute('SELECT "processedRecords" FROM "ImportJob" WHERE id = %s',
+                                     (branch['job'],)).fetchone()
+        return (row[0] or 0) if row else 0
+
+    def write_chunk(self, diamond_type, payload, rows_done):
+        branch = self.branches[diamond_type]
+        conn = branch['conn']
+        copy_sql = sql.SQL('COPY {} ({}) FROM STDIN').format(
+            sql.Identifier(branch['staging']), sql.SQL(', ').join(sql.Identifier(c) for c in STAGING_COLUMNS))
+        # The chunk and its checkpoint commit together
+        with conn.transaction():
+            with conn.cursor() as cur, cur.copy(copy_sql) as copy:
+                copy.write(payload)
+            conn.execute('UPDATE "ImportJob" SET "processedRecords" = %s, "updatedAt" = NOW() WHERE id = %s',
+                         (rows_done, branch['job']))
+
+    def close_branch(self, diamond_type):
+        self.branches.pop(diamond_type)['conn'].close()
+
+    def publish(self, run_id, loads, delete_missing):
+        view = f'DiamondStaging_{run_id}'
+        summary = {'types': sorted(loads)}
+        with psycopg.connect(self.conninfo) as conn:
+            present = [conn.execute('SELECT to_regclass(%s)', (f'"{load["staging"]}"',)).fetchone()[0]
+                       for load in loads.values()]
+            if not any(present):
+                # A previous attempt committed the publish but didn't record it
+                summary['already_published'] = True
+                return summary
+            with conn.cursor() as cur:
+                tables = [sql.Identifier(load['staging']) for load in loads.values()]
+                for table in tables:
+                    cur.execute(sql.SQL('CREATE INDEX ON {} ("itemId", seq)').format(table))
+                    cur.execute(sql.SQL('ANALYZE {}').format(table))
+                # Both branches' staging as one relation for the loader's upsert and delete
+                cur.execute(sql.SQL('CREATE TEMP VIEW {} AS {}').format(
+                    sql.Identifier(view),
+                    sql.SQL(' UNION ALL ').join(sql.SQL('SELECT * FROM {}').format(t) for t in tables)))
+                cur.execute(upsert_sql(view))
+                summary['upserted'] = cur.rowcount
+                summary['deleted'] = 0
+                if delete_missing:
+                    cur.execute(delete_missing_sql(view), (sorted(loads),))
+                    summary['deleted'] = cur.rowcount
+                cur.execute(sql.SQL('DROP VIEW {}').format(sql.Identifier(view)))
+                for table, load in zip(tables, loads.values()):
+                    cur.execute(sql.SQL('DROP TABLE {}').format(table))
+                    cur.execute('UPDATE "ImportJob" SET status = \'COMPLETED\', "completedAt" = NOW(), '
+                                '"updatedAt" = NOW() WHERE id = %s', (load['job'],))
+        return summary
+
+    def fail(self, job, error):
+        with psycopg.connect(self.conninfo, autocommit=True) as conn:
+            conn.execute('UPDATE "ImportJob" SET status = \'FAILED\', error = %s, "updatedAt" = NOW() '
+                         'WHERE id = %s', (error, job))
+
+
+class Pipeline:
+    """Runs the stage DAG of one run, skipping stages already completed"""
+
+    def __init__(self, work_dir, state, sink, log=print):
+        self.work_dir = work_dir
+        self.runs_dir = os.path.join(work_dir, 'runs')
+        self.artifacts = os.path.join(work_dir, 'artifacts')
+        os.makedirs(self.artifacts, exist_ok=True)
+        self.state = state
+        self.run_dir = os.path.dirname(state.path)
+        self.params = state.params
+        self.sink = sink
+        self.excluded = set().union(*(read_quarantine(path) for path in self.params['quarantine']))
+        self.print = log
+        self.stages = {}
+        for diamond_type in self.params['types']:
+            for step, deps in BRANCH_STAGES:
+                self.stages[f'{step.__name__}:{diamond_type}'] = (
+                    [f'{dep}:{diamond_type}' for dep in deps],
+                    lambda inputs, step=step, diamond_type=diamond_type: step(self, diamond_type, inputs))
+        self.stages['publish'] = ([f'load:{t}' for t in self.params['types']],
+                                  lambda inputs: publish(self, inputs))
+
+    def log(self, name, message):
+        self.print(f'  [{name}] {message}')
+
+    def reusable(self, name, key):
+        """A completed stage with the same inputs whose files are still there, unchanged"""
+        done = self.state.stage(name)
+        if done.get('status') != 'completed' or done.get('key') != key:
+            return False
+        output = done.get('output', {})
+        if output.get('path') is not None and not os.path.exists(output['path']):
+            return False
+        files = dict(done.get('files', {}))
+        # A replaced snapshot is copied again; one that was removed since leaves its copy in use
+        if output.get('source') and os.path.exists(output['source']):
+            files[output['source']] = output['source_identity']
+        return all(os.path.isfile(path) and file_identity(path) == identity for path, identity in files.items())
+
+    def execute(self, name, key, inputs):
+        self.state.update(name, status='running', key=key, error=None)
+        started = time.perf_counter()
+        output = self.stages[name][1](inputs)
+        seconds = time.perf_counter() - started
+        path = output.get('path')
+        files = {path: file_identity(path)} if path and os.path.isfile(path) else {}
+        self.state.update(name, status='completed', output=output, files=files, seconds=round(seconds, 2))
+        self.log(name, f'done in {seconds:.1f}s')
+        return output
+
+    def run(self, workers=None):
+        """Run every stage whose dependencies are met, independent ones in parallel"""
+        outputs = {}
+        pending = dict(self.stages)
+        running = {}
+        failed = {}
+        with ThreadPoolExecutor(max_workers=workers or len(self.params['types']) * 2) as pool:
+            while pending or running:
+                # Stages downstream of a failure never become ready; the other branch carries on
+                progressed = True
+                while progressed:
+                    progressed = False
+                    for name, (deps, _) in list(pending.items()):
+                        if not all(d in outputs for d in deps):
+                            continue
+                        inputs = {d: outputs[d] for d in deps}
+                        key = digest_of(name, inputs)
+                        del pending[name]
+                        if self.reusable(name, key):
+                            outputs[name] = self.state.stage(name)['output']
+                            self.log(name, 'already completed, skipped')
+                            progressed = True
+                        else:
+                            running[pool.submit(self.execute, name, key, inputs)] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        outputs[name] = future.result()
+                    except Exception as error:
+                        failed[name] = error
+                        self.state.update(name, status='failed', error=f'{type(error).__name__}: {error}')
+                        self.log(name, f'failed: {error}')
+                        if not isinstance(error, ValidationError):
+                            traceback.print_exc()
+
+        if failed:
+            self.state.finish('failed')
+            for name, error in failed.items():
+                job = self.state.stage(name).get('checkpoint', {}).get('job')
+                if job:
+                    self.sink.fail(job, str(error))
+            return False
+        self.state.finish('completed')
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resumable nightly IDEX feed refresh')
+    parser.add_argument('--work', default='feed-pipeline', help='Directory for runs and artifacts')
+    parser.add_argument('--types', default='natural,lab', help='Comma-separated feed types to refresh')
+    parser.add_argument('--natural', help='Use this natural snapshot (.csv or .zip) instead of fetching')
+    parser.add_argument('--lab', help='Use this lab-grown snapshot (.csv or .zip) instead of fetching')
+    parser.add_argument('--api-base', default=os.environ.get('IDEX_API_BASE_URL', IDEX_API_BASE_URL),
+                        help='IDEX API base URL (credentials from IDEX_API_KEY / IDEX_API_SECRET)')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='PostgreSQL connection URL (default: $DATABASE_URL)')
+    parser.add_argument('--copy-out', help='Load into COPY files in this directory instead of a database')
+    parser.add_argument('--rate', type=float, help='USD to SEK rate (default: latest ExchangeRate row)')
+    parser.add_argument('--intervals', help='Markup intervals JSON (default: MarkupInterval rows)')
+    parser.add_argument('--quarantine', action='append', default=[],
+                        help='Skip the item IDs in this CSV, like the loader; repeatable')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='Rows per committed chunk')
+    parser.add_argument('--min-rows', type=int, default=1, help='Fail validation below this many rows')
+    parser.add_argument('--max-drop', type=float, default=DEFAULT_MAX_DROP,
+                        help='Fail validation when a feed shrank by more than this share since the last run')
+    parser.add_argument('--keep-missing', action='store_true',
+                        help='Keep diamonds of the loaded types that are no longer in the feed')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help='Download retries on 5xx')
+    parser.add_argument('--new', action='store_true', help='Start a new run even if the last one is unfinished')
+    args = parser.parse_args()
+
+    if args.copy_out:
+        sink = CopyFileSink(args.copy_out)
+    elif args.database_url:
+        sink = PostgresSink(args.database_url)
+    else:
+        parser.error('set DATABASE_URL, pass --database-url or --copy-out')
+
+    runs_dir = os.path.join(args.work, 'runs')
+    state = latest_state(runs_dir)
+    if state and state.data['status'] != 'completed' and not args.new:
+        # Parameters, including the rate and intervals, come from the run being resumed
+        print(f"Resuming run {state.run_id} ({state.data['status']})")
+    else:
+        rate, intervals = args.rate, load_intervals(args.intervals) if args.intervals else None
+        if rate is None or intervals is None:
+            stored_rate, stored_intervals = sink.pricing()
+            rate = stored_rate if rate is None else rate
+            intervals = stored_intervals if intervals is None else intervals
+        if intervals is None:
+            print('No --intervals given, using fallback intervals (1.0 multiplier)')
+            intervals = {'natural': fallback_intervals(), 'lab': fallback_intervals()}
+        params = {
+            'types': [t for t in TYPES if t in args.types.split(',')],
+            'sources': {t: os.path.abspath(p) for t, p in (('natural', args.natural), ('lab', args.lab)) if p},
+            'api_base': args.api_base,
+            'exchange_rate': rate,
+            'intervals': intervals,
+            'quarantine': [os.path.abspath(p) for p in args.quarantine],
+            'chunk_rows': args.chunk_rows,
+            'min_rows': args.min_rows,
+            'max_drop': args.max_drop,
+            'delete_missing': not args.keep_missing,
+            'retries': args.retries,
+        }
+        os.makedirs(runs_dir, exist_ok=True)
+        state = RunState.create(runs_dir, params)
+        print(f'Starting run {state.run_id}')
+
+    started = time.perf_counter()
+    pipeline = Pipeline(args.work, state, sink)
+    ok = pipeline.run()
+    print(f"\n=== Run {state.run_id} {state.data['status']} ({time.perf_counter() - started:.1f}s) ===")
+    for name, stage in state.data['stages'].items():
+        print(f"  {name:<20} {stage.get('status', ''):<10} {stage.get('seconds', '')}")
+    print(f"Saved to: {state.path}")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""Feed vs Diamond table reconciliation by bucket digests.
+
+check-db-vs-fresh.js, compare-sample-vs-db.js and verify-prices.ts pull
+diamonds one by one. This compares a whole catalogue while moving only
+digests, Merkle-style:
+
+- every row the loader would write (last listing of an Item ID, without
+  quarantined IDs, priced with the database's rate and intervals) is
+  hashed over a canonical text of all its columns; the database computes
+  the same hash in SQL. Floats are compared by their IEEE bits
+  (float8send), text as stored, so no formatting differs between sides
+- rows fall into buckets by the leading bits of md5(itemId); a bucket's
+  digest is its row count and the sum of its row hashes, computed with one
+  GROUP BY over "Diamond" and with numpy over the feed
+- buckets whose digests differ are split into 2**fanout_bits sub-buckets
+  and compared again, until a bucket holds at most `leaf_rows` rows; then
+  row hashes are compared, and only rows with different hashes are
+  fetched whole to name the differing columns
+
+A row is `missing` (in the feed, not in the database), `stale` (in the
+database, not in the feed), `mispriced` (only SEK prices differ: an old
+rate or markup) or `changed`. An unchanged catalogue costs one scan and
+2**initial_bits digests.
+
+Requires numpy and psycopg.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+import numpy as np
+import psycopg
+from psycopg import sql
+
+from .anomalies import read_quarantine
+from .derived import DERIVED_COLUMNS, load_derived
+from .loader import FEED_COLUMNS, FLOAT_COLUMNS, latest_exchange_rate, markup_intervals, pair_separable, price_table
+from .repricing import PRICE_COLUMNS, load_intervals
+
+DEFAULT_INITIAL_BITS = 10
+DEFAULT_FANOUT_BITS = 4
+DEFAULT_LEAF_ROWS = 64
+DETAIL_BATCH = 1000
+CHUNK_ROWS = 50_000
+FIELDS = FEED_COLUMNS + ('type',)
+SEPARATOR = '\x1f'
+HASH_MASK = (1 << 64) - 1
+
+BUCKET_SQL = sql.SQL("""('x' || substr(md5("itemId"), 1, 8))::bit(32)::bigint""")
+
+
+def is_float(field):
+    return field in FLOAT_COLUMNS or DERIVED_COLUMNS.get(field) == 'double precision'
+
+
+def column_sql(field):
+    """Canonical text of one column, as Python computes it in FeedSide.cells()"""
+    if is_float(field):
+        return sql.SQL("coalesce(encode(float8send({}), 'hex'), '')").format(sql.Identifier(field))
+    return sql.SQL("coalesce({}::text, '')").format(sql.Identifier(field))
+
+
+def row_hash_sql():
+    text = sql.SQL('concat_ws(chr(31), {})').format(sql.SQL(', ').join(column_sql(f) for f in FIELDS))
+    return sql.SQL("('x' || substr(md5({}), 1, 15))::bit(60)::bigint").format(text)
+
+
+def item_bucket(item_id):
+    return int(hashlib.md5(item_id.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def row_hash(cells):
+    return int(hashlib.md5(SEPARATOR.join(cells).encode('utf-8')).hexdigest()[:15], 16)
+
+
+def float_cells(values):
+    values = np.asarray(values, dtype='>f8')
+    raw = values.tobytes().hex()
+    return ['' if v != v else raw[16 * i:16 * i + 16] for i, v in enumerate(values.tolist())]
+
+
+def string_cells(column, rows):
+    starts = np.asarray(column.offsets[rows]).tolist()
+    ends = np.asarray(column.offsets[rows + 1]).tolist()
+    if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+        # A contiguous chunk: one read of the blob
+        base = starts[0]
+        blob = column.data[base:ends[-1]].tobytes()
+        return [blob[a - base:b - base].decode('utf-8', 'replace') for a, b in zip(starts, ends)]
+    return [column.data[a:b].tobytes().decode('utf-8', 'replace') for a, b in zip(starts, ends)]
+
+
+def digests(buckets, hashes, shift):
+    """{bucket >> shift: (rows, sum of row hashes mod 2**64)}"""
+    keys = buckets >> shift
+    order = np.argsort(keys, kind='stable')
+    keys, hashes = keys[order], hashes[order]
+    if not len(keys):
+        return {}
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+    sums = np.add.reduceat(hashes, starts)
+    return {k: (c, s) for k, c, s in zip(keys[starts].tolist(), counts.tolist(), sums.tolist())}
+
+
+class FeedSide:
+    """Row hashes of what the loader would write from the feeds"""
+
+    def __init__(self, feeds, exchange_rate, intervals, excluded=()):
+        self.sources = []
+        owner = {}
+        for s, feed in enumerate(feeds):
+            table, derived = load_derived(feed)
+            prices = price_table(table, exchange_rate, intervals)
+            labels = {}
+            for field in FEED_COLUMNS:
+                if table.columns.get(field, {}).get('kind') == 'categorical':
+                    labels[field] = table.labels(field)
+                    if field == 'pairSeparable':
+                        labels[field] = [pair_separable(label) for label in labels[field]]
+            self.sources.append((table, prices, derived, labels))
+            # The upsert keeps the last staged row of an Item ID
+            item_ids = table.strings('itemId')
+            for row, item_id in enumerate(item_ids):
+                if item_id and item_id not in excluded:
+                    owner[item_id] = (s, row)
+
+        self.item_ids = list(owner)
+        self.source = np.fromiter((s for s, _ in owner.values()), dtype=np.int32, count=len(owner))
+        self.row = np.fromiter((r for _, r in owner.values()), dtype=np.int64, count=len(owner))
+        self.bucket = np.fromiter((item_bucket(i) for i in self.item_ids), dtype=np.int64, count=len(owner))
+        self.hash = np.zeros(len(owner), dtype=np.uint64)
+        self.types = set()
+        for s, (table, prices, _, _) in enumerate(self.sources):
+            picked = np.flatnonzero(self.source == s)
+            picked = picked[np.argsort(self.row[picked], kind='stable')]
+            rows = self.row[picked]
+            self.types.update(np.unique(prices['type'][rows]).tolist())
+            # Contiguous chunks keep string reads sequential; only the owning rows are hashed
+            for start in range(0, table.rows, CHUNK_ROWS):
+                stop = min(start + CHUNK_ROWS, table.rows)
+                lo, hi = np.searchsorted(rows, [start, stop]).tolist()
+                if lo == hi:
+                    continue
+                wanted = np.zeros(stop - start, dtype=bool)
+                wanted[rows[lo:hi] - start] = True
+                self.hash[picked[lo:hi]] = [row_hash(cells) for cells, w
+                                            in zip(self.cells(s, np.arange(start, stop)), wanted) if w]
+        self.index = None
+
+    def cells(self, s, rows):
+        """Canonical column texts of the given rows of source s, one tuple per row"""
+        table, prices, derived, labels = self.sources[s]
+        columns = []
+        for field in FEED_COLUMNS:
+            if field in PRICE_COLUMNS:
+                columns.append(float_cells(prices[field][rows]))
+            elif field in DERIVED_COLUMNS:
+                values = np.asarray(derived[field][rows])
+                if values.dtype == np.bool_:
+                    columns.append(['true' if v else 'false' for v in values.tolist()])
+                elif values.dtype.kind == 'f':
+                    columns.append(float_cells(values))
+                else:
+                    columns.append(['' if v < 0 else str(v) for v in values.tolist()])
+            else:
+                kind = table.columns.get(field, {}).get('kind')
+                if kind is None:
+                    columns.append([''] * len(rows))
+                elif kind == 'numeric':
+                    columns.append(float_cells(np.asarray(table.numeric(field))[rows]))
+                elif kind == 'categorical':
+                    field_labels = labels[field]
+                    columns.append([field_labels[c] for c in np.asarray(table.codes(field))[rows].tolist()])
+                else:
+                    columns.append(string_cells(table.strings(field), rows))
+        columns.append(prices['type'][rows].tolist())
+        return list(zip(*columns))
+
+    def select(self, shift, buckets):
+        return np.isin(self.bucket >> shift, np.asarray(buckets, dtype=np.int64))
+
+    def digests(self, bits, parent_bits, parents):
+        picked = self.select(32 - parent_bits, parents)
+        return digests(self.bucket[picked], self.hash[picked], 32 - bits)
+
+    def row_hashes(self, bits, buckets):
+        picked = np.flatnonzero(self.select(32 - bits, buckets))
+        return {self.item_ids[i]: h for i, h in zip(picked.tolist(), self.hash[picked].tolist())}
+
+    def rows(self, item_ids):
+        """{itemId: canonical cells} for the given Item IDs"""
+        if self.index is None:
+            self.index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        picked = np.array(sorted(self.index[i] for i in item_ids), dtype=np.int64)
+        found = {}
+        for s in range(len(self.sources)):
+            mine = picked[self.source[picked] == s]
+            if len(mine):
+                order = np.argsort(self.row[mine], kind='stable')
+                mine = mine[order]
+                for i, cells in zip(mine.tolist(), self.cells(s, self.row[mine])):
+                    found[self.item_ids[i]] = cells
+        return found
+
+
+class DatabaseSide:
+    """The same digests, computed by Postgres over "Diamond" rows of the given types"""
+
+    def __init__(self, conn, types):
+        self.conn = conn
+        self.types = sorted(types)
+        self.hashed = sql.SQL(
+            'SELECT {bucket} AS bucket, "itemId", {hash} AS h FROM "Diamond" WHERE type::text = ANY(%s::text[])'
+        ).format(bucket=BUCKET_SQL, hash=row_hash_sql())
+
+    def digests(self, bits, parent_bits, parents):
+        query = sql.SQL('SELECT bucket >> %s::int, count(*), sum(h) FROM ({}) d '
+                        'WHERE bucket >> %s::int = ANY(%s::bigint[]) GROUP BY 1').format(self.hashed)
+        rows = self.conn.execute(query, (32 - bits, self.types, 32 - parent_bits, list(parents)))
+        return {b: (count, int(total) & HASH_MASK) for b, count, total in rows}
+
+    def row_hashes(self, bits, buckets):
+        query = sql.SQL('SELECT "itemId", h FROM ({}) d '
+                        'WHERE bucket >> %s::int = ANY(%s::bigint[])').format(self.hashed)
+        return dict(self.conn.execute(query, (self.types, 32 - bits, list(buckets))))
+
+    def rows(self, item_ids):
+        query = sql.SQL('SELECT "itemId", {} FROM "Diamond" WHERE "itemId" = ANY(%s::text[])').format(
+            sql.SQL(', ').join(column_sql(f) for f in FIELDS))
+        return {row[0]: row[1:] for row in self.conn.execute(query, (list(item_ids),))}
+
+
+def classify(ours, theirs):
+    """Status and differing columns of a row present on both sides"""
+    fields = [f for f, a, b in zip(FIELDS, ours, theirs) if a != b]
+    return ('mispriced' if fields and set(fields) <= set(PRICE_COLUMNS) else 'changed'), fields
+
+
+def reconcile(feed, database, initial_bits=DEFAULT_INITIAL_BITS, fanout_bits=DEFAULT_FANOUT_BITS,
+              leaf_rows=DEFAULT_LEAF_ROWS, log=print):
+    """Compare both sides top-down; returns (differences, levels)"""
+    differences = []
+    levels = []
+    bits, parent_bits, parents = initial_bits, 0, [0]
+    while parents:
+        ours = feed.digests(bits, parent_bits, parents)
+        theirs = database.digests(bits, parent_bits, parents)
+        differing = sorted(b for b in ours.keys() | theirs.keys() if ours.get(b) != theirs.get(b))
+        largest = {b: max(ours.get(b, (0, 0))[0], theirs.get(b, (0, 0))[0]) for b in differing}
+        split = [b for b in differing if largest[b] > leaf_rows and bits < 32]
+        leaves = [b for b in differing if b not in set(split)]
+        level = {'bits': bits, 'buckets': len(ours.keys() | theirs.keys()), 'digests': len(theirs),
+                 'differing': len(differing), 'leaves': len(leaves), 'row_hashes': 0}
+        if leaves:
+            mine = feed.row_hashes(bits, leaves)
+            stored = database.row_hashes(bits, leaves)
+            level['row_hashes'] = len(stored)
+            differences += [(item_id, 'missing', []) for item_id in sorted(mine.keys() - stored.keys())]
+            differences += [(item_id, 'stale', []) for item_id in sorted(stored.keys() - mine.keys())]
+            both = sorted(i for i in mine.keys() & stored.keys() if mine[i] != stored[i])
+            for start in range(0, len(both), DETAIL_BATCH):
+                batch = both[start:start + DETAIL_BATCH]
+                ours_rows, their_rows = feed.rows(batch), database.rows(batch)
+                differences += [(i, *classify(ours_rows[i], their_rows[i])) for i in batch]
+        levels.append(level)
+        log(f"  {bits:>2} bits: {level['buckets']:,} buckets, {len(differing):,} differ, "
+            f"{len(leaves):,} compared row by row")
+        bits, parent_bits, parents = min(32, bits + fanout_bits), bits, split
+    return differences, levels
+
+
+def write_report(out_dir, differences, summary):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'differences.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['itemId', 'status', 'fields'])
+        for item_id, status, fields in sorted(differences, key=lambda d: (d[1], d[0])):
+            writer.writerow([item_id, status, ' '.join(fields)])
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcile IDEX feeds with the Diamond table by bucket digests')
+    parser.add_argument('feeds', nargs='+', help='Feed .csv or .zip files, as imported')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='PostgreSQL connection URL (default: $DATABASE_URL)')
+    parser.add_argument('--rate', type=float, help='USD to SEK rate (default: latest ExchangeRate row)')
+    parser.add_argument('--intervals', help='Markup intervals JSON (default: MarkupInterval rows)')
+    parser.add_argument('--quarantine', action='append', default=[],
+                        help='Item IDs the loader skipped (--quarantine of idex_feed.loader); repeatable')
+    parser.add_argument('--initial-bits', type=int, default=DEFAULT_INITIAL_BITS,
+                        help='First level has 2**bits buckets')
+    parser.add_argument('--fanout-bits', type=int, default=DEFAULT_FANOUT_BITS,
+                        help='Each differing bucket splits into 2**bits')
+    parser.add_argument('--leaf-rows', type=int, default=DEFAULT_LEAF_ROWS,
+                        help='Compare row hashes once a bucket holds this many rows')
+    parser.add_argument('--out', default='feed-reconcile', help='Output directory')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('set DATABASE_URL or pass --database-url')
+
+    started = time.perf_counter()
+    excluded = set().union(*(read_quarantine(path) for path in args.quarantine))
+    with psycopg.connect(args.database_url) as conn:
+        rate = args.rate if args.rate is not None else latest_exchange_rate(conn)
+        intervals = load_intervals(args.intervals) if args.intervals else markup_intervals(conn)
+        feed = FeedSide(args.feeds, rate, intervals, excluded)
+        print(f"Hashed {len(feed.item_ids):,} feed rows ({', '.join(sorted(feed.types))}) "
+              f"in {time.perf_counter() - started:.1f}s")
+        differences, levels = reconcile(feed, DatabaseSide(conn, feed.types), args.initial_bits,
+                                        args.fanout_bits, args.leaf_rows)
+
+    counts = Counter(status for _, status, _ in differences)
+    summary = {
+        'feeds': [os.path.basename(f) for f in args.feeds],
+        'exchange_rate': rate,
+        'types': sorted(feed.types),
+        'rows': len(feed.item_ids),
+        'differences': {status: counts[status] for status in ('missing', 'stale', 'mispriced', 'changed')},
+        'fields': dict(Counter(f for _, _, fields in differences for f in fields).most_common()),
+        'levels': levels,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+    write_report(args.out, differences, summary)
+    print(f"{len(differences):,} differences: " + ', '.join(f'{n:,} {s}' for s, n in summary['differences'].items()))
+    print(f"Saved to: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""Batch repricing of a whole feed, mirroring the importer's SEK pricing.
+
+Reproduces what fetchDiamondsStream() writes for every diamond:
+
+- totalPriceSek = totalPrice * USD->SEK rate
+- priceWithMarkupSek = totalPriceSek * getMarkupMultiplier(carat, type, intervals)
+- finalPriceSek = Math.round(priceWithMarkupSek / 100) * 100
+
+Interval membership is resolved for all carats at once with a binary search
+over the interval minimums, keeping the importer's rule that every range
+excludes its upper bound except the last one. Diamonds without a carat, or
+priced with no intervals, get no markup, exactly like the importer.
+
+Requires numpy.
+"""
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+from .columnar import load_table
+
+PRICE_COLUMNS = ('totalPriceSek', 'priceWithMarkupSek', 'finalPriceSek')
+
+
+def fallback_intervals():
+    """Same ranges as getFallbackIntervals() in markup-intervals.server.ts"""
+    intervals = []
+    for i in range(50):
+        min_carat = i * 0.1
+        max_carat = min_carat + 0.09
+        if i == 49:
+            intervals.append({'min': 4.9, 'max': 5.0, 'multiplier': 1.0})
+        else:
+            intervals.append({'min': min_carat, 'max': max_carat, 'multiplier': 1.0})
+    return intervals
+
+
+def normalize_interval(interval):
+    """Accept CaratRange ({min, max}) or MarkupInterval ({minCarat, maxCarat}) rows"""
+    return {
+        'min': float(interval.get('min', interval.get('minCarat'))),
+        'max': float(interval.get('max', interval.get('maxCarat'))),
+        'multiplier': float(interval['multiplier']),
+    }
+
+
+def load_intervals(file_path):
+    """Read {natural: [...], lab: [...]} markup intervals from a JSON export.
+
+    A flat list of MarkupInterval rows (each with a `type`) is accepted too.
+    """
+    with open(file_path) as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        grouped = {'natural': [], 'lab': []}
+        for interval in data:
+            grouped[interval['type']].append(interval)
+        data = grouped
+    return {
+        diamond_type: [normalize_interval(i) for i in data.get(diamond_type, [])]
+        for diamond_type in ('natural', 'lab')
+    }
+
+
+class MarkupTable:
+    """Vectorized getMarkupMultiplier() over one type's intervals"""
+
+    def __init__(self, intervals):
+        # Intervals come ordered by minCarat, as getMarkupIntervals() returns them
+        intervals = sorted(intervals, key=lambda i: i['min'])
+        self.mins = np.array([i['min'] for i in intervals], dtype=np.float64)
+        self.maxs = np.array([i['max'] for i in intervals], dtype=np.float64)
+        self.multipliers_by_range = np.array([i['multiplier'] for i in intervals], dtype=np.float64)
+        self.overlapping = bool(np.any(self.maxs[:-1] > self.mins[1:]))
+
+    def __len__(self):
+        return len(self.mins)
+
+    def multipliers(self, carats):
+        """Multiplier per carat; 0 where no range matches or carat <= 0"""
+        carats = np.asarray(carats, dtype=np.float64)
+        out = np.zeros(len(carats), dtype=np.float64)
+        if not len(self):
+            return out
+        valid = carats > 0
+
+        if self.overlapping:
+            # find() returns the first match, so walk ranges back to front
+            last = len(self) - 1
+            for i in range(last, -1, -1):
+                upper = carats <= self.maxs[i] if i == last else carats < self.maxs[i]
+                hit = valid & (carats >= self.mins[i]) & upper
+                out[hit] = self.multipliers_by_range[i]
+            return out
+
+        idx = np.searchsorted(self.mins, carats, side='right') - 1
+        found = valid & (idx >= 0)
+        idx = np.where(found, idx, 0)
+        last = idx == len(self) - 1
+        below_max = np.where(last, carats <= self.maxs[idx], carats < self.maxs[idx])
+        hit = found & below_max
+        out[hit] = self.multipliers_by_range[idx[hit]]
+        return out
+
+
+def js_round(values):
+    """Math.round(): halves round towards +infinity"""
+    return np.floor(values + 0.5)
+
+
+def reprice(table, exchange_rate, intervals):
+    """Price every row of a FeedTable; returns a dict of column arrays.
+
+    `intervals` maps 'natural'/'lab' to lists of {min, max, multiplier}.
+    Rows without a usable USD price get NaN in all SEK columns.
+    """
+    carat = np.asarray(table.numeric('carat'))
+    total_price = np.asarray(table.numeric('totalPrice'))
+
+    # Lab-grown stones are also recognised by an "LG" certificate number
+    is_lab = table.strings('certificateNumber').contains('LG', ignore_case=True)
+    if table.diamond_type == 'lab':
+        is_lab[:] = True
+
+    total_sek = total_price * exchange_rate
+    with_markup = total_sek.copy()
+
+    has_carat = ~np.isnan(carat) & (carat != 0)
+    for diamond_type, rows in (('natural', ~is_lab), ('lab', is_lab)):
+        markup = MarkupTable(intervals.get(diamond_type, []))
+        if not len(markup):
+            continue
+        rows = rows & has_carat
+        with_markup[rows] = total_sek[rows] * markup.multipliers(carat[rows])
+
+    return {
+        'itemId': table.strings('itemId'),
+        'type': np.where(is_lab, 'lab', 'natural'),
+        'carat': carat,
+        'totalPrice': total_price,
+        'totalPriceSek': total_sek,
+        'priceWithMarkupSek': with_markup,
+        'finalPriceSek': js_round(with_markup / 100) * 100,
+    }
+
+
+def format_price(value):
+    return '' if value != value else repr(float(value))
+
+
+def write_prices(prices, file_path):
+    """Write repriced rows as CSV, one line per diamond"""
+    columns = ('itemId', 'type', 'carat', 'totalPrice') + PRICE_COLUMNS
+    with open(file_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        item_ids = prices['itemId']
+        numeric = [prices[c] for c in columns[2:]]
+        for i in range(len(item_ids)):
+            writer.writerow([item_ids[i], prices['type'][i]] + [format_price(col[i]) for col in numeric])
+
+
+def diff_prices(prices, expected_path, tolerance=0.01, max_examples=20):
+    """Compare repriced rows with an export of what the importer wrote.
+
+    The export is a CSV with an itemId column and any of totalPriceSek,
+    priceWithMarkupSek and finalPriceSek, e.g. from
+    \\copy (SELECT "itemId", "totalPriceSek", "priceWithMarkupSek", "finalPriceSek" FROM "Diamond") TO 'db-prices.csv' CSV HEADER
+    """
+    row_of = {item_id: i for i, item_id in enumerate(prices['itemId'])}
+    report = {'compared': 0, 'missing_in_feed': 0, 'mismatched': 0, 'examples': []}
+
+    with open(expected_path, newline='') as f:
+        reader = csv.DictReader(f)
+        columns = [c for c in PRICE_COLUMNS if c in reader.fieldnames]
+        for record in reader:
+            i = row_of.get(record['itemId'])
+            if i is None:
+                report['missing_in_feed'] += 1
+                continue
+            report['compared'] += 1
+            diffs = {}
+            for column in columns:
+                expected = float(record[column]) if record[column] else float('nan')
+                actual = float(prices[column][i])
+                both_missing = expected != expected and actual != actual
+                if not both_missing and not abs(expected - actual) <= tolerance:
+                    diffs[column] = {'expected': expected, 'actual': actual}
+            if diffs:
+                report['mismatched'] += 1
+                if len(report['examples']) < max_examples:
+                    report['examples'].append({'itemId': record['itemId'], **diffs})
+
+    report['missing_in_db'] = len(row_of) - report['compared']
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reprice a whole IDEX feed in SEK')
+    parser.add_argument('feed', help='Feed .csv or .zip')
+    parser.add_argument('--rate', type=float, required=True, help='USD to SEK exchange rate')
+    parser.add_argument('--intervals', help='Markup intervals JSON (defaults to the fallback intervals)')
+    parser.add_argument('--out', help='Write repriced rows to this CSV')
+    parser.add_argument('--diff', help='Compare against a CSV export of the Diamond table')
+    args = parser.parse_args()
+
+    if args.intervals:
+        intervals = load_intervals(args.intervals)
+    else:
+        print('No --intervals given, using fallback intervals (1.0 multiplier)')
+        intervals = {'natural': fallback_intervals(), 'lab': fallback_intervals()}
+
+    table = load_table(args.feed)
+    prices = reprice(table, args.rate, intervals)
+    print(f"Repriced {table.rows:,} {table.diamond_type} diamonds at {args.rate} SEK/USD")
+
+    if args.out:
+        write_prices(prices, args.out)
+        print(f"Saved to: {args.out}")
+
+    if args.diff:
+        report = diff_prices(prices, args.diff)
+        print(json.dumps(report, indent=2))
+        if report['mismatched']:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""Item ID -> byte offset index for reading single rows of a raw feed.
+
+find-the-one-diamond.js, debug-line-9.js and check-raw-data.js read a
+whole snapshot to look at one stone. This builds, once per snapshot, a
+sorted index of every row's Item ID with the row's byte offset, byte
+length and line number, saved next to the columnar cache:
+
+    <dir>/.idex-cache/<content hash>/rowindex/
+        keys.npy     Item IDs, fixed-width bytes, sorted
+        offsets.npy  int64 byte offset of each row
+        lengths.npy  uint32 row length without the line break
+        lines.npy    int64 line number in the file (the header is line 1)
+
+A lookup binary-searches the memory-mapped keys (numpy.searchsorted, a
+whole batch at once) and splits only the matching rows of the
+memory-mapped CSV, on ',' like the importer. A relisted Item ID has one
+entry per row, in file order; the last is the one the importer keeps.
+
+The content hash is the one sources.content_hash() remembers with the
+file's size and mtime, so reopening an unchanged snapshot does not read
+it again; `verify=True` (`--verify`) always re-hashes. Row lookups need
+the extracted CSV, not the zip.
+
+Requires numpy.
+"""
+import argparse
+import json
+import mmap
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from .parallel import read_header
+from .scan import FeedSchema
+from .sources import content_hash, default_cache_root, is_zip, resolve_feed
+
+INDEX_VERSION = 1
+INDEX_DIR = 'rowindex'
+BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def line_bounds(mm, start):
+    """(starts, ends) of the non-empty lines from byte `start` on, line breaks excluded"""
+    data = np.frombuffer(mm, dtype=np.uint8)
+    try:
+        newlines = np.concatenate([np.zeros(0, dtype=np.int64)] + [
+            np.flatnonzero(data[p:p + BLOCK_BYTES] == 10) + p for p in range(start, len(data), BLOCK_BYTES)])
+        starts = np.r_[start, newlines + 1]
+        ends = np.r_[newlines, len(data)]
+        # '\r\n' endings: drop the '\r' too
+        ends = ends - ((ends > starts) & (data[np.maximum(ends - 1, 0)] == 13))
+    finally:
+        del data
+    return starts, ends
+
+
+def row_ids(mm, starts, ends, column):
+    """Stripped Item ID of each row, b'' when the row is too short to have one"""
+    ids = []
+    for a, e in zip(starts.tolist(), ends.tolist()):
+        for _ in range(column):
+            a = mm.find(b',', a, e) + 1
+            if not a:
+                a = e
+                break
+        b = mm.find(b',', a, e)
+        ids.append(mm[a:e if b < 0 else b].strip())
+    return ids
+
+
+def build_index(file_path, target):
+    """Index a CSV feed into `target` and return its path"""
+    header, start = read_header(file_path)
+    column = FeedSchema(header).column('itemId')
+    if column is None:
+        raise ValueError(f'{file_path}: no Item ID column')
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        starts, ends = line_bounds(mm, start)
+        ids = row_ids(mm, starts, ends, column)
+    # File line numbers count the header and empty lines
+    lines = np.arange(len(starts), dtype=np.int64) + 2
+    present = np.fromiter((bool(i) for i in ids), dtype=bool, count=len(ids))
+    width = max((len(i) for i in ids), default=1)
+    keys = np.array(ids, dtype=f'S{max(width, 1)}')[present]
+    order = np.argsort(keys, kind='stable')
+
+    scratch = target + '.partial'
+    shutil.rmtree(scratch, ignore_errors=True)
+    os.makedirs(scratch)
+    np.save(os.path.join(scratch, 'keys.npy'), keys[order])
+    np.save(os.path.join(scratch, 'offsets.npy'), starts[present][order].astype(np.int64))
+    np.save(os.path.join(scratch, 'lengths.npy'), (ends - starts)[present][order].astype(np.uint32))
+    np.save(os.path.join(scratch, 'lines.npy'), lines[present][order])
+    meta = {
+        'version': INDEX_VERSION,
+        'source': os.path.basename(file_path),
+        'header': header,
+        'rows': int(present.sum()),
+        'item_ids': int(len(np.unique(keys))),
+    }
+    with open(os.path.join(scratch, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(scratch, target)
+    return target
+
+
+class RowIndex:
+    """Item ID lookups into one memory-mapped CSV snapshot"""
+
+    def __init__(self, file_path, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.file_path = file_path
+        self.path = path
+        self.keys = np.load(os.path.join(path, 'keys.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.lengths = np.load(os.path.join(path, 'lengths.npy'), mmap_mode='r')
+        self.lines = np.load(os.path.join(path, 'lines.npy'), mmap_mode='r')
+        self.schema = FeedSchema(self.meta['header'])
+        self.file = open(file_path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def open(cls, file_path, cache_root=None, verify=False):
+        """Index of a feed, building it first if the snapshot has none"""
+        file_path = resolve_feed(file_path)
+        if is_zip(file_path):
+            raise ValueError(f'{file_path}: row lookups need the extracted CSV')
+        cache_root = cache_root or default_cache_root(file_path)
+        target = os.path.join(cache_root, content_hash(file_path, cache_root, verify), INDEX_DIR)
+        meta_path = os.path.join(target, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                if json.load(f).get('version') == INDEX_VERSION:
+                    return cls(file_path, target)
+        build_index(file_path, target)
+        return cls(file_path, target)
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def ranges(self, item_ids):
+        """(first, stop) index entries of each Item ID; first == stop when absent"""
+        width = self.keys.dtype.itemsize
+        encoded = [item_id.strip().encode('utf-8') for item_id in item_ids]
+        # Longer than every key means absent; don't let numpy truncate it into a match
+        fits = np.fromiter((len(e) <= width for e in encoded), dtype=bool, count=len(encoded))
+        queries = np.array([e if ok else b'' for e, ok in zip(encoded, fits.tolist())], dtype=self.keys.dtype)
+        first = np.searchsorted(self.keys, queries, side='left')
+        stop = np.where(fits, np.searchsorted(self.keys, queries, side='right'), first)
+        return first, stop
+
+    def raw(self, entry):
+        offset = int(self.offsets[entry])
+        return self.mm[offset:offset + int(self.lengths[entry])].decode('utf-8')
+
+    def row(self, entry):
+        """One indexed row as {header: value}; cells past the header go to '_overflow'"""
+        header = self.schema.header
+        cells = self.raw(entry).split(',')
+        row = {'_line': int(self.lines[entry])}
+        row.update(zip(header, cells + [''] * (len(header) - len(cells))))
+        if len(cells) > len(header):
+            row['_overflow'] = cells[len(header):]
+        return row
+
+    def get(self, item_id):
+        """Every row listing an Item ID, in file order"""
+        return self.lookup([item_id])[item_id]
+
+    def lookup(self, item_ids):
+        """{Item ID: [rows in file order]} for a batch of Item IDs"""
+        item_ids = list(item_ids)
+        first, stop = self.ranges(item_ids)
+        return {item_id: [self.row(e) for e in range(a, b)]
+                for item_id, a, b in zip(item_ids, first.tolist(), stop.tolist())}
+
+
+def read_ids(file_path):
+    """Item IDs from a text file (one per line) or the first column of a CSV with a header"""
+    with open(file_path, encoding='utf-8') as f:
+        values = [line.split(',')[0].strip() for line in f]
+    if values and not values[0].isdigit() and values[0].lower().startswith('item'):
+        values = values[1:]
+    return [value for value in values if value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Look up feed rows by Item ID through a byte-offset index')
+    parser.add_argument('feed', help='Extracted feed .csv')
+    parser.add_argument('item_ids', nargs='*', help='Item IDs to print')
+    parser.add_argument('--ids-file', help='More Item IDs, one per line (or first column of a CSV)')
+    parser.add_argument('--fields', help='Comma-separated header names to print (default: all non-empty)')
+    parser.add_argument('--raw', action='store_true', help='Print the raw CSV lines')
+    parser.add_argument('--verify', action='store_true', help='Re-hash the feed even if it looks unchanged')
+    parser.add_argument('--out', help='Write the rows as JSON lines to this file instead of printing them')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with RowIndex.open(args.feed, verify=args.verify) as index:
+        opened = time.perf_counter()
+        print(f"{len(index):,} rows indexed ({index.meta['item_ids']:,} item IDs), "
+              f"opened in {opened - started:.2f}s", file=sys.stderr)
+        item_ids = args.item_ids + (read_ids(args.ids_file) if args.ids_file else [])
+        if not item_ids:
+            return
+        found = index.lookup(item_ids)
+        elapsed = time.perf_counter() - opened
+        print(f"{sum(map(len, found.values())):,} rows for {len(item_ids):,} item IDs in {elapsed * 1000:.1f}ms "
+              f"({elapsed / len(item_ids) * 1e6:.1f}us per ID)", file=sys.stderr)
+
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                for item_id, rows in found.items():
+                    for row in rows:
+                        f.write(json.dumps({'itemId': item_id, **row}, ensure_ascii=False) + '\n')
+            print(f"Saved to: {args.out}")
+            return
+
+        fields = args.fields.split(',') if args.fields else None
+        first, stop = index.ranges(item_ids)
+        for item_id, a, b in zip(item_ids, first.tolist(), stop.tolist()):
+            if a == b:
+                print(f"\n{item_id}: not in {index.meta['source']}")
+            for e in range(a, b):
+                row = index.row(e)
+                print(f"\n{item_id} (line {row['_line']}, byte {int(index.offsets[e]):,}"
+                      f"{', relisted' if b - a > 1 else ''}):")
+                if args.raw:
+                    print(f"  {index.raw(e)}")
+                    continue
+                for name, value in row.items():
+                    if name == '_line' or (fields and name not in fields) or (not fields and not value):
+                        continue
+                    print(f"  {name}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""Stratified, seeded samples drawn from whole feeds in one pass.
+
+Rows are grouped into strata by diamond type, shape (the `Cut` column),
+carat bucket and media host, and each stratum keeps a fixed-size
+reservoir. Instead of random replacement, every row gets a priority from a
+keyed 64-bit hash of its Item ID and a stratum keeps the `per_stratum`
+lowest priorities (bottom-k sampling). That makes the sample:
+
+- uniform within each stratum, whatever order suppliers appear in the file
+- deterministic for a given seed, independent of row order and chunking
+- mergeable, so parallel scans give exactly the sequential result
+
+Memory is bounded by strata x per_stratum, not by feed size.
+"""
+import argparse
+import hashlib
+import heapq
+import json
+from bisect import bisect_right
+
+from .analyzers import media_url, url_domain
+from .parallel import run_parallel_scans
+from .scan import Analyzer
+
+DEFAULT_CARAT_EDGES = (0.3, 0.5, 0.7, 0.9, 1.0, 1.5, 2.0, 3.0, 5.0)
+MEDIA_KINDS = ('3d', 'video', 'any')
+
+
+def carat_bucket(carat, edges=DEFAULT_CARAT_EDGES):
+    """Label of the carat range a value falls in, e.g. '1.00-1.49'"""
+    try:
+        value = float(carat)
+    except ValueError:
+        return 'unknown'
+    if value != value or value <= 0:
+        return 'unknown'
+    i = bisect_right(edges, value)
+    if i == 0:
+        return f'<{edges[0]:.2f}'
+    if i == len(edges):
+        return f'{edges[-1]:.2f}+'
+    return f'{edges[i - 1]:.2f}-{edges[i] - 0.01:.2f}'
+
+
+class StratifiedSample(Analyzer):
+    """Keeps `per_stratum` hash-selected diamonds per type/shape/carat/host stratum
+
+    `media` picks the URL that defines the host part of the stratum: the 3D
+    viewer URL, the video URL, or 'any' (3D viewer first). Rows without such
+    a URL are skipped unless `require_media` is False, in which case they
+    land in strata with host 'none'.
+    """
+
+    name = 'stratified_sample'
+    fields = ('itemId', 'cut', 'carat', 'color', 'clarity', 'totalPrice',
+              'videoUrl', 'threeDViewerUrl')
+
+    def __init__(self, per_stratum=5, seed=0, media='3d', require_media=True,
+                 carat_edges=DEFAULT_CARAT_EDGES):
+        if media not in MEDIA_KINDS:
+            raise ValueError(f'media must be one of {MEDIA_KINDS}')
+        self.per_stratum = per_stratum
+        self.seed = seed
+        self.media = media
+        self.require_media = require_media
+        self.carat_edges = tuple(carat_edges)
+        self.key = str(seed).encode('utf-8')
+        self.reservoirs = {}
+        self.rows_by_stratum = {}
+
+    def priority(self, item_id):
+        digest = hashlib.blake2b(item_id.encode('utf-8'), digest_size=8, key=self.key).digest()
+        return int.from_bytes(digest, 'big')
+
+    def pick_url(self, video, viewer):
+        if self.media == '3d':
+            return media_url(viewer)
+        if self.media == 'video':
+            return media_url(video)
+        return media_url(viewer) or media_url(video)
+
+    def process(self, row):
+        values = self.get(row)
+        item_id = values[0].strip()
+        url = self.pick_url(values[6], values[7])
+        if not url and self.require_media:
+            return
+        if not item_id:
+            item_id = url or ','.join(values)
+
+        stratum = (
+            self.diamond_type,
+            values[1].strip() or 'unknown',
+            carat_bucket(values[2], self.carat_edges),
+            url_domain(url) if url else 'none',
+        )
+        self.rows_by_stratum[stratum] = self.rows_by_stratum.get(stratum, 0) + 1
+        self.offer(stratum, self.priority(item_id), item_id, values, url)
+
+    def offer(self, stratum, priority, item_id, values, url):
+        reservoir = self.reservoirs.get(stratum)
+        if reservoir is None:
+            reservoir = self.reservoirs[stratum] = []
+        # Max-heap on priority via negation: reservoir[0] is the one to evict
+        if len(reservoir) >= self.per_stratum and priority >= -reservoir[0][0]:
+            return
+        if any(entry[1] == item_id for entry in reservoir):
+            return
+        item = values if isinstance(values, dict) else self.sample(stratum, item_id, values, url)
+        entry = (-priority, item_id, item)
+        if len(reservoir) < self.per_stratum:
+            heapq.heappush(reservoir, entry)
+        else:
+            heapq.heapreplace(reservoir, entry)
+
+    def sample(self, stratum, item_id, values, url):
+        diamond_type, shape, bucket, domain = stratum
+        return {
+            'url': url,
+            'id': item_id,
+            'type': diamond_type,
+            'cut': values[1],
+            'carat': values[2],
+            'color': values[3],
+            'clarity': values[4],
+            'price': values[5],
+            'carat_bucket': bucket,
+            'domain': domain,
+        }
+
+    def merge(self, other):
+        for stratum, count in other.rows_by_stratum.items():
+            self.rows_by_stratum[stratum] = self.rows_by_stratum.get(stratum, 0) + count
+        for stratum, reservoir in other.reservoirs.items():
+            for neg_priority, item_id, item in reservoir:
+                self.offer(stratum, -neg_priority, item_id, item, item['url'])
+
+    def strata(self):
+        """Samples per stratum, lowest priority first, strata in sorted order"""
+        return {
+            stratum: [item for _, _, item in sorted(reservoir, reverse=True)]
+            for stratum, reservoir in sorted(self.reservoirs.items())
+        }
+
+    def result(self):
+        return [
+            {'stratum': '/'.join(stratum), 'rows': self.rows_by_stratum[stratum], 'samples': samples}
+            for stratum, samples in self.strata().items()
+        ]
+
+    def samples(self):
+        """All sampled diamonds as one flat list, grouped by stratum"""
+        return [item for samples in self.strata().values() for item in samples]
+
+
+def sample_feeds(feeds, per_stratum=5, seed=0, media='3d', require_media=True, workers=None):
+    """Draw one stratified sample across several feeds; returns the merged analyzer"""
+    prototype = StratifiedSample(per_stratum, seed, media, require_media)
+    scanners = run_parallel_scans(
+        {f'feed{i}': path for i, path in enumerate(feeds)}, [prototype], workers
+    )
+    merged = None
+    for scanner in scanners.values():
+        sampler = scanner.analyzers[0]
+        if merged is None:
+            merged = sampler
+        else:
+            merged.merge(sampler)
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stratified sample of diamonds across whole IDEX feeds')
+    parser.add_argument('feeds', nargs='+', help='Feed .csv or .zip files')
+    parser.add_argument('--per-stratum', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--media', choices=MEDIA_KINDS, default='3d',
+                        help='URL that defines the host stratum')
+    parser.add_argument('--include-without-media', action='store_true',
+                        help="Also sample rows that have no such URL")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--out', default='stratified-sample.json',
+                        help='Flat list of samples, same shape as the 3D URL extracts')
+    parser.add_argument('--strata-out', help='Also write samples grouped by stratum with row counts')
+    args = parser.parse_args()
+
+    sampler = sample_feeds(args.feeds, args.per_stratum, args.seed, args.media,
+                           not args.include_without_media, args.workers)
+    samples = sampler.samples()
+    print(f"Sampled {len(samples):,} diamonds from {len(sampler.reservoirs):,} strata "
+          f"({sum(sampler.rows_by_stratum.values()):,} eligible rows)")
+
+    with open(args.out, 'w') as f:
+        json.dump(samples, f, indent=2)
+    print(f"Saved to: {args.out}")
+    if args.strata_out:
+        with open(args.strata_out, 'w') as f:
+            json.dump(sampler.result(), f, indent=2)
+        print(f"Saved to: {args.strata_out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Single-pass IDEX feed scanner shared by the analysis scripts.
+
+Columns are resolved once from the header row using the same names as the
+importer, each analyzer compiles an itemgetter over the fields it needs,
+and every row is handed to all registered analyzers in one read of the file.
+"""
+import csv
+import os
+import time
+from operator import itemgetter
+
+from .headers import HEADER_TO_FIELD, detect_type
+from .metrics import CountingLines
+from .sources import open_feed
+
+
+class FeedSchema:
+    """Column positions of a feed, keyed by Diamond field name"""
+
+    def __init__(self, header, diamond_type=None):
+        self.header = [h.strip() for h in header]
+        self.diamond_type = diamond_type or detect_type(self.header)
+        self.width = len(self.header)
+        # Rows are padded to width + 1 so missing fields can point at a blank cell
+        self.blank = self.width
+        self.index = {}
+        for i, name in enumerate(self.header):
+            field = HEADER_TO_FIELD.get(name)
+            if field and field not in self.index:
+                self.index[field] = i
+
+    def column(self, field):
+        """Index of a field, or None when the feed doesn't carry it"""
+        return self.index.get(field)
+
+    def extractor(self, fields):
+        """Compile a row -> tuple getter for the given fields"""
+        indices = [self.index.get(f, self.blank) for f in fields]
+        if len(indices) == 1:
+            only = indices[0]
+            return lambda row: (row[only],)
+        return itemgetter(*indices)
+
+    def pad(self, row):
+        """Extend a short row so every compiled index is valid"""
+        missing = self.width + 1 - len(row)
+        if missing > 0:
+            row.extend([''] * missing)
+        return row
+
+
+class Analyzer:
+    """Base class for per-row analyzers run by FeedScanner"""
+
+    name = 'analyzer'
+    fields = ()
+    # Set once the analyzer needs no more rows; the scan stops when all are done
+    done = False
+
+    def bind(self, schema):
+        self.diamond_type = schema.diamond_type
+        self.get = schema.extractor(self.fields)
+
+    def process(self, row):
+        raise NotImplementedError
+
+    def merge(self, other):
+        """Fold in an analyzer that saw the rows following this one's"""
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+    def __getstate__(self):
+        # The compiled getter may be a lambda; workers re-bind after unpickling
+        state = self.__dict__.copy()
+        state.pop('get', None)
+        return state
+
+
+class FeedScanner:
+    """Reads a feed once and feeds every row to the registered analyzers"""
+
+    def __init__(self, diamond_type=None, max_rows=None, progress_every=None, metrics=None,
+                 sample_every=None):
+        self.diamond_type = diamond_type
+        self.max_rows = max_rows
+        self.progress_every = progress_every
+        # Optional RunMetrics; scans then report to it and are sampled at its rate
+        self.metrics = metrics
+        if sample_every is None and metrics is not None:
+            sample_every = metrics.sample_every
+        # sample_every is a power of two, so the hot loop tests `rows & mask`; None times nothing
+        self.sample_mask = sample_every - 1 if sample_every else None
+        self.sampled = None
+        self.sampled_rows = 0
+        self.analyzers = []
+        self.schema = None
+        self.rows = 0
+
+    def register(self, analyzer):
+        self.analyzers.append(analyzer)
+        return analyzer
+
+    def start(self, header):
+        self.schema = FeedSchema(header, self.diamond_type)
+        for analyzer in self.analyzers:
+            analyzer.bind(self.schema)
+        return self.schema
+
+    def feed(self, reader, lines=None, label='feed'):
+        """Run all analyzers over an iterator of already-split rows
+
+        With `sample_every` set, every sample_every-th row is timed per
+        analyzer into self.sampled; with self.metrics, throughput, progress
+        and those costs are reported to it as well.
+        """
+        metrics = self.metrics
+        pad = self.schema.pad
+        processors = [a.process for a in self.analyzers]
+        sample_mask = self.sample_mask
+        sampled = [0.0] * len(processors)
+        sampled_rows = 0
+        report_every = metrics.report_every if metrics is not None else 0
+        max_rows = self.max_rows
+        progress_every = self.progress_every
+        first_row = rows = self.rows
+        clock = time.perf_counter
+        started = clock()
+
+        for row in reader:
+            if max_rows is not None and rows >= max_rows:
+                break
+            if not row:
+                continue
+            pad(row)
+            if sample_mask is None or rows & sample_mask:
+                for process in processors:
+                    process(row)
+            else:
+                sampled_rows += 1
+                for i, process in enumerate(processors):
+                    t = clock()
+                    process(row)
+                    sampled[i] += clock() - t
+            rows += 1
+            if report_every and rows % report_every == 0:
+                metrics.progress(label, rows, lines.chars if lines else 0, clock() - started)
+            if progress_every and rows % progress_every == 0:
+                print(f"  Processed {rows:,} rows...")
+            if not rows & 0xFFF and all(a.done for a in self.analyzers):
+                break
+
+        self.rows = rows
+        if sample_mask is not None:
+            if self.sampled is None:
+                self.sampled = sampled
+            else:
+                self.sampled = [total + part for total, part in zip(self.sampled, sampled)]
+            self.sampled_rows += sampled_rows
+        if metrics is None:
+            return
+        seconds = clock() - started
+        chars = lines.chars if lines else 0
+        feed = metrics.feed(label)
+        feed['rows'] += rows - first_row
+        feed['bytes'] += chars
+        feed['seconds'] += seconds
+        analyze = sum(sampled) * metrics.sample_every
+        metrics.add_stage('analyze', analyze)
+        metrics.add_stage('read_parse', max(0.0, seconds - analyze))
+        metrics.record_analyzers(self.analyzers, sampled, sampled_rows)
+        metrics.emit('scan', feed=label, rows=rows - first_row, seconds=round(seconds, 3),
+                     analyze_seconds=round(analyze, 3))
+
+    def scan(self, file_path):
+        """Scan a .csv or .zip feed and return {analyzer name: result}"""
+        if self.metrics is not None:
+            return self.scan_measured(file_path)
+        with open_feed(file_path) as lines:
+            reader = csv.reader(lines)
+            self.start(next(reader))
+            self.feed(reader)
+        return self.results()
+
+    def scan_measured(self, file_path):
+        label = os.path.basename(file_path)
+        started = time.perf_counter()
+        with open_feed(file_path) as lines:
+            lines = CountingLines(lines)
+            reader = csv.reader(lines)
+            self.start(next(reader))
+            opened = time.perf_counter() - started
+            self.metrics.add_stage('open', opened)
+            self.metrics.emit('stage', stage='open', feed=label, seconds=round(opened, 4))
+            self.feed(reader, lines, label)
+        return self.results()
+
+    def results(self):
+        out = {
+            'file_type': self.schema.diamond_type if self.schema else self.diamond_type,
+            'rows': self.rows,
+        }
+        for analyzer in self.analyzers:
+            out[analyzer.name] = analyzer.result()
+        return out
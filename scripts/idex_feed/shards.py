@@ -0,0 +1,269 @@
+"""Pre-sorted static result pages for the storefront's most common queries.
+
+/diamonds/all answers every page with OFFSET/LIMIT, so deep pages get
+slower, and the default views (type x shape, sorted by price or carat)
+are the same for every shopper until the next import. This publisher
+writes those views once per snapshot as fixed-size, gzip-compressed JSON
+pages that static hosting can serve:
+
+    <out>/manifest.json
+    <out>/<version>/<type>/<shape>/<sort>/<page>.json.gz
+
+Rows are selected like getFilteredDiamonds() selects them for the
+storefront's default request (type, normalised shape code, finalPriceSek
+>= the 2500 SEK default minimum) and ordered with the sort keys of
+diamond-renderer.js, so page n of a shard is what the theme would show
+after loading n pages. Each page has the same keys as a /diamonds/all
+response; each diamond carries only the fields the renderer reads (plus
+the details view's fields with --with-details).
+
+Pages of a new snapshot go to a new version directory and manifest.json is
+replaced last, so a shopper never mixes pages of two snapshots; the most
+recent `keep` versions stay on disk for sessions that started earlier.
+
+Requires numpy.
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from .anomalies import read_quarantine
+from .columnar import load_table
+from .derived import shape_key
+from .repricing import PRICE_COLUMNS, fallback_intervals, load_intervals, reprice
+
+DEFAULT_PAGE_SIZE = 24
+DEFAULT_MIN_PRICE_SEK = 2500
+DEFAULT_KEEP = 2
+# Shape buttons of diamond-search-shape-filter.liquid
+SHAPES = ['ROUND', 'PRINCESS', 'CUSHION', 'EMERALD', 'OVAL', 'RADIANT', 'ASSCHER', 'MARQUISE', 'HEART', 'PEAR']
+TYPES = ['natural', 'lab']
+SORTS = ['price-low-high', 'price-high-low', 'carat-low-high', 'carat-high-low']
+
+# Fields diamond-renderer.js reads from a diamond
+CARD_FIELDS = [
+    'itemId', 'cut', 'carat', 'color', 'naturalFancyColor', 'naturalFancyColorIntensity', 'clarity',
+    'cutGrade', 'polish', 'symmetry', 'gradingLab', 'imagePath', 'imageUrl', 'videoUrl', 'threeDViewerUrl',
+    'totalPrice', 'totalPriceSek', 'priceWithMarkupSek', 'finalPriceSek',
+]
+# Further fields diamond-details.js reads when a card is opened
+DETAIL_FIELDS = [
+    'type', 'certificateNumber', 'certificatePath', 'certificateUrl', 'fluorescenceIntensity',
+    'girdleFrom', 'girdleTo', 'measurementsLength', 'measurementsWidth', 'measurementsHeight',
+    'depthPercent', 'tablePercent',
+]
+
+
+def js_number(value):
+    """A float as JSON would carry it: null for NaN, integral values without '.0'"""
+    if value != value:
+        return None
+    return int(value) if value.is_integer() else value
+
+
+def field_values(table, prices, field, rows):
+    """JSON-ready values of one field for the given rows"""
+    if field == 'type':
+        return prices['type'][rows].tolist()
+    if field in PRICE_COLUMNS or field == 'totalPrice':
+        return [js_number(v) for v in prices[field][rows].tolist()]
+    kind = table.columns.get(field, {}).get('kind')
+    if kind == 'numeric':
+        return [js_number(v) for v in np.asarray(table.numeric(field))[rows].tolist()]
+    if kind == 'categorical':
+        labels = [label.strip() or None for label in table.labels(field)]
+        return [labels[code] for code in np.asarray(table.codes(field))[rows].tolist()]
+    if kind == 'string':
+        column = table.strings(field)
+        return [column[row].strip() or None for row in rows.tolist()]
+    return [None] * len(rows)
+
+
+def sort_keys(prices, carat, rows):
+    """Sort keys of diamond-renderer.js: first truthy price, carat or 0"""
+    price = np.zeros(len(rows))
+    for field in ('totalPrice', 'totalPriceSek', 'finalPriceSek'):
+        values = prices[field][rows]
+        usable = ~np.isnan(values) & (values != 0)
+        price[usable] = values[usable]
+    carat = np.nan_to_num(carat[rows], nan=0.0)
+    return {
+        'price-low-high': price,
+        'price-high-low': -price,
+        'carat-low-high': carat,
+        'carat-high-low': -carat,
+    }
+
+
+class FeedRows:
+    """Priced rows of one feed and which hot query each belongs to"""
+
+    def __init__(self, feed, exchange_rate, intervals, min_price_sek, shapes, excluded):
+        self.table = table = load_table(feed)
+        self.prices = prices = reprice(table, exchange_rate, intervals)
+        shape_of = {shape_key(shape): i for i, shape in enumerate(shapes)}
+        self.shape = np.array([shape_of.get(shape_key(label), -1) for label in table.labels('cut')],
+                              dtype=np.int16)[np.asarray(table.codes('cut'))]
+        final = prices['finalPriceSek']
+        if min_price_sek:
+            priced = final >= min_price_sek
+        else:
+            priced = ~np.isnan(final) | ~np.isnan(prices['totalPrice'])
+        self.shown = priced & (self.shape >= 0)
+        # Rows the loader writes: an Item ID and not quarantined
+        self.item_ids = item_ids = table.strings('itemId')
+        self.keep = item_ids.lengths() > 0
+        if excluded:
+            self.keep &= np.fromiter((item_id not in excluded for item_id in item_ids),
+                                     dtype=bool, count=table.rows)
+
+    def encode(self, rows, fields):
+        """One JSON object string per row"""
+        columns = [field_values(self.table, self.prices, field, rows) for field in fields]
+        return [json.dumps(dict(zip(fields, values)), ensure_ascii=False, separators=(',', ':'))
+                for values in zip(*columns)]
+
+
+def write_pages(directory, encoded, order, page_size):
+    """Gzip-compressed pages of a shard; returns the number of pages"""
+    os.makedirs(directory, exist_ok=True)
+    total = len(order)
+    pages = max(1, -(-total // page_size))
+    for page in range(1, pages + 1):
+        chunk = order[(page - 1) * page_size:page * page_size]
+        body = ('{"diamonds":[' + ','.join(encoded[i] for i in chunk) + '],'
+                f'"totalCount":{total},"totalDiamonds":{total},"currentPage":{page},'
+                f'"totalPages":{-(-total // page_size)},"offset":{(page - 1) * page_size},'
+                f'"limit":{page_size}}}')
+        with open(os.path.join(directory, f'{page}.json.gz'), 'wb') as f:
+            f.write(gzip.compress(body.encode('utf-8'), compresslevel=9, mtime=0))
+    return pages
+
+
+def new_version(out_dir):
+    """Create a new timestamped directory in out_dir and return its name; '-002', '-003'... within one second"""
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%dT%H%M%S')
+    for n in range(1, 1000):
+        version = stamp if n == 1 else f'{stamp}-{n:03d}'
+        try:
+            os.mkdir(os.path.join(out_dir, version))
+            return version
+        except FileExistsError:
+            continue
+    raise RuntimeError(f'{out_dir}: too many directories created at {stamp}')
+
+
+def publish(feeds, out_dir, exchange_rate, intervals, page_size=DEFAULT_PAGE_SIZE,
+            min_price_sek=DEFAULT_MIN_PRICE_SEK, shapes=SHAPES, fields=CARD_FIELDS, excluded=(),
+            keep=DEFAULT_KEEP, log=print):
+    """Write every hot query's pages into a new version and switch the manifest to it"""
+    version = new_version(out_dir)
+    version_dir = os.path.join(out_dir, version)
+    sources = [FeedRows(feed, exchange_rate, intervals, min_price_sek, shapes, excluded) for feed in feeds]
+
+    # The upsert keeps the last row of an Item ID, so the latest listing wins here too
+    owner = {}
+    for s, source in enumerate(sources):
+        for row in np.nonzero(source.keep)[0].tolist():
+            owner[source.item_ids[row]] = (s, row)
+    for source in sources:
+        source.keep[:] = False
+    for s, row in owner.values():
+        sources[s].keep[row] = True
+    for source in sources:
+        source.keep &= source.shown
+
+    queries = {}
+    for diamond_type in TYPES:
+        for shape_index, shape in enumerate(shapes):
+            encoded = []
+            keys = {sort: [] for sort in SORTS}
+            for source in sources:
+                rows = np.nonzero(source.keep & (source.shape == shape_index)
+                                  & (source.prices['type'] == diamond_type))[0]
+                if not len(rows):
+                    continue
+                encoded.extend(source.encode(rows, fields))
+                for sort, values in sort_keys(source.prices, np.asarray(source.table.numeric('carat')),
+                                              rows).items():
+                    keys[sort].append(values)
+            for sort in SORTS:
+                values = np.concatenate(keys[sort]) if keys[sort] else np.zeros(0)
+                order = np.argsort(values, kind='stable')
+                path = os.path.join(version_dir, diamond_type, shape, sort)
+                pages = write_pages(path, encoded, order, page_size)
+                queries[f'{diamond_type}/{shape}/{sort}'] = {
+                    'type': diamond_type, 'shape': shape, 'sort': sort,
+                    'totalCount': len(order), 'totalPages': -(-len(order) // page_size)}
+            log(f"  {diamond_type}/{shape}: {len(encoded):,} diamonds, {pages:,} pages per sort")
+
+    manifest = {
+        'version': version,
+        'generatedAt': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'path': '{version}/{type}/{shape}/{sort}/{page}.json.gz',
+        'pageSize': page_size,
+        'minPriceSek': min_price_sek,
+        'exchangeRate': exchange_rate,
+        'fields': list(fields),
+        'sources': [os.path.basename(feed) for feed in feeds],
+        'queries': queries,
+    }
+    scratch = os.path.join(out_dir, 'manifest.json.partial')
+    with open(scratch, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(scratch, os.path.join(out_dir, 'manifest.json'))
+    prune_versions(out_dir, keep)
+    return manifest
+
+
+def prune_versions(out_dir, keep):
+    """Remove all but the newest `keep` version directories"""
+    versions = sorted(name for name in os.listdir(out_dir)
+                      if os.path.isdir(os.path.join(out_dir, name)) and name[:8].isdigit())
+    for name in versions[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(out_dir, name), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish pre-sorted static result pages for the storefront')
+    parser.add_argument('feeds', nargs='+', help='Feed .csv or .zip files, as imported')
+    parser.add_argument('--rate', type=float, required=True, help='USD to SEK exchange rate')
+    parser.add_argument('--intervals', help='Markup intervals JSON (defaults to the fallback intervals)')
+    parser.add_argument('--out', default='diamond-shards', help='Output directory')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument('--min-price-sek', type=float, default=DEFAULT_MIN_PRICE_SEK,
+                        help='Storefront default minimum price (0 for none)')
+    parser.add_argument('--shapes', help='Comma-separated shape values (default: the storefront shape buttons)')
+    parser.add_argument('--with-details', action='store_true',
+                        help='Also include the fields the details view reads')
+    parser.add_argument('--quarantine', action='append', default=[],
+                        help='Leave out the item IDs in this CSV, as the loader did; repeatable')
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP, help='Versions to keep on disk')
+    args = parser.parse_args()
+
+    if args.intervals:
+        intervals = load_intervals(args.intervals)
+    else:
+        print('No --intervals given, using fallback intervals (1.0 multiplier)')
+        intervals = {'natural': fallback_intervals(), 'lab': fallback_intervals()}
+    shapes = args.shapes.split(',') if args.shapes else SHAPES
+    fields = CARD_FIELDS + DETAIL_FIELDS if args.with_details else CARD_FIELDS
+    excluded = set().union(*(read_quarantine(path) for path in args.quarantine))
+
+    started = time.perf_counter()
+    manifest = publish(args.feeds, args.out, args.rate, intervals, args.page_size, args.min_price_sek,
+                       shapes, fields, excluded, args.keep)
+    pages = sum(max(1, q['totalPages']) for q in manifest['queries'].values())
+    print(f"Published {len(manifest['queries'])} queries, {pages:,} pages in "
+          f"{time.perf_counter() - started:.1f}s (version {manifest['version']})")
+    print(f"Saved to: {os.path.join(args.out, 'manifest.json')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,405 @@
+"""Precomputed "similar diamonds": the k nearest neighbours of every stone.
+
+Stones are only compared within their group (type, canonical shape, fancy
+or not). Within a group each stone is a point whose axes are scaled so
+that one unit is one noticeable step:
+
+- carat and price: 10% (log scale), so 1.00ct vs 1.10ct is one unit
+- colour, clarity, cut grade: one grade (fancy stones use the fancy
+  colour intensity instead of the colour)
+- ratio: 0.05; table and depth: 2 percentage points
+
+Unknown values take the group median, so they neither attract nor repel.
+Price is finalPriceSek when an exchange rate is given and the USD Total
+Price otherwise; on a log scale the two differ only by the markup.
+
+The search is exact without comparing every pair. A distance is never
+shorter than its projection on the group's principal axes, so with the
+stones bucketed into cells `width` wide on the 2nd and 3rd axes and sorted
+on the 1st, everything within `width` of a query lies in its cell or the
+8 around it, within `width` on the 1st axis. Blocks of queries from one
+cell are compared against that region only (float32 ranking, exact
+distances for the winners). A query is settled once its k-th neighbour is
+within `width`; the rest go round again with a wider width, starting from
+a sampled median k-th distance.
+
+The result is one binary file that is read by memory-mapping it:
+
+    b'IDXSIM01', uint32 header length, JSON header, then 8-byte aligned arrays
+    ids.data     uint8   UTF-8 item IDs, concatenated
+    ids.offsets  int64   rows + 1 offsets into ids.data
+    slots        int32   open-addressing table, -1 when empty
+    neighbours   int32   rows x k row numbers, -1 when a group has fewer stones
+    distances    float16 rows x k distances in the units above
+
+A lookup hashes the item ID (32-bit FNV-1a of its UTF-8 bytes), probes
+`slots` linearly from hash & (len(slots) - 1) until the stored row's ID
+matches or an empty slot is hit, then reads one row of `neighbours`.
+
+Requires numpy.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from .derived import SHAPES, load_derived
+from .repricing import load_intervals, reprice
+
+MAGIC = b'IDXSIM01'
+DEFAULT_K = 12
+DEFAULT_BLOCK = 64
+FNV_OFFSET = 0x811C9DC5
+FNV_PRIME = 0x01000193
+
+# Feature -> size of one unit
+UNITS = {
+    'carat': np.log(1.1),
+    'colour': 1.0,
+    'clarity': 1.0,
+    'cutGrade': 1.0,
+    'ratio': 0.05,
+    'table': 2.0,
+    'depth': 2.0,
+    'price': np.log(1.1),
+}
+
+
+def fnv1a(data, offsets):
+    """32-bit FNV-1a of every string in a blob + offsets column"""
+    offsets = np.asarray(offsets, dtype=np.int64)
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    hashes = np.full(len(starts), FNV_OFFSET, dtype=np.uint64)
+    for i in range(int(lengths.max()) if len(lengths) else 0):
+        rows = np.nonzero(lengths > i)[0]
+        mixed = hashes[rows] ^ data[starts[rows] + i].astype(np.uint64)
+        hashes[rows] = (mixed * FNV_PRIME) & 0xFFFFFFFF
+    return hashes.astype(np.uint32)
+
+
+def hash_slots(hashes):
+    """Linear-probing table of row numbers, at most half full"""
+    size = 1 << max(4, int(2 * len(hashes) - 1).bit_length())
+    mask = size - 1
+    slots = np.full(size, -1, dtype=np.int32)
+    pending = np.arange(len(hashes), dtype=np.int64)
+    probe = hashes.astype(np.int64) & mask
+    while len(pending):
+        free = slots[probe] == -1
+        # Among the rows aiming at the same free slot the first one wins
+        candidates = np.nonzero(free)[0]
+        _, first = np.unique(probe[candidates], return_index=True)
+        placed = candidates[first]
+        slots[probe[placed]] = pending[placed]
+        keep = np.ones(len(pending), dtype=bool)
+        keep[placed] = False
+        pending = pending[keep]
+        probe = (probe[keep] + 1) & mask
+    return slots
+
+
+def feature_columns(table, derived, prices):
+    """Unscaled feature arrays of one feed, NaN where unknown"""
+    def ordinal(values):
+        values = np.asarray(values).astype(np.float64)
+        values[values < 0] = np.nan
+        return values
+
+    def logarithm(values):
+        values = np.asarray(values, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(values > 0, np.log(values), np.nan)
+
+    is_fancy = np.asarray(derived['isFancy'])
+    return {
+        'carat': logarithm(table.numeric('carat')),
+        'colour': np.where(is_fancy, ordinal(derived['fancyIntensityOrdinal']), ordinal(derived['colourOrdinal'])),
+        'clarity': ordinal(derived['clarityOrdinal']),
+        'cutGrade': ordinal(derived['cutGradeOrdinal']),
+        'ratio': np.asarray(derived['ratio'], dtype=np.float64),
+        'table': np.asarray(table.numeric('tablePercent'), dtype=np.float64),
+        'depth': np.asarray(table.numeric('depthPercent'), dtype=np.float64),
+        'price': logarithm(prices),
+    }
+
+
+def group_points(features, rows):
+    """rows x len(UNITS) matrix in units, unknowns at the group median, centred"""
+    columns = []
+    for name, unit in UNITS.items():
+        values = features[name][rows] / unit
+        missing = np.isnan(values)
+        values[missing] = np.median(values[~missing]) if (~missing).any() else 0.0
+        columns.append(values - values.mean())
+    return np.stack(columns, axis=1)
+
+
+def initial_width(points, k, quantile=0.5, sample=64, chunk=16):
+    """A typical k-th neighbour distance, from a sample of stones"""
+    rng = np.random.default_rng(0)
+    queries = rng.choice(len(points), min(sample, len(points)), replace=False)
+    norms = (points ** 2).sum(axis=1)
+    distances = []
+    for begin in range(0, len(queries), chunk):
+        rows = queries[begin:begin + chunk]
+        squared = norms[rows, None] + norms[None, :] - 2 * points[rows] @ points.T
+        squared[np.arange(len(rows)), rows] = np.inf
+        distances.append(np.sqrt(np.maximum(np.partition(squared, k - 1, axis=1)[:, k - 1], 0)))
+    return max(float(np.quantile(np.concatenate(distances), quantile)), 1e-6)
+
+
+def nearest(points, compact, norms, queries, candidates, k):
+    """k nearest candidates of each query, itself excluded, as (rows, squared distances).
+
+    Candidates are ranked in float32 on |c|^2 - 2 q.c, which orders them like
+    |q - c|^2 without the per-query constant; the winners' distances are then
+    recomputed exactly.
+    """
+    scores = compact[queries] @ (-2 * compact[candidates]).T
+    scores += norms[candidates]
+    # One extra, as the query itself is among its candidates
+    best = np.argpartition(scores, k, axis=1)[:, :k + 1]
+    found = candidates[best]
+    squared = ((points[found] - points[queries, None, :]) ** 2).sum(axis=2)
+    # Drop the query itself, or the farthest of the k + 1 when an exact twin took its place
+    itself = found == queries[:, None]
+    squared[itself] = np.inf
+    order = np.argsort(squared, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(found, order, axis=1), np.take_along_axis(squared, order, axis=1)
+
+
+def group_neighbours(points, k, block=DEFAULT_BLOCK):
+    """k nearest neighbours of every point as (rows, distances), padded with -1 / inf"""
+    count = len(points)
+    neighbours = np.full((count, k), -1, dtype=np.int64)
+    squared = np.full((count, k), np.inf)
+    take = min(k, count - 1)
+    if take < 1:
+        return neighbours, squared
+
+    # Distances are never shorter than along the main axes. Rows are put in
+    # cells `width` wide on the 2nd and 3rd axes and sorted on the 1st, so the
+    # stones within `width` of a query are in its cell or the 8 around it,
+    # within `width` on the 1st axis
+    _, vectors = np.linalg.eigh(points.T @ points)
+    axes = points @ vectors[:, ::-1][:, :3]
+    first = axes[:, 0]
+    compact = points.astype(np.float32)
+    norms = (compact ** 2).sum(axis=1)
+    width = initial_width(points, take)
+    pending = np.arange(count)
+    while len(pending):
+        grid = np.floor(axes[:, 1:] / width).astype(np.int64)
+        # Shifted so the cells around any occupied one have non-negative, distinct keys
+        grid -= grid.min(axis=0) - 1
+        span = int(grid[:, 1].max()) + 2
+        cells = grid[:, 0] * span + grid[:, 1]
+        around = np.array([dx * span + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+        order = np.lexsort((first, cells))
+        sorted_first = first[order]
+        labels, starts = np.unique(cells[order], return_index=True)
+        stops = np.append(starts[1:], count)
+        rank = np.empty(count, dtype=np.int64)
+        rank[order] = np.arange(count)
+        queue = order[np.sort(rank[pending])]
+
+        incomplete = []
+        breaks = np.nonzero(np.diff(cells[queue]))[0] + 1
+        for run in np.split(queue, breaks):
+            targets = cells[run[0]] + around
+            found_at = np.searchsorted(labels, targets)
+            present = found_at[labels[np.minimum(found_at, len(labels) - 1)] == targets]
+            for begin in range(0, len(run), block):
+                queries = run[begin:begin + block]
+                low = first[queries].min() - width
+                high = first[queries].max() + width
+                ranges = []
+                for i in present:
+                    a, b = starts[i], stops[i]
+                    ranges.append(np.arange(a + np.searchsorted(sorted_first[a:b], low),
+                                            a + np.searchsorted(sorted_first[a:b], high, side='right')))
+                candidates = order[np.concatenate(ranges)]
+                if len(candidates) <= take:
+                    incomplete.append(queries)
+                    continue
+                found, found_squared = nearest(points, compact, norms, queries, candidates, take)
+                neighbours[queries, :take] = found
+                squared[queries, :take] = found_squared
+                done = (found_squared[:, -1] <= width ** 2) | (len(candidates) == count)
+                incomplete.append(queries[~done])
+        pending = np.concatenate(incomplete)
+        # A query's k-th distance so far bounds its true one, so a width
+        # that wide settles it; most of the rest settle next round
+        known = squared[pending, take - 1]
+        known = known[np.isfinite(known)]
+        width = max(float(np.sqrt(np.quantile(known, 0.9))) if len(known) else 0.0, 1.25 * width)
+    return neighbours, np.sqrt(squared)
+
+
+def build_index(feeds, k=DEFAULT_K, exchange_rate=None, intervals=None, log=print):
+    """Neighbour lists for every priced stone of the feeds; returns (arrays, summary)"""
+    loaded = []
+    latest = {}
+    for number, feed in enumerate(feeds):
+        table, derived = load_derived(feed)
+        priced = reprice(table, exchange_rate if exchange_rate else float('nan'), intervals or {})
+        price = priced['finalPriceSek'] if exchange_rate else priced['totalPrice']
+        features = feature_columns(table, derived, price)
+        ids = list(table.strings('itemId'))
+        # The last listing of a relisted ID is the one the loader keeps
+        for row, item_id in enumerate(ids):
+            if item_id:
+                latest[item_id] = (number, row)
+        loaded.append((feed, table.rows, ids, priced['type'], derived, features))
+
+    item_ids = []
+    parts = []
+    for number, (feed, count, ids, types, derived, features) in enumerate(loaded):
+        # Stones the storefront could show: an ID whose last listing has a carat and a price
+        usable = np.isfinite(features['carat']) & np.isfinite(features['price'])
+        rows = np.array([row for row in np.nonzero(usable)[0] if ids[row] and latest[ids[row]] == (number, row)],
+                        dtype=np.int64)
+        item_ids.extend(ids[row] for row in rows)
+        group = ((types[rows] == 'lab').astype(np.int64) * 1024
+                 + np.asarray(derived['shapeCode'])[rows].astype(np.int64) * 2
+                 + np.asarray(derived['isFancy'])[rows])
+        parts.append(({name: values[rows] for name, values in features.items()}, group))
+        log(f"  {os.path.basename(feed)}: {len(rows):,} of {count:,} rows indexed")
+
+    features = {name: np.concatenate([p[0][name] for p in parts]) for name in UNITS}
+    groups = np.concatenate([p[1] for p in parts])
+    total = len(groups)
+    neighbours = np.full((total, k), -1, dtype=np.int32)
+    distances = np.full((total, k), np.inf, dtype=np.float16)
+    summary = {'rows': total, 'k': k, 'groups': {}}
+    for key in np.unique(groups):
+        rows = np.nonzero(groups == key)[0]
+        found, found_distances = group_neighbours(group_points(features, rows), k)
+        neighbours[rows] = np.where(found >= 0, rows[np.maximum(found, 0)], -1)
+        distances[rows] = found_distances
+        name = f"{'lab' if key >= 1024 else 'natural'}/{SHAPES[(key % 1024) // 2]}{'/fancy' if key % 2 else ''}"
+        summary['groups'][name] = len(rows)
+
+    encoded = [item_id.encode('utf-8') for item_id in item_ids]
+    offsets = np.zeros(total + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    arrays = {
+        'ids.data': data,
+        'ids.offsets': offsets,
+        'slots': hash_slots(fnv1a(data, offsets)),
+        'neighbours': neighbours,
+        'distances': distances,
+    }
+    return arrays, summary
+
+
+def write_index(arrays, out, summary):
+    """Write the arrays into one file behind a JSON header of their offsets"""
+    sections = {}
+    position = 0
+    for name, values in arrays.items():
+        sections[name] = {'offset': position, 'dtype': values.dtype.str, 'shape': list(values.shape)}
+        position += -(-values.nbytes // 8) * 8
+    header = json.dumps({'version': 1, 'k': summary['k'], 'rows': summary['rows'], 'units': UNITS,
+                         'sections': sections}).encode('utf-8')
+    # Pad the header so the first array starts 8-byte aligned
+    start = len(MAGIC) + 4 + len(header)
+    header += b' ' * (-start % 8)
+    base = len(MAGIC) + 4 + len(header)
+    with open(out, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+        for name, values in arrays.items():
+            f.seek(base + sections[name]['offset'])
+            f.write(np.ascontiguousarray(values).tobytes())
+        f.truncate(base + position)
+
+
+class SimilarIndex:
+    """Memory-mapped reader for a file written by write_index()"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a similar-diamonds index')
+            length = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+            self.header = json.loads(f.read(length))
+        base = len(MAGIC) + 4 + length
+        self.k = self.header['k']
+        self.rows = self.header['rows']
+        self.arrays = {}
+        for name, section in self.header['sections'].items():
+            shape = tuple(section['shape'])
+            if not all(shape):
+                self.arrays[name] = np.zeros(shape, dtype=section['dtype'])
+                continue
+            self.arrays[name] = np.memmap(path, dtype=section['dtype'], mode='r',
+                                          offset=base + section['offset'], shape=shape)
+        self.data = self.arrays['ids.data']
+        self.offsets = self.arrays['ids.offsets']
+        self.slots = self.arrays['slots']
+
+    def item_id(self, row):
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode('utf-8')
+
+    def row(self, item_id):
+        """Row number of an item ID, or None"""
+        key = item_id.encode('utf-8')
+        hashed = FNV_OFFSET
+        for byte in key:
+            hashed = ((hashed ^ byte) * FNV_PRIME) & 0xFFFFFFFF
+        mask = len(self.slots) - 1
+        slot = hashed & mask
+        while True:
+            row = int(self.slots[slot])
+            if row < 0:
+                return None
+            if self.data[self.offsets[row]:self.offsets[row + 1]].tobytes() == key:
+                return row
+            slot = (slot + 1) & mask
+
+    def similar(self, item_id):
+        """[(item ID, distance)] nearest first, [] for an unknown item ID"""
+        row = self.row(item_id)
+        if row is None:
+            return []
+        neighbours = self.arrays['neighbours'][row]
+        distances = self.arrays['distances'][row]
+        return [(self.item_id(int(n)), round(float(d), 3)) for n, d in zip(neighbours, distances) if n >= 0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the similar-diamonds index')
+    parser.add_argument('feeds', nargs='*', help='Feed .csv or .zip files to index')
+    parser.add_argument('--out', default='similar-diamonds.idx', help='Index file')
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help='Neighbours per diamond')
+    parser.add_argument('--rate', type=float, help='USD to SEK rate, to compare finalPriceSek')
+    parser.add_argument('--intervals', help='Markup intervals JSON used with --rate')
+    parser.add_argument('--lookup', nargs='+', metavar='ITEM_ID', help='Print the neighbours of these stones')
+    args = parser.parse_args()
+
+    if args.feeds:
+        started = time.perf_counter()
+        intervals = load_intervals(args.intervals) if args.intervals else None
+        arrays, summary = build_index(args.feeds, args.k, args.rate, intervals)
+        write_index(arrays, args.out, summary)
+        seconds = time.perf_counter() - started
+        print(f"Indexed {summary['rows']:,} diamonds in {len(summary['groups'])} groups in {seconds:.1f}s, "
+              f"{os.path.getsize(args.out) / 1e6:.1f} MB")
+        print(f"Saved to: {args.out}")
+
+    if args.lookup:
+        index = SimilarIndex(args.out)
+        for item_id in args.lookup:
+            print(f"\n{item_id}:")
+            for neighbour, distance in index.similar(item_id) or [('(not in index)', '')]:
+                print(f"  {neighbour:<16} {distance}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Line sources for IDEX feed snapshots.
+
+Feeds can be read straight out of the zip archive the IDEX API returns,
+decompressing the CSV member incrementally, or from an extracted CSV
+through a memory map. Either way only a small window of the file is
+held in memory at a time.
+"""
+import hashlib
+import io
+import json
+import mmap
+import os
+import zipfile
+from contextlib import contextmanager
+
+BLOCK_BYTES = 4 * 1024 * 1024
+CACHE_DIR_NAME = '.idex-cache'
+
+# content_hash() results of this process, by absolute path
+_known_hashes = {}
+
+
+def is_zip(file_path):
+    return file_path.lower().endswith('.zip')
+
+
+def resolve_feed(file_path):
+    """Fall back to `<name>.zip` when an extracted `<name>.csv` isn't on disk"""
+    if os.path.exists(file_path) or is_zip(file_path):
+        return file_path
+    zipped = os.path.splitext(file_path)[0] + '.zip'
+    return zipped if os.path.exists(zipped) else file_path
+
+
+def zip_csv_member(archive):
+    """Name of the CSV inside an IDEX zip, matched the same way as the importer"""
+    for name in archive.namelist():
+        if name.lower().endswith('.csv'):
+            return name
+    raise FileNotFoundError('CSV file not found in the ZIP archive.')
+
+
+def mmap_lines(mm, start=0, end=None, block_bytes=BLOCK_BYTES):
+    """Yield decoded lines of mm[start:end], one newline-aligned block at a time"""
+    end = len(mm) if end is None else end
+    pos = start
+    while pos < end:
+        stop = min(pos + block_bytes, end)
+        if stop < end:
+            cut = mm.rfind(b'\n', pos, stop)
+            if cut < 0:
+                # A single line longer than the block: extend to its end
+                cut = mm.find(b'\n', stop, end)
+            stop = end if cut < 0 else cut + 1
+        lines = mm[pos:stop].decode('utf-8').split('\n')
+        # Split on '\n' only, like the importer; the final piece is the empty
+        # remainder after the block's last newline
+        if not lines[-1]:
+            lines.pop()
+        yield from lines
+        pos = stop
+
+
+@contextmanager
+def open_mmap(file_path):
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+
+@contextmanager
+def open_feed(file_path):
+    """Open a feed (.csv or .zip) as an iterator of text lines"""
+    file_path = resolve_feed(file_path)
+    if is_zip(file_path):
+        with zipfile.ZipFile(file_path) as archive:
+            with archive.open(zip_csv_member(archive)) as member:
+                yield io.TextIOWrapper(member, encoding='utf-8-sig', newline='')
+    else:
+        with open_mmap(file_path) as mm:
+            lines = mmap_lines(mm)
+            if mm[:3] == b'\xef\xbb\xbf':
+                lines = mmap_lines(mm, start=3)
+            yield lines
+
+
+def default_cache_root(file_path):
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIR_NAME)
+
+
+def digest_file(file_path, block_bytes=BLOCK_BYTES):
+    """Hex digest of a file's bytes, read in full"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_bytes), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_hash(file_path, cache_root=None, verify=False):
+    """Hex digest of a file's bytes, used to key caches and indexes to a snapshot
+
+    The digest is remembered with the file's size and mtime in
+    `<basename>.hash.json` under the cache directory, so an unchanged
+    snapshot is only read once; `verify=True` always re-reads it.
+    """
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    identity = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    cache_root = cache_root or default_cache_root(file_path)
+    pointer = os.path.join(cache_root, f'{os.path.basename(file_path)}.hash.json')
+    if not verify:
+        known = _known_hashes.get(file_path)
+        if known is None and os.path.exists(pointer):
+            try:
+                with open(pointer) as f:
+                    known = json.load(f)
+            except (OSError, ValueError):
+                known = None
+        if known and all(known.get(k) == v for k, v in identity.items()):
+            _known_hashes[file_path] = known
+            return known['content_hash']
+
+    known = {**identity, 'content_hash': digest_file(file_path)}
+    _known_hashes[file_path] = known
+    scratch = f'{pointer}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(cache_root, exist_ok=True)
+        with open(scratch, 'w') as f:
+            json.dump(known, f)
+        os.replace(scratch, pointer)
+    except OSError:
+        # A read-only feed directory only costs a re-hash in the next process
+        pass
+    return known['content_hash']
@@ -0,0 +1,268 @@
+"""Local stand-in HTTP servers for exercising the network tools offline.
+
+`MediaHostHandler` imitates the supplier media hosts behind `Video URL`
+and `3DViewer URL`:
+
+    /ok/<anything>             200 (206 for ranged GETs)
+    /missing/<anything>        404
+    /slow/<seconds>/<anything> answers after a delay
+    /redirect/<anything>       302 to /ok/<anything>
+    /no-head/<anything>        405 for HEAD, 200 for GET
+    /flaky/<anything>          503 on the first request for a path, then 200
+
+`IdexApiHandler` imitates the IDEX full-file API the importer calls:
+
+    POST /onsite/api/fullfeed          natural feed, zipped CSV
+    POST /onsite/api/labgrownfullfile  lab-grown feed, zipped CSV
+
+with the importer's JSON body (401 without api_key / api_secret, 400 for
+another data_format). Feeds are synthetic, `rows` rows each and the same
+for the server's lifetime; the first `failures` requests to each
+endpoint get a 503.
+
+`ImageHostHandler` imitates the supplier image buckets behind `Image Path`:
+
+    /img/<anything>        a PNG drawn from the path, with an ETag (304 on If-None-Match)
+    /same/<anything>       the same PNG for every path
+    /missing/<anything>    404
+    /slow/<seconds>/<...>  a PNG after a delay
+    /flaky/<anything>      503 on the first request for a path, then a PNG
+    /not-image/<anything>  200 with a body that is no image
+
+`StorefrontApiHandler` imitates the app's GET /diamonds/all for the load
+generator: the route's page/limit checks (400s), and a JSON page of
+`limit` placeholder diamonds after a delay that grows with the number of
+filters and with the page offset, like an OFFSET scan does.
+
+Run `python3 -m idex_feed.standins [media|idex|images|storefront] [port]`
+to serve one on a local port.
+"""
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from .synthetic import default_name, write_feed
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Base handler: HTTP/1.1 keep-alive, quiet logs, request counting"""
+
+    protocol_version = 'HTTP/1.1'
+    # TCP_NODELAY: keep-alive responses must not wait on delayed ACKs
+    disable_nagle_algorithm = True
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def count_request(self):
+        with self.lock:
+            seen = self.server.requests_seen
+            seen[self.path] = seen.get(self.path, 0) + 1
+            return seen[self.path]
+
+    def send_body(self, status, body=b'', content_type='text/plain', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        # One write for the whole body; with Nagle off it isn't held back behind the headers
+        if self.command != 'HEAD' and body:
+            self.wfile.write(body)
+
+
+class MediaHostHandler(StandinHandler):
+    body = b'0123456789' * 100
+
+    def do_HEAD(self):
+        self.route()
+
+    def do_GET(self):
+        self.route()
+
+    def route(self):
+        hits = self.count_request()
+        parts = self.path.lstrip('/').split('/')
+        kind = parts[0]
+
+        if kind == 'missing':
+            return self.send_body(404, b'not found')
+        if kind == 'redirect':
+            target = '/ok/' + '/'.join(parts[1:])
+            return self.send_body(302, headers={'Location': target})
+        if kind == 'slow':
+            time.sleep(float(parts[1]))
+        if kind == 'no-head' and self.command == 'HEAD':
+            return self.send_body(405)
+        if kind == 'flaky' and hits == 1:
+            return self.send_body(503)
+        if kind not in ('ok', 'slow', 'no-head', 'flaky'):
+            return self.send_body(404, b'unknown route')
+
+        if self.headers.get('Range') and self.command == 'GET':
+            return self.send_body(206, self.body[:1], 'video/mp4',
+                                  {'Content-Range': f'bytes 0-0/{len(self.body)}'})
+        self.send_body(200, self.body, 'video/mp4')
+
+
+class IdexApiHandler(StandinHandler):
+    rows = 2000
+    seed = 0
+    failures = 0
+    endpoints = {
+        '/onsite/api/fullfeed': ('natural', 'format_20230628_extended'),
+        '/onsite/api/labgrownfullfile': ('lab', 'format_lg_20221130'),
+    }
+    archives = {}
+
+    def do_POST(self):
+        hits = self.count_request()
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path not in self.endpoints:
+            return self.send_body(404, b'unknown route')
+        if hits <= self.failures:
+            return self.send_body(503, b'service unavailable')
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return self.send_body(400, b'invalid JSON')
+        auth = request.get('authentication_details') or {}
+        if not auth.get('api_key') or not auth.get('api_secret'):
+            return self.send_body(401, b'invalid credentials')
+        diamond_type, data_format = self.endpoints[self.path]
+        if (request.get('parameters') or {}).get('data_format') != data_format:
+            return self.send_body(400, b'unsupported data_format')
+        self.send_body(200, self.archive(diamond_type), 'application/zip')
+
+    def archive(self, diamond_type):
+        key = (diamond_type, self.rows, self.seed)
+        with self.lock:
+            if key not in self.archives:
+                with tempfile.TemporaryDirectory() as scratch:
+                    path = os.path.join(scratch, os.path.splitext(default_name(diamond_type))[0] + '.zip')
+                    write_feed(path, diamond_type, self.rows, self.seed)
+                    with open(path, 'rb') as f:
+                        self.archives[key] = f.read()
+            return self.archives[key]
+
+
+def png_image(seed, width=600, height=400):
+    """A small RGB gradient PNG whose colours depend on `seed`"""
+    r, g, b = seed & 255, (seed >> 8) & 255, (seed >> 16) & 255
+    row = bytes(value for x in range(width) for value in ((r + x) & 255, (g + 2 * x) & 255, (b - x) & 255))
+    # Each line is the first one shifted by a pixel, which keeps drawing cheap
+    rows = b''.join(b'\x00' + row[3 * y % len(row):] + row[:3 * y % len(row)] for y in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows, 6)) + chunk(b'IEND', b''))
+
+
+class ImageHostHandler(StandinHandler):
+    images = {}
+
+    def do_GET(self):
+        hits = self.count_request()
+        parts = self.path.lstrip('/').split('/')
+        kind = parts[0]
+
+        if kind == 'missing':
+            return self.send_body(404, b'not found')
+        if kind == 'not-image':
+            return self.send_body(200, b'<html>no image here</html>', 'image/jpeg')
+        if kind == 'slow':
+            time.sleep(float(parts[1]))
+        if kind == 'flaky' and hits == 1:
+            return self.send_body(503)
+        if kind not in ('img', 'same', 'slow', 'flaky'):
+            return self.send_body(404, b'unknown route')
+
+        seed = 0 if kind == 'same' else zlib.crc32(self.path.encode('utf-8'))
+        with self.lock:
+            if seed not in self.images:
+                self.images[seed] = png_image(seed)
+        etag = f'"{seed:08x}"'
+        if self.headers.get('If-None-Match') == etag:
+            return self.send_body(304, headers={'ETag': etag})
+        self.send_body(200, self.images[seed], 'image/png', {'ETag': etag})
+
+
+class StorefrontApiHandler(StandinHandler):
+    total = 5000
+    base_delay = 0.002
+    filter_delay = 0.0005
+    offset_delay = 0.00001
+
+    def do_GET(self):
+        self.count_request()
+        url = urlsplit(self.path)
+        if url.path != '/diamonds/all':
+            return self.send_body(404, b'unknown route')
+        params = dict(parse_qsl(url.query))
+        try:
+            page = int(params.pop('page', 1))
+            limit = int(params.pop('limit', 100))
+        except ValueError:
+            return self.json_body(400, {'error': 'Invalid page parameter.'})
+        if page < 1:
+            return self.json_body(400, {'error': 'Invalid page parameter.'})
+        if limit < 1:
+            return self.json_body(400, {'error': 'Invalid limit parameter.'})
+        if limit > 1000:
+            return self.json_body(400, {'error': 'Limit cannot exceed 1000.'})
+        offset = (page - 1) * limit
+        time.sleep(self.base_delay + self.filter_delay * len(params) + self.offset_delay * offset)
+        total = max(0, self.total - 100 * len(params))
+        diamonds = [{'itemId': str(offset + i), 'finalPriceSek': 2500 + offset + i}
+                    for i in range(max(0, min(limit, total - offset)))]
+        self.json_body(200, {'diamonds': diamonds, 'totalCount': total, 'totalDiamonds': total,
+                             'currentPage': page, 'totalPages': -(-total // limit), 'offset': offset,
+                             'limit': limit, 'filters': params})
+
+    def json_body(self, status, payload):
+        self.send_body(status, json.dumps(payload).encode('utf-8'), 'application/json')
+
+
+@contextmanager
+def serve(handler_class, host='127.0.0.1', port=0):
+    """Run a stand-in server in a background thread; yields its base URL"""
+    server = ThreadingHTTPServer((host, port), handler_class)
+    server.daemon_threads = True
+    server.requests_seen = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://{host}:{server.server_address[1]}', server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    handlers = {'media': MediaHostHandler, 'idex': IdexApiHandler, 'images': ImageHostHandler,
+                'storefront': StorefrontApiHandler}
+    kind = sys.argv[1] if len(sys.argv) > 1 else 'media'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    with serve(handlers[kind], port=port) as (base_url, _):
+        print(f"Stand-in {kind} server on {base_url} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
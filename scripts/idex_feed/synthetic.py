@@ -0,0 +1,310 @@
+"""Synthetic IDEX feeds for benchmarking and testing at production scale.
+
+Writes natural (52 columns plus the trailing comma of the real export) and
+lab-grown (54 columns) feeds with the same headers, cell formats and rough
+distributions as the real snapshots:
+
+- shapes, colours, clarities and grading labs weighted like the feed
+  samples, with a small share of fancy colours and ungraded stones
+- carat sizes log-normal, prices driven by carat, colour and clarity,
+  lab-grown at a fraction of natural prices
+- video / 3D viewer coverage from diamond-url-summary.md (natural 70.6% /
+  41.5%, lab 37.9% / 7.7%) spread over the hosts seen in the feeds
+- mostly-empty proportion and girdle columns, like the supplier data
+- a configurable share of re-listed certificates (the same stone offered
+  again by another supplier)
+
+Output is deterministic for a given seed. Rows are written as they are
+generated, so any size can be produced in constant memory.
+"""
+import argparse
+import io
+import math
+import os
+import random
+import zipfile
+
+from .headers import HEADER_TO_FIELD, LAB_GROWN_DIAMOND_HEADERS, NATURAL_DIAMOND_HEADERS
+
+SHAPES = {
+    'Round': 55, 'Oval': 9, 'Princess': 7, 'Cushion': 6, 'Emerald': 5, 'Pear': 5,
+    'Radiant': 4, 'Marquise': 3, 'Heart': 2, 'Asscher': 2, 'Cushion Modified': 1, 'Baguette': 1,
+}
+# Length / width ratio range per shape, used for the measurements
+SHAPE_RATIOS = {
+    'Round': (1.0, 1.01), 'Oval': (1.3, 1.5), 'Princess': (1.0, 1.05), 'Cushion': (1.0, 1.15),
+    'Emerald': (1.3, 1.5), 'Pear': (1.5, 1.7), 'Radiant': (1.1, 1.3), 'Marquise': (1.85, 2.1),
+    'Heart': (0.9, 1.05), 'Asscher': (1.0, 1.05), 'Cushion Modified': (1.0, 1.2), 'Baguette': (2.0, 3.5),
+}
+COLORS = {'D': 8, 'E': 12, 'F': 14, 'G': 15, 'H': 14, 'I': 11, 'J': 9, 'K': 7, 'L': 4, 'M': 3}
+COLOR_FACTORS = {'D': 1.6, 'E': 1.45, 'F': 1.35, 'G': 1.25, 'H': 1.1, 'I': 0.95, 'J': 0.85,
+                 'K': 0.7, 'L': 0.6, 'M': 0.5}
+CLARITIES = {'FL': 1, 'IF': 3, 'VVS1': 7, 'VVS2': 10, 'VS1': 16, 'VS2': 19, 'SI1': 18,
+             'SI2': 13, 'SI3': 2, 'I1': 7, 'I2': 3, 'I3': 1}
+CLARITY_FACTORS = {'FL': 1.9, 'IF': 1.7, 'VVS1': 1.5, 'VVS2': 1.4, 'VS1': 1.25, 'VS2': 1.15,
+                   'SI1': 1.0, 'SI2': 0.85, 'SI3': 0.7, 'I1': 0.55, 'I2': 0.4, 'I3': 0.3}
+FANCY_COLORS = {'Yellow': 40, 'Brown': 20, 'Pink': 10, 'Black': 10, 'Blue': 5, 'Green': 5, 'Orange': 5, 'Gray': 5}
+FANCY_INTENSITIES = {'Faint': 5, 'Very Light': 10, 'Light': 15, 'Fancy Light': 15, 'Fancy': 20,
+                     'Fancy Intense': 15, 'Fancy Vivid': 10, 'Fancy Deep': 5, 'Fancy Dark': 5}
+GRADES = {'Excellent': 55, 'Very Good': 28, 'Good': 12, 'Fair': 3, 'Poor': 2}
+CUT_GRADES = {'Excellent': 45, 'Ideal': 15, 'Very Good': 25, 'Good': 12, 'Fair': 3}
+FLUORESCENCE = {'None': 60, 'Faint': 18, 'Medium': 12, 'Strong': 7, 'Very Strong': 3}
+NATURAL_LABS = {'GIA': 55, 'IGI': 12, 'HRD': 6, 'EGL Other': 7, 'AGS': 3, 'GCAL': 2, '': 15}
+LAB_LABS = {'IGI': 70, 'GCAL': 12, 'GIA': 10, 'HRD': 3, '': 5}
+LOCATIONS = [('USA', 'New York', 'US', 'NY'), ('USA', 'Illinois', 'US', 'IL'), ('India', 'Gujarat', 'IN', 'GJ'),
+             ('India', 'Maharashtra', 'IN', 'MH'), ('Belgium', 'Antwerp', 'BE', 'VAN'),
+             ('Israel', 'Tel Aviv', 'IL', 'TA'), ('Hong Kong', '', 'HK', '')]
+VIDEO_HOSTS = {
+    'nivoda-inhousemedia.s3.amazonaws.com': 25, 'v360.in': 20, 'vv360.in': 12,
+    'storageweweb.blob.core.windows.net': 10, 'd-videos.s3.amazonaws.com': 8, 'visionpts.com': 8,
+    'olympianinc.s3.us-east-2.amazonaws.com': 5, 'vaishali.diamx.net': 5, 'akarshexports.com': 4,
+    'www.youtube.com': 3,
+}
+VIEWER_HOSTS = {
+    'v360.diamonds': 30, 'vv360.in': 25, 'diamonds360.in': 15, 'diamdna.azureedge.net': 12,
+    'video.diamondasset.in': 10, 'www.labgrownforever.com': 8,
+}
+# (has video, has 3D viewer, has both) shares from diamond-url-summary.md
+MEDIA_RATES = {'natural': (0.706, 0.415, 0.415), 'lab': (0.379, 0.077, 0.053)}
+PROFILES = {
+    'natural': {'headers': NATURAL_DIAMOND_HEADERS, 'first_id': 120_000_000, 'carat_median': 0.7,
+                'price_scale': 4200.0, 'labs': NATURAL_LABS, 'fancy_rate': 0.03, 'trailing_comma': True},
+    'lab': {'headers': LAB_GROWN_DIAMOND_HEADERS, 'first_id': 300_000_000, 'carat_median': 1.5,
+            'price_scale': 520.0, 'labs': LAB_LABS, 'fancy_rate': 0.01, 'trailing_comma': False},
+}
+
+
+class Weighted:
+    """Fast repeated weighted choice from a {value: weight} table"""
+
+    def __init__(self, weights):
+        self.values = list(weights)
+        total = sum(weights.values())
+        self.cumulative = []
+        running = 0
+        for value in self.values:
+            running += weights[value] / total
+            self.cumulative.append(running)
+
+    def pick(self, rng):
+        r = rng.random()
+        for value, edge in zip(self.values, self.cumulative):
+            if r < edge:
+                return value
+        return self.values[-1]
+
+
+class FeedGenerator:
+    """Generates the cells of one feed type, row by row"""
+
+    def __init__(self, diamond_type, seed=0, relist_rate=0.02):
+        self.diamond_type = diamond_type
+        self.profile = PROFILES[diamond_type]
+        self.rng = random.Random(f'{diamond_type}:{seed}')
+        self.relist_rate = relist_rate
+        self.headers = self.profile['headers']
+        self.fields = [HEADER_TO_FIELD.get(h) for h in self.headers]
+        self.shapes = Weighted(SHAPES)
+        self.colors = Weighted(COLORS)
+        self.clarities = Weighted(CLARITIES)
+        self.fancy_colors = Weighted(FANCY_COLORS)
+        self.intensities = Weighted(FANCY_INTENSITIES)
+        self.grades = Weighted(GRADES)
+        self.cut_grades = Weighted(CUT_GRADES)
+        self.fluorescence = Weighted(FLUORESCENCE)
+        self.labs = Weighted(self.profile['labs'])
+        self.video_hosts = Weighted(VIDEO_HOSTS)
+        self.viewer_hosts = Weighted(VIEWER_HOSTS)
+        self.next_id = self.profile['first_id']
+        self.certificates = []
+
+    def header_line(self):
+        return ','.join(self.headers) + (',' if self.profile['trailing_comma'] else '')
+
+    def certificate(self, lab):
+        rng = self.rng
+        if not lab:
+            return ''
+        if self.certificates and rng.random() < self.relist_rate:
+            return rng.choice(self.certificates)
+        if lab == 'GIA':
+            number = str(rng.randrange(1_000_000_000, 9_999_999_999))
+        elif lab == 'IGI':
+            number = ('LG' if self.diamond_type == 'lab' else '') + str(rng.randrange(100_000_000, 999_999_999))
+        else:
+            number = f'{lab[:2].upper()}{rng.randrange(10_000_000, 99_999_999)}'
+        # Bounded pool of earlier certificates to re-list from
+        if len(self.certificates) < 10_000:
+            self.certificates.append(number)
+        else:
+            self.certificates[rng.randrange(len(self.certificates))] = number
+        return number
+
+    def media(self, item_id, stock_ref):
+        rng = self.rng
+        video_rate, viewer_rate, both_rate = MEDIA_RATES[self.diamond_type]
+        r = rng.random()
+        # Draw (video, viewer) so the marginal and joint shares match the summary
+        if r < both_rate:
+            has_video, has_viewer = True, True
+        elif r < video_rate:
+            has_video, has_viewer = True, False
+        elif r < video_rate + viewer_rate - both_rate:
+            has_video, has_viewer = False, True
+        else:
+            has_video, has_viewer = False, False
+        video = viewer = ''
+        if has_video:
+            host = self.video_hosts.pick(rng)
+            if host == 'www.youtube.com':
+                video = f'https://www.youtube.com/embed/{item_id:x}'
+            else:
+                video = f'https://{host}/videos/{stock_ref}.mp4'
+        if has_viewer:
+            host = self.viewer_hosts.pick(rng)
+            viewer = f'https://{host}/Vision360.html?d={stock_ref}&surl=https://{host}/stones/'
+        return video, viewer
+
+    def row(self):
+        rng = self.rng
+        profile = self.profile
+        item_id = self.next_id
+        self.next_id += rng.randint(1, 7)
+        stock_ref = f'{rng.choice("ABCDEFGHJKLMNPRSTVW")}{rng.choice("ABCDEFGHJKLMNPRSTVW")}{rng.randrange(10000, 999999)}'
+
+        shape = self.shapes.pick(rng)
+        carat = round(max(0.18, profile['carat_median'] * math.exp(rng.gauss(0, 0.6))), 2)
+        fancy = rng.random() < profile['fancy_rate']
+        color = '' if fancy else self.colors.pick(rng)
+        clarity = self.clarities.pick(rng)
+        lab = self.labs.pick(rng)
+
+        factor = (COLOR_FACTORS.get(color, 1.2) * CLARITY_FACTORS[clarity]
+                  * carat ** 0.9 * math.exp(rng.gauss(0, 0.25)))
+        price_per_carat = round(profile['price_scale'] * factor, 2)
+        total_price = round(price_per_carat * carat, 2)
+
+        low, high = SHAPE_RATIOS[shape]
+        ratio = rng.uniform(low, high)
+        width = 6.45 * (carat ** (1 / 3)) / math.sqrt(ratio)
+        length = width * ratio
+        depth = rng.uniform(58.0, 72.0) if shape != 'Round' else rng.uniform(59.0, 63.5)
+        video, viewer = self.media(item_id, stock_ref)
+        country, state, country_code, state_code = rng.choice(LOCATIONS)
+        certificate = self.certificate(lab)
+        detailed = rng.random() < 0.2
+
+        cells = {
+            'itemId': str(item_id),
+            'supplierStockRef': stock_ref,
+            'cut': shape,
+            'carat': f'{carat:.3f}' if self.diamond_type == 'natural' else f'{carat:.2f}',
+            'color': color,
+            'naturalFancyColor': self.fancy_colors.pick(rng) if fancy else '',
+            'naturalFancyColorIntensity': self.intensities.pick(rng) if fancy else '',
+            'clarity': clarity,
+            'cutGrade': self.cut_grades.pick(rng) if shape == 'Round' and rng.random() < 0.8 else '',
+            'gradingLab': lab,
+            'certificateNumber': certificate,
+            'certificatePath': (f'https://certs.example-cdn.net/{lab or "NA"}/{certificate}.pdf'
+                                if certificate and rng.random() < 0.5 else ''),
+            'certificateUrl': (f'https://certs.example-cdn.net/{lab or "NA"}/{certificate}.pdf'
+                               if certificate and rng.random() < 0.5 else ''),
+            'imagePath': (f'https://dtol-member-images.s3.amazonaws.com/{rng.randrange(1000, 1999)}/Images/{stock_ref}.jpg'
+                          if rng.random() < 0.6 else ''),
+            'videoUrl': video,
+            'threeDViewerUrl': viewer,
+            'pricePerCarat': f'{price_per_carat:.2f}',
+            'totalPrice': f'{total_price:.2f}',
+            'percentOffIdexList': str(-rng.randint(20, 85)) if self.diamond_type == 'natural' and rng.random() < 0.7 else '',
+            'polish': self.grades.pick(rng) if lab else '',
+            'symmetry': self.grades.pick(rng) if lab else '',
+            'measurementsLength': f'{length:.2f}',
+            'measurementsWidth': f'{width:.2f}',
+            'measurementsHeight': f'{width * depth / 100:.2f}',
+            'depthPercent': f'{depth:.1f}' if lab else '',
+            'tablePercent': str(rng.randint(53, 70)) if lab else '',
+            'crownHeight': f'{rng.uniform(12, 17):.1f}' if detailed else '',
+            'crownAngle': f'{rng.uniform(32, 36):.1f}' if detailed else '',
+            'pavilionDepth': f'{rng.uniform(42, 44.5):.1f}' if detailed else '',
+            'pavilionAngle': f'{rng.uniform(40.4, 41.2):.1f}' if detailed else '',
+            'girdleFrom': rng.choice(('Thin', 'Medium', 'Slightly Thick')) if detailed else '',
+            'girdleTo': rng.choice(('Medium', 'Slightly Thick', 'Thick')) if detailed else '',
+            'culetSize': 'None' if detailed else '',
+            'fluorescenceIntensity': self.fluorescence.pick(rng) if lab else '',
+            'enhancement': 'Irradiated' if fancy and rng.random() < 0.3 else '',
+            'country': country,
+            'stateRegion': state,
+            'countryCode': country_code,
+            'countryName': country,
+            'stateCode': state_code,
+            'stateName': state,
+            'askingPriceForPair': f'{price_per_carat:.4f}' if rng.random() < 0.5 else '',
+            'eyeClean': 'Yes' if detailed and clarity in ('VS1', 'VS2', 'SI1') else '',
+            'guaranteedAvailability': 'Yes',
+            'availability': 'Guaranteed' if rng.random() < 0.8 else 'Memo',
+        }
+        line = ','.join(cells.get(field, '') if field else '' for field in self.fields)
+        return line + (',' if profile['trailing_comma'] else '')
+
+
+def write_feed(file_path, diamond_type, rows, seed=0, relist_rate=0.02):
+    """Write a synthetic feed (.csv, or a .zip holding the CSV like the IDEX API)"""
+    generator = FeedGenerator(diamond_type, seed, relist_rate)
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+
+    def write_rows(out):
+        out.write(generator.header_line() + '\n')
+        batch = []
+        for _ in range(rows):
+            batch.append(generator.row())
+            if len(batch) >= 10_000:
+                out.write('\n'.join(batch) + '\n')
+                batch = []
+        if batch:
+            out.write('\n'.join(batch) + '\n')
+
+    if file_path.lower().endswith('.zip'):
+        member = os.path.splitext(os.path.basename(file_path))[0] + '.csv'
+        with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(member, 'w', force_zip64=True) as raw:
+                with io.TextIOWrapper(raw, encoding='utf-8', newline='') as out:
+                    write_rows(out)
+    else:
+        with open(file_path, 'w', encoding='utf-8', newline='') as out:
+            write_rows(out)
+    return file_path
+
+
+def default_name(diamond_type):
+    # Named like the real snapshots so scripts that glob for them pick these up
+    if diamond_type == 'natural':
+        return 'Idex_Feed_synthetic.csv'
+    return 'Idex_Complete_LgSingles_synthetic.csv'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic IDEX feeds')
+    parser.add_argument('--type', choices=('natural', 'lab', 'both'), default='both')
+    parser.add_argument('--rows', type=int, default=100_000, help='Rows per feed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--relist-rate', type=float, default=0.02,
+                        help='Share of rows re-using an earlier certificate number')
+    parser.add_argument('--zip', action='store_true', help='Write .zip archives instead of CSVs')
+    parser.add_argument('--out-dir', default='synthetic-feeds')
+    args = parser.parse_args()
+
+    types = ('natural', 'lab') if args.type == 'both' else (args.type,)
+    for diamond_type in types:
+        name = default_name(diamond_type)
+        if args.zip:
+            name = os.path.splitext(name)[0] + '.zip'
+        path = write_feed(os.path.join(args.out_dir, name), diamond_type, args.rows,
+                          args.seed, args.relist_rate)
+        size = os.path.getsize(path) / (1024 * 1024)
+        print(f"Wrote {args.rows:,} {diamond_type} rows ({size:.1f} MB)")
+        print(f"Saved to: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,421 @@
+"""Thumbnail prefetcher with a content-addressed image store.
+
+diamond-renderer.js shows each card's `Image Path` (else `Image URL`)
+straight from the supplier buckets. This walks a snapshot's image URLs
+once, ahead of shoppers, and keeps everything under one store directory:
+
+    <store>/objects/<sha256[:2]>/<sha256>                      downloaded images
+    <store>/thumbs/<size>-<format>/<sha256[:2]>/<sha256>.<ext>  thumbnails
+    <store>/manifest.json                                       itemId -> thumbnail
+
+Each URL is downloaded at most once per run, however many stones share
+it, and identical bytes behind different URLs are stored and thumbnailed
+once. Downloads stream to disk while being hashed, over one keep-alive
+connection pool; URLs wait in per-host queues (media_check.run_per_host)
+and are only started when their host is below `per_host` requests, so a
+slow bucket holds at most that many of the `concurrency` workers and no
+timeout runs while a URL waits its turn. Finished downloads go straight
+to a process pool that decodes them (JPEG at reduced scale via
+Image.draft), fits them onto a fixed `size` x `size` white square and
+saves the thumbnail.
+
+The manifest remembers every URL's content hash, ETag and Last-Modified,
+so a later snapshot only fetches URLs it hasn't seen (or, with
+`--revalidate`, asks the host with a conditional GET and keeps the
+thumbnail on 304). Failures are retried on the next run, except 4xx
+answers and undecodable images younger than `--failure-ttl-hours`. The
+manifest is replaced atomically every few hundred images, so an
+interrupted run keeps its progress.
+
+Requires aiohttp and Pillow.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+from PIL import Image, ImageOps
+
+from .analyzers import media_url, url_domain
+from .media_check import RETRY_STATUSES, run_per_host
+from .scan import Analyzer, FeedScanner
+
+MANIFEST_VERSION = 1
+DEFAULT_SIZE = 320
+DEFAULT_FORMAT = 'jpeg'
+DEFAULT_QUALITY = 80
+DEFAULT_MAX_BYTES = 25 * 1024 * 1024
+DEFAULT_FAILURE_TTL_HOURS = 24
+CHECKPOINT_EVERY = 500
+CHUNK_BYTES = 64 * 1024
+FORMATS = {'jpeg': 'jpg', 'webp': 'webp', 'png': 'png'}
+
+
+class ImageUrls(Analyzer):
+    """Image URL of each Item ID, as the renderer picks it; the last row of an Item ID wins"""
+
+    name = 'image_urls'
+    fields = ('itemId', 'imagePath', 'imageUrl')
+
+    def __init__(self):
+        self.urls = {}
+        self.without = 0
+
+    def process(self, row):
+        item_id, path, url = self.get(row)
+        item_id = item_id.strip()
+        if not item_id:
+            return
+        url = media_url(path) or media_url(url)
+        if url:
+            self.urls[item_id] = url
+        else:
+            self.urls.pop(item_id, None)
+            self.without += 1
+
+    def merge(self, other):
+        for item_id in other.urls:
+            self.urls.pop(item_id, None)
+        self.urls.update(other.urls)
+        self.without += other.without
+
+    def result(self):
+        return self.urls
+
+
+def shard_path(root, digest, suffix=''):
+    return os.path.join(root, digest[:2], digest + suffix)
+
+
+def make_thumbnail(source, target, size, image_format, quality):
+    """Fit an image onto a size x size white square; returns (width, height) of the original"""
+    with Image.open(source) as image:
+        original = image.size
+        if image.format == 'JPEG':
+            # Let the decoder scale down by up to 8x instead of decoding every pixel
+            image.draft('RGB', (size * 2, size * 2))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            flat = Image.new('RGB', image.size, 'white')
+            flat.paste(image, mask=image.getchannel('A'))
+            image = flat
+        else:
+            image = image.convert('RGB')
+        image.thumbnail((size, size), Image.LANCZOS)
+        canvas = Image.new('RGB', (size, size), 'white')
+        canvas.paste(image, ((size - image.width) // 2, (size - image.height) // 2))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    scratch = f'{target}.{os.getpid()}.partial'
+    canvas.save(scratch, image_format.upper(), quality=quality, optimize=True)
+    os.replace(scratch, target)
+    return original
+
+
+class ThumbnailStore:
+    """Content-addressed originals and thumbnails under one directory, with the manifest"""
+
+    def __init__(self, root, size=DEFAULT_SIZE, image_format=DEFAULT_FORMAT, quality=DEFAULT_QUALITY):
+        if image_format not in FORMATS:
+            raise ValueError(f"unknown thumbnail format {image_format!r} (choose from {', '.join(FORMATS)})")
+        self.root = root
+        self.size = size
+        self.format = image_format
+        self.quality = quality
+        self.objects = os.path.join(root, 'objects')
+        self.thumbs = os.path.join(root, 'thumbs', f'{size}-{image_format}')
+        self.scratch = os.path.join(root, 'tmp')
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        os.makedirs(self.scratch, exist_ok=True)
+        self.items = {}
+        self.urls = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                self.items = manifest.get('items', {})
+                self.urls = manifest.get('urls', {})
+
+    def object_path(self, digest):
+        return shard_path(self.objects, digest)
+
+    def thumb_path(self, digest):
+        return shard_path(self.thumbs, digest, '.' + FORMATS[self.format])
+
+    def relative(self, path):
+        return os.path.relpath(path, self.root)
+
+    def has_thumb(self, digest):
+        return bool(digest) and os.path.exists(self.thumb_path(digest))
+
+    def add_object(self, scratch, digest):
+        """Move a finished download into place, unless the same bytes are already stored"""
+        target = self.object_path(digest)
+        if os.path.exists(target):
+            os.remove(scratch)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(scratch, target)
+        return target
+
+    def save(self, sources=()):
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'generatedAt': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'size': self.size,
+            'format': self.format,
+            'sources': [os.path.basename(source) for source in sources],
+            'items': self.items,
+            'urls': self.urls,
+        }
+        scratch = self.manifest_path + '.partial'
+        with open(scratch, 'w') as f:
+            json.dump(manifest, f, separators=(',', ':'))
+        os.replace(scratch, self.manifest_path)
+
+
+async def download(session, store, url, known, max_bytes, retries, backoff):
+    """Fetch one URL into the object store; returns the URL's new manifest entry"""
+    entry = {'status': None, 'error': None, 'checkedAt': time.time()}
+    headers = {}
+    # Conditional only when the stored copy is still there to fall back on
+    if known and known.get('sha256') and os.path.exists(store.object_path(known['sha256'])):
+        if known.get('etag'):
+            headers['If-None-Match'] = known['etag']
+        if known.get('lastModified'):
+            headers['If-Modified-Since'] = known['lastModified']
+
+    for attempt in range(retries + 1):
+        scratch = os.path.join(store.scratch, uuid.uuid4().hex + '.partial')
+        try:
+            async with session.get(url, headers=headers) as response:
+                entry.update(status=response.status, error=None)
+                if response.status == 304:
+                    return dict(known, status=304, error=None, checkedAt=entry['checkedAt'])
+                if response.status == 200:
+                    digest = hashlib.sha256()
+                    size = 0
+                    with open(scratch, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(CHUNK_BYTES):
+                            size += len(chunk)
+                            if size > max_bytes:
+                                raise ValueError(f'larger than {max_bytes:,} bytes')
+                            digest.update(chunk)
+                            f.write(chunk)
+                    sha = digest.hexdigest()
+                    store.add_object(scratch, sha)
+                    entry.update(sha256=sha, bytes=size, etag=response.headers.get('ETag'),
+                                 lastModified=response.headers.get('Last-Modified'))
+                    return entry
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as error:
+            entry.update(status=None, error=type(error).__name__ + (f': {error}' if str(error) else ''))
+        finally:
+            if os.path.exists(scratch):
+                os.remove(scratch)
+        if entry['status'] not in RETRY_STATUSES and entry['error'] is None:
+            break
+        if attempt < retries:
+            await asyncio.sleep(backoff * 2 ** attempt)
+    return entry
+
+
+async def prefetch_urls(store, urls, pool, concurrency=32, per_host=6, timeout=60.0, retries=2, backoff=0.5,
+                        max_bytes=DEFAULT_MAX_BYTES, on_progress=None):
+    """Download URLs and make their thumbnails; returns the counters of what happened"""
+    loop = asyncio.get_running_loop()
+    counts = Counter()
+    # One thumbnail job per content hash, shared by every URL with the same bytes
+    thumbnails = {}
+
+    async def thumbnail(digest):
+        if store.has_thumb(digest):
+            return None
+        try:
+            await loop.run_in_executor(pool, make_thumbnail, store.object_path(digest), store.thumb_path(digest),
+                                       store.size, store.format, store.quality)
+            counts['thumbnails'] += 1
+            return None
+        except (OSError, ValueError, Image.DecompressionBombError) as error:
+            counts['thumbnail_errors'] += 1
+            return type(error).__name__ + (f': {error}' if str(error) else '')
+
+    async def finish(url, entry):
+        digest = entry.get('sha256') if entry['status'] in (200, 304) else None
+        if digest:
+            if digest not in thumbnails:
+                thumbnails[digest] = asyncio.ensure_future(thumbnail(digest))
+            error = await thumbnails[digest]
+            if error:
+                entry['error'] = error
+        else:
+            entry.pop('sha256', None)
+        store.urls[url] = entry
+        if on_progress:
+            on_progress(counts)
+
+    finishing = []
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        async def fetch(url):
+            entry = await download(session, store, url, store.urls.get(url), max_bytes, retries, backoff)
+            counts[{200: 'downloaded', 304: 'not_modified'}.get(entry['status'], 'failed')] += 1
+            counts['bytes'] += entry.get('bytes', 0) if entry['status'] == 200 else 0
+            # The host slot is free again while the thumbnail is made
+            finishing.append(asyncio.ensure_future(finish(url, entry)))
+
+        await run_per_host(urls, fetch, concurrency, per_host)
+        await asyncio.gather(*finishing)
+    return counts
+
+
+def failed_for_good(entry):
+    """A 4xx answer, or bytes that are no image; retrying soon won't help"""
+    status = entry.get('status')
+    return bool(status and 400 <= status < 500) or bool(entry.get('sha256') and entry.get('error'))
+
+
+def failure_reason(entry):
+    """None for a usable entry, else its error type or HTTP status"""
+    if entry.get('error'):
+        return entry['error'].split(':')[0]
+    if entry.get('status') not in (200, 304):
+        return str(entry.get('status'))
+    return None
+
+
+def pending_urls(store, wanted, revalidate=False, failure_ttl_hours=DEFAULT_FAILURE_TTL_HOURS):
+    """URLs to request this run, and how many were skipped as reusable or recently dead"""
+    cutoff = time.time() - failure_ttl_hours * 3600
+    pending, reused, dead = [], 0, 0
+    for url in wanted:
+        known = store.urls.get(url)
+        if known and not known.get('error') and store.has_thumb(known.get('sha256')):
+            if revalidate:
+                pending.append(url)
+            else:
+                reused += 1
+        elif known and failed_for_good(known) and known['checkedAt'] >= cutoff:
+            dead += 1
+        else:
+            pending.append(url)
+    return pending, reused, dead
+
+
+def update_items(store, images):
+    """Point every Item ID at its URL's thumbnail; Item IDs no longer listed are dropped"""
+    items = {}
+    for item_id, url in images.items():
+        known = store.urls.get(url) or {}
+        digest = known.get('sha256')
+        ok = store.has_thumb(digest) and not known.get('error')
+        items[item_id] = {'url': url, 'sha256': digest if ok else None,
+                          'thumb': store.relative(store.thumb_path(digest)) if ok else None}
+    store.items = items
+    return sum(1 for item in items.values() if item['thumb'])
+
+
+def prefetch(feeds, store, workers=None, revalidate=False, failure_ttl_hours=DEFAULT_FAILURE_TTL_HOURS,
+             log=print, **options):
+    """Thumbnails for every stone with an image in the given feeds; returns a summary"""
+    images = {}
+    without = 0
+    for feed in feeds:
+        scanner = FeedScanner()
+        collector = scanner.register(ImageUrls())
+        scanner.scan(feed)
+        for item_id in collector.urls:
+            images.pop(item_id, None)
+        images.update(collector.urls)
+        without += collector.without
+    wanted = sorted(set(images.values()))
+    pending, reused, dead = pending_urls(store, wanted, revalidate, failure_ttl_hours)
+    log(f"{len(images):,} stones with an image ({without:,} without), {len(wanted):,} unique URLs: "
+        f"{len(pending):,} to fetch, {reused:,} unchanged, {dead:,} recently dead")
+
+    started = time.perf_counter()
+    done = [0]
+
+    def checkpoint(counts):
+        done[0] += 1
+        if done[0] % CHECKPOINT_EVERY == 0:
+            store.save(feeds)
+            elapsed = time.perf_counter() - started
+            log(f"  {done[0]:,} of {len(pending):,} URLs, {done[0] / elapsed:,.1f}/s, "
+                f"{counts['bytes'] / elapsed / 1e6:,.1f} MB/s, {counts['thumbnails']:,} thumbnails")
+
+    counts = Counter()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            try:
+                counts = asyncio.run(prefetch_urls(store, pending, pool, on_progress=checkpoint, **options))
+            finally:
+                update_items(store, images)
+                store.save(feeds)
+    with_thumb = update_items(store, images)
+    store.save(feeds)
+
+    failures = Counter()
+    failed_hosts = Counter()
+    for url in pending:
+        reason = failure_reason(store.urls.get(url) or {'error': 'not attempted'})
+        if reason:
+            failures[reason] += 1
+            failed_hosts[url_domain(url)] += 1
+    return {
+        'stones': len(images),
+        'without_image': without,
+        'unique_urls': len(wanted),
+        'fetched': len(pending),
+        'unchanged': reused,
+        'recently_dead': dead,
+        'downloaded': counts['downloaded'],
+        'not_modified': counts['not_modified'],
+        'failed': counts['failed'],
+        'megabytes': round(counts['bytes'] / 1e6, 2),
+        'thumbnails_made': counts['thumbnails'],
+        'thumbnail_errors': counts['thumbnail_errors'],
+        'stones_with_thumbnail': with_thumb,
+        'seconds': round(time.perf_counter() - started, 2),
+        'failures': dict(failures.most_common()),
+        'failed_hosts': dict(failed_hosts.most_common(20)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prefetch feed images into a content-addressed thumbnail store')
+    parser.add_argument('feeds', nargs='+', help='Feed .csv or .zip files')
+    parser.add_argument('--store', default='feed-thumbnails', help='Store directory (objects, thumbs, manifest)')
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE, help='Thumbnail width and height in pixels')
+    parser.add_argument('--format', default=DEFAULT_FORMAT, choices=sorted(FORMATS))
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY)
+    parser.add_argument('--workers', type=int, help='Thumbnail processes (default: CPU count)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Downloads in flight')
+    parser.add_argument('--per-host', type=int, default=6, help='Connections per host')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES, help='Largest image to download')
+    parser.add_argument('--revalidate', action='store_true',
+                        help='Ask hosts whether known images changed (conditional GET) instead of reusing them')
+    parser.add_argument('--failure-ttl-hours', type=float, default=DEFAULT_FAILURE_TTL_HOURS,
+                        help='Skip URLs that answered 4xx more recently than this')
+    args = parser.parse_args()
+
+    store = ThumbnailStore(args.store, args.size, args.format, args.quality)
+    summary = prefetch(
+        args.feeds, store, args.workers, args.revalidate, args.failure_ttl_hours,
+        concurrency=args.concurrency, per_host=args.per_host, timeout=args.timeout,
+        retries=args.retries, max_bytes=args.max_bytes,
+    )
+    print(json.dumps(summary, indent=2))
+    print(f"Saved to: {store.manifest_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ import * as dotenv from 'dotenv';
 import { randomUUID } from 'crypto';
 import { Pool } from 'pg';
 import { fetchDiamondsStream } from '../app/services/idex.service.server.js';
+import { deriveDiamondAttributes } from '../app/services/diamond-derived.server.js';
 import type { DiamondType } from '../app/models/diamond.server.js';
 
 // Load environment variables
@@ -137,10 +138,12 @@ class DirectDiamondImporter {
       const placeholders: string[] = [];
 
       diamondsWithIds.forEach((diamond, index) => {
-        const baseIndex = index * 70; // 70 fields per diamond (added priceWithMarkupSek and finalPriceSek)
+        const baseIndex = index * 81; // 81 fields per diamond (added the derived attribute columns)
         placeholders.push(
-          `(${Array.from({ length: 70 }, (_, i) => `$${baseIndex + i + 1}`).join(', ')})`
+          `(${Array.from({ length: 81 }, (_, i) => `$${baseIndex + i + 1}`).join(', ')})`
         );
+        // Same values as scripts/idex_feed/derived.py, which fills them on the COPY path
+        const derived = deriveDiamondAttributes(diamond);
 
         values.push(
           diamond.id,
@@ -209,6 +212,17 @@ class DirectDiamondImporter {
           diamond.brand,
           diamond.guaranteedAvailability,
           diamond.availability,
+          derived.colourOrdinal,
+          derived.clarityOrdinal,
+          derived.cutGradeOrdinal,
+          derived.polishOrdinal,
+          derived.symmetryOrdinal,
+          derived.fluorescenceOrdinal,
+          derived.fancyIntensityOrdinal,
+          derived.isFancy,
+          derived.ratio,
+          derived.shapeCode,
+          derived.fluorescenceBucket,
           diamond.type,
           diamond.createdAt,
           diamond.updatedAt,
@@ -230,7 +244,9 @@ class DirectDiamondImporter {
           "countryName", "stateRegion", "stateCode", "stateName", "pairStockRef", "pairSeparable",
           "askingPriceForPair", "askingPricePerCaratForPair", shade, milky, "blackInclusion",
           "eyeClean", "provenanceReport", "provenanceNumber", brand, "guaranteedAvailability",
-          availability, type, "createdAt", "updatedAt", "importJobId"
+          availability, "colourOrdinal", "clarityOrdinal", "cutGradeOrdinal", "polishOrdinal",
+          "symmetryOrdinal", "fluorescenceOrdinal", "fancyIntensityOrdinal", "isFancy", ratio,
+          "shapeCode", "fluorescenceBucket", type, "createdAt", "updatedAt", "importJobId"
         ) VALUES ${placeholders.join(', ')}
         ON CONFLICT ("itemId") DO UPDATE SET
           "totalPrice" = EXCLUDED."totalPrice",